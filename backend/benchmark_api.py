@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест API чата (main.py) на временной SQLite через aiosqlite.
+
+Сравнивает прежнюю схему — синхронная сессия SQLAlchemy и bcrypt прямо
+в обработчике, то есть в цикле событий — с текущей: AsyncSession и
+хеширование в пуле потоков. Смешанная нагрузка (входы и чтение истории
+одновременно) показывает пропускную способность, задержки чтения истории
+и самую долгую остановку цикла событий.
+
+    python benchmark_api.py --requests 300 --logins 20 --rate 100
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Optional
+
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(prefix="chat-benchmark-"), "chat.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DATABASE_PATH}"
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.getcwd())
+
+import httpx
+from fastapi import Depends, HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import selectinload, sessionmaker
+
+import main
+from auth import create_access_token, get_current_user, pwd_context
+from database import SessionLocal
+from models import Chat, Message, MessageFile, User
+
+PASSWORD = "benchmark-password"
+
+legacy_engine = create_engine(f"sqlite:///{DATABASE_PATH}")
+LegacySession = sessionmaker(bind=legacy_engine)
+
+
+async def legacy_login(email: str, password: str):
+    """Прежний вход: синхронный запрос и bcrypt в цикле событий"""
+    with LegacySession() as db:
+        user = db.query(User).filter(User.email == email).first()
+        if not user or not pwd_context.verify(password, user.hashed_password):
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+        return {"id": user.id}
+
+
+async def legacy_messages(
+    chat_id: int, before_id: Optional[int] = None, limit: int = 50, current_user: User = Depends(get_current_user)
+):
+    """Прежнее чтение истории: те же запросы, что в main.get_messages, но синхронной сессией в цикле событий"""
+    with LegacySession() as db:
+        chat = db.query(Chat).filter(
+            Chat.id == chat_id,
+            (Chat.user1_id == current_user.id) | (Chat.user2_id == current_user.id)
+        ).first()
+        if not chat:
+            raise HTTPException(status_code=404, detail="Chat not found")
+        query = db.query(Message).options(selectinload(Message.files)).filter(Message.chat_id == chat_id)
+        if before_id is not None:
+            query = query.filter(Message.id < before_id)
+        messages = query.order_by(Message.id.desc()).limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+    return main.stream_message_page(messages, has_more)
+
+
+main.app.add_api_route("/legacy/auth/login", legacy_login, methods=["POST"])
+main.app.add_api_route("/legacy/chats/{chat_id}/messages", legacy_messages, methods=["GET"])
+
+
+async def seed(message_count):
+    await main.startup()
+    async with SessionLocal() as db:
+        hashed_password = pwd_context.hash(PASSWORD)
+        first = User(email="first@example.com", name="first", hashed_password=hashed_password)
+        second = User(email="second@example.com", name="second", hashed_password=hashed_password)
+        db.add_all([first, second])
+        await db.flush()
+        chat = Chat(user1_id=first.id, user2_id=second.id)
+        db.add(chat)
+        await db.flush()
+        for index in range(message_count):
+            message = Message(chat_id=chat.id, sender_id=first.id, text=f"Сообщение {index}")
+            db.add(message)
+            if index % 10 == 0:
+                await db.flush()
+                db.add(MessageFile(
+                    message_id=message.id, filename="photo.jpg", file_path="media/photo.jpg",
+                    file_size=1024, file_type="image/jpeg"
+                ))
+        await db.commit()
+        return first, chat.id
+
+
+class LoopMonitor:
+    """Самая долгая остановка цикла событий: насколько опоздал периодический таймер"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.max_stall = 0.0
+        self.task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.max_stall = max(self.max_stall, time.perf_counter() - started - self.interval)
+
+    def __enter__(self):
+        self.task = asyncio.ensure_future(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self.task.cancel()
+
+
+async def run_scenario(client, prefix, chat_id, token, requests, logins, rate):
+    """
+    Открытая нагрузка: запросы истории приходят с частотой rate в секунду,
+    входы — равномерно в том же интервале. Задержка считается от назначенного
+    времени запроса, поэтому остановка цикла событий в нее попадает
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time() + 0.05
+    duration = requests / rate
+    latencies = []
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def history(moment):
+        await asyncio.sleep(max(0.0, moment - loop.time()))
+        response = await client.get(f"{prefix}/chats/{chat_id}/messages?limit=50", headers=headers)
+        response.raise_for_status()
+        latencies.append(loop.time() - moment)
+
+    async def login(moment):
+        await asyncio.sleep(max(0.0, moment - loop.time()))
+        response = await client.post(
+            f"{prefix}/auth/login", params={"email": "second@example.com", "password": PASSWORD}
+        )
+        response.raise_for_status()
+
+    tasks = [login(start + duration * index / logins) for index in range(logins)]
+    tasks += [history(start + index / rate) for index in range(requests)]
+    with LoopMonitor() as monitor:
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - start
+    latencies.sort()
+    return {
+        "throughput": len(tasks) / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "stall": monitor.max_stall * 1000,
+    }
+
+
+async def benchmark(options):
+    user, chat_id = await seed(options.messages)
+    token = create_access_token({"sub": str(user.id)})
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        # Прогрев: первое обращение к пулам соединений и потоков
+        await run_scenario(client, "/api", chat_id, token, 5, 1, 50)
+        print(
+            f"Запросов истории: {options.requests}, входов: {options.logins}, "
+            f"частота: {options.rate} запр/с, сообщений в чате: {options.messages}"
+        )
+        for title, prefix in (("Синхронная сессия, bcrypt в цикле", "/legacy"), ("AsyncSession, bcrypt в пуле", "/api")):
+            result = await run_scenario(
+                client, prefix, chat_id, token, options.requests, options.logins, options.rate
+            )
+            print(
+                f"{title}: {result['throughput']:.0f} запр/с, история p50 {result['p50']:.1f} мс, "
+                f"p95 {result['p95']:.1f} мс, остановка цикла до {result['stall']:.1f} мс"
+            )
+    await main.shutdown()
+    legacy_engine.dispose()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API чата: синхронная и асинхронная БД")
+    parser.add_argument("--requests", type=int, default=300, help="Запросов истории сообщений")
+    parser.add_argument("--logins", type=int, default=20, help="Входов (bcrypt) в той же нагрузке")
+    parser.add_argument("--rate", type=float, default=100, help="Запросов истории в секунду")
+    parser.add_argument("--messages", type=int, default=2000, help="Сообщений в тестовом чате")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark(parse_args()))
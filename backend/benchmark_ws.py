@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест websocket_manager.ConnectionManager на имитированных
+соединениях (без сети и БД).
+
+Пользователи открывают по несколько соединений (вкладки), каждый состоит
+в нескольких чатах. Измеряются подключение, рассылка во все чаты (время
+вызова и задержка доставки, в том числе при медленных клиентах, которые
+отправляют кадр дольше WS_SEND_TIMEOUT) и отключение. Для отключения
+приводится и прежняя схема — обход всех соединений и всех чатов.
+
+    python benchmark_ws.py --connections 10000 --devices 2 --chats-per-user 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("WS_SEND_TIMEOUT", "0.5")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from websocket_manager import ConnectionManager
+
+
+class FakeWebSocket:
+    """Соединение, которое принимает кадр за delay секунд и запоминает задержку доставки"""
+
+    def __init__(self, delay, latencies):
+        self.delay = delay
+        self.latencies = latencies
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+            return
+        self.latencies.append(time.perf_counter() - json.loads(text)["sent_at"])
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+class LegacyConnectionManager(ConnectionManager):
+    """Прежнее отключение: обход всех соединений и всех чатов"""
+
+    def disconnect(self, user_id, websocket=None):
+        for socket, connection in list(self.active_connections.items()):
+            if connection.user_id == user_id and (websocket is None or socket is websocket):
+                self.hub.unregister(connection)
+                del self.active_connections[socket]
+        if not self.hub.user_connection_count(user_id):
+            for chat_id in self.chat_users:
+                self.chat_users[chat_id].discard(user_id)
+
+
+def user_chats(user_id, users, chats_per_user):
+    """Чаты пользователя: личные чаты с соседями по кругу (chat_id = номер пары)"""
+    chats = set()
+    for offset in range(1, chats_per_user // 2 + 1):
+        chats.add(user_id * users + (user_id + offset) % users)
+        chats.add(((user_id - offset) % users) * users + user_id)
+    return chats
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(0, int(len(values) * fraction) - 1)] * 1000 if values else 0.0
+
+
+async def run(manager_class, options, measure_broadcast):
+    manager = manager_class()
+    users = options.connections // options.devices
+    latencies = []
+    sockets = []
+
+    started = time.perf_counter()
+    for index in range(users * options.devices):
+        user_id = index % users
+        # Каждое slow_every-е соединение — медленный клиент
+        slow = options.slow_every and index % options.slow_every == 0
+        websocket = FakeWebSocket(options.slow_delay if slow else 0, latencies)
+        await manager.connect(websocket, user_id)
+        sockets.append((user_id, websocket))
+    for user_id in range(users):
+        for chat_id in user_chats(user_id, users, options.chats_per_user):
+            await manager.join_chat(user_id, chat_id)
+    connect_time = time.perf_counter() - started
+
+    result = {"connect": connect_time, "chats": len(manager.chat_users)}
+    if measure_broadcast:
+        chat_ids = list(manager.chat_users)
+        started = time.perf_counter()
+        for chat_id in chat_ids:
+            await manager.send_message_to_chat(chat_id, {"type": "new_message", "sent_at": time.perf_counter()})
+        result["publish"] = time.perf_counter() - started
+        # Ждем, пока быстрые клиенты разберут очереди
+        await asyncio.sleep(options.slow_delay * 2)
+        result["delivered"] = len(latencies)
+        result["p50"] = percentile(latencies, 0.5)
+        result["p95"] = percentile(latencies, 0.95)
+        result["max"] = percentile(latencies, 1.0)
+        result["dropped"] = sum(1 for _, websocket in sockets if websocket.closed_with)
+
+    sample = sockets[:options.sample]
+    started = time.perf_counter()
+    for user_id, websocket in sample:
+        manager.disconnect(user_id, websocket)
+    result["disconnect"] = (time.perf_counter() - started) / max(1, len(sample))
+    # Остальные писатели отменит asyncio.run: у прежней схемы отключение всех
+    # соединений заняло бы минуты
+    return result
+
+
+async def benchmark(options):
+    print(
+        f"Соединений: {options.connections}, устройств на пользователя: {options.devices}, "
+        f"чатов на пользователя: {options.chats_per_user}, медленных: каждое {options.slow_every}-е "
+        f"({options.slow_delay * 1000:.0f} мс на кадр)"
+    )
+    current = await run(ConnectionManager, options, measure_broadcast=True)
+    print(f"Подключение и вход в {current['chats']} чатов: {current['connect'] * 1000:.0f} мс")
+    print(
+        f"Рассылка во все чаты: вызовы {current['publish'] * 1000:.0f} мс, доставлено "
+        f"{current['delivered']} кадров, задержка p50 {current['p50']:.1f} мс, "
+        f"p95 {current['p95']:.1f} мс, max {current['max']:.1f} мс, "
+        f"отключено медленных: {current['dropped']}"
+    )
+    legacy = await run(LegacyConnectionManager, options, measure_broadcast=False)
+    for title, result in (("прежняя схема", legacy), ("индекс пользователь -> чаты", current)):
+        print(
+            f"Отключение ({title}): {result['disconnect'] * 1e6:.0f} мкс на соединение, "
+            f"все соединения ~{result['disconnect'] * options.connections * 1000:.0f} мс"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест менеджера WebSocket-соединений")
+    parser.add_argument("--connections", type=int, default=10000, help="Соединений всего")
+    parser.add_argument("--devices", type=int, default=2, help="Соединений на пользователя")
+    parser.add_argument("--chats-per-user", type=int, default=4, help="Чатов на пользователя (четное)")
+    parser.add_argument("--slow-every", type=int, default=100, help="Каждое N-е соединение медленное (0 — нет)")
+    parser.add_argument("--slow-delay", type=float, default=1.0, help="Отправка кадра медленным клиентом, сек")
+    parser.add_argument("--sample", type=int, default=500, help="Отключений для замера времени")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark(parse_args()))
@@ -0,0 +1,131 @@
+"""
+Длительность и огибающая (waveform) голосовых сообщений.
+
+analyze_audio() выполняется в пуле процессов (users.media_pool), поэтому
+модуль не зависит от Django. WAV читается стандартным модулем wave,
+остальные форматы (webm/opus, ogg, m4a, mp3 из браузеров и приложений)
+декодирует ffmpeg в моно PCM 8 кГц.
+
+Звук читается блоками: от каждых 10 мс остается только максимум
+амплитуды, поэтому память не зависит от длины записи. В конце максимумы
+сводятся к PEAK_COUNT столбцам векторно (numpy.maximum.reduceat).
+"""
+import subprocess
+import wave
+
+import numpy as np
+
+PEAK_COUNT = 64
+# Столбец огибающей — целое 0..PEAK_SCALE, громкий участок — PEAK_SCALE
+PEAK_SCALE = 100
+DECODE_SAMPLE_RATE = 8000
+BLOCK_SECONDS = 0.01
+READ_SAMPLES = 64 * 1024
+
+_SAMPLE_TYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+class AudioDecodeError(Exception):
+    """Файл не декодируется (нет ffmpeg или это не аудио)"""
+
+
+def _block_maxima(chunks, sample_rate):
+    """Максимумы |амплитуды| по блокам BLOCK_SECONDS и число сэмплов"""
+    block = max(1, int(sample_rate * BLOCK_SECONDS))
+    maxima = []
+    carry = np.zeros(0, dtype=np.float32)
+    total = 0
+    for samples in chunks:
+        total += len(samples)
+        samples = np.concatenate((carry, np.abs(samples, dtype=np.float32)))
+        whole = len(samples) - len(samples) % block
+        if whole:
+            maxima.append(samples[:whole].reshape(-1, block).max(axis=1))
+        carry = samples[whole:]
+    if len(carry):
+        maxima.append(carry.max(keepdims=True))
+    if not maxima:
+        return np.zeros(0, dtype=np.float32), 0
+    return np.concatenate(maxima), total
+
+
+def _wav_chunks(audio):
+    """Сэмплы WAV блоками, каналы сведены в моно, значения со знаком"""
+    width = audio.getsampwidth()
+    channels = audio.getnchannels()
+    if width not in _SAMPLE_TYPES:
+        raise AudioDecodeError(f'Неподдерживаемая разрядность WAV: {width * 8} бит')
+    while True:
+        frames = audio.readframes(READ_SAMPLES)
+        if not frames:
+            break
+        samples = np.frombuffer(frames, dtype=_SAMPLE_TYPES[width]).astype(np.float32)
+        if width == 1:
+            samples -= 128
+        if channels > 1:
+            samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+        yield samples
+
+
+def _ffmpeg_chunks(process):
+    while True:
+        data = process.stdout.read(READ_SAMPLES * 2)
+        if not data:
+            break
+        if len(data) % 2:
+            data += process.stdout.read(1)
+        yield np.frombuffer(data, dtype=np.int16)
+
+
+def _decode_maxima(path):
+    try:
+        with wave.open(path, 'rb') as audio:
+            sample_rate = audio.getframerate()
+            maxima, samples = _block_maxima(_wav_chunks(audio), sample_rate)
+            return maxima, samples / float(sample_rate)
+    except (wave.Error, EOFError):
+        pass
+
+    command = [
+        'ffmpeg', '-v', 'error', '-nostdin', '-i', path,
+        '-ac', '1', '-ar', str(DECODE_SAMPLE_RATE), '-f', 's16le', '-',
+    ]
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        raise AudioDecodeError('ffmpeg не установлен')
+    try:
+        maxima, samples = _block_maxima(_ffmpeg_chunks(process), DECODE_SAMPLE_RATE)
+    finally:
+        process.stdout.close()
+        code = process.wait()
+    if code != 0 or not samples:
+        raise AudioDecodeError('ffmpeg не смог декодировать файл')
+    return maxima, samples / float(DECODE_SAMPLE_RATE)
+
+
+def downsample_peaks(maxima, count=PEAK_COUNT):
+    """PEAK_COUNT столбцов: максимум по равным отрезкам, нормировка к PEAK_SCALE"""
+    if not len(maxima):
+        return []
+    starts = np.linspace(0, len(maxima), count, endpoint=False).astype(np.intp)
+    peaks = np.maximum.reduceat(maxima, starts)
+    loudest = peaks.max()
+    if loudest <= 0:
+        return [0] * count
+    return np.rint(peaks / loudest * PEAK_SCALE).astype(int).tolist()
+
+
+def analyze_audio(path, count=PEAK_COUNT):
+    """
+    {'duration': секунды, 'peaks': [0..PEAK_SCALE] * count} или None,
+    если файл не декодируется
+    """
+    try:
+        maxima, duration = _decode_maxima(path)
+    except AudioDecodeError:
+        return None
+    return {
+        'duration': round(duration, 2),
+        'peaks': downsample_peaks(maxima, count),
+    }
@@ -0,0 +1,388 @@
+"""
+Локальный брокер channel layer поверх Unix-сокета.
+
+Заменяет Redis там, где его нет (разработка, тесты, нагрузочный прогон):
+несколько ASGI-воркеров подключаются к одному процессу брокера
+(manage.py run_channel_broker) и получают общие группы.
+
+Протокол: кадры «4 байта длины + msgpack». Запросы несут id,
+ответы приходят с тем же id; receive — долгий запрос, брокер отвечает,
+когда в канале появится сообщение.
+
+Членство в группах истекает через group_expiry секунд (как в channels_redis),
+сообщения в очереди канала — через expiry секунд.
+Каналы воркера удаляются вместе с членствами, когда у его процесса не остается
+ни одного соединения дольше client_grace секунд (временные loop async_to_sync
+переподключаются, поэтому сразу удалять нельзя).
+"""
+import asyncio
+import itertools
+import os
+import random
+import string
+import struct
+import time
+import uuid
+import weakref
+from collections import deque
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+FRAME_HEADER = struct.Struct('!I')
+
+DEFAULT_SOCKET_PATH = '/tmp/bebyblog-channels.sock'
+
+
+def pack_frame(payload):
+    body = msgpack.packb(payload, use_bin_type=True)
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    return msgpack.unpackb(await reader.readexactly(length), raw=False)
+
+
+class ChannelBroker:
+    """Процесс-брокер: очереди каналов, группы и ожидающие receive"""
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH, capacity=100, expiry=60, group_expiry=86400, client_grace=30):
+        self.path = path
+        self.capacity = capacity
+        self.expiry = expiry
+        self.group_expiry = group_expiry
+        self.client_grace = client_grace
+        self.queues = {}        # канал -> deque[(expires_at, message)]
+        self.waiters = {}       # канал -> deque[(writer, request_id)]
+        self.groups = {}        # группа -> {канал: expires_at}
+        self.clients = {}       # префикс процесса-воркера -> число открытых соединений
+
+    async def serve_forever(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self.handle_client, path=self.path)
+        os.chmod(self.path, 0o660)
+        sweeper = asyncio.ensure_future(self.sweep_forever())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    async def handle_client(self, reader, writer):
+        client = None
+        try:
+            hello = await read_frame(reader)
+            client = hello['client']
+            self.clients[client] = self.clients.get(client, 0) + 1
+            while True:
+                request = await read_frame(reader)
+                self.dispatch(writer, request)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            if client is not None:
+                self.clients[client] -= 1
+                if not self.clients[client]:
+                    asyncio.get_running_loop().call_later(self.client_grace, self.drop_client, client)
+
+    def dispatch(self, writer, request):
+        op = request.get('op')
+        request_id = request.get('id')
+        channel = request.get('channel')
+
+        if op == 'send':
+            delivered = self.deliver(channel, request['message'])
+            self.reply(writer, request_id, {'ok': delivered})
+        elif op == 'receive':
+            self.receive(writer, request_id, channel)
+        elif op == 'cancel':
+            waiters = self.waiters.get(channel)
+            if waiters:
+                self.waiters[channel] = deque(
+                    waiter for waiter in waiters if waiter != (writer, request['receive_id'])
+                )
+        elif op == 'group_add':
+            self.groups.setdefault(request['group'], {})[channel] = time.time() + self.group_expiry
+            self.reply(writer, request_id, {'ok': True})
+        elif op == 'group_discard':
+            members = self.groups.get(request['group'])
+            if members is not None:
+                members.pop(channel, None)
+                if not members:
+                    del self.groups[request['group']]
+            self.reply(writer, request_id, {'ok': True})
+        elif op == 'group_send':
+            self.group_send(request['group'], request['message'])
+            self.reply(writer, request_id, {'ok': True})
+        elif op == 'flush':
+            self.queues.clear()
+            self.groups.clear()
+            self.reply(writer, request_id, {'ok': True})
+        else:
+            self.reply(writer, request_id, {'error': f'unknown op {op}'})
+
+    def reply(self, writer, request_id, payload):
+        if writer.is_closing():
+            return
+        payload['id'] = request_id
+        writer.write(pack_frame(payload))
+
+    def deliver(self, channel, message):
+        """Отдает сообщение ожидающему receive или кладет в очередь"""
+        waiters = self.waiters.get(channel)
+        while waiters:
+            writer, request_id = waiters.popleft()
+            if not writer.is_closing():
+                self.reply(writer, request_id, {'message': message})
+                return True
+
+        queue = self.queues.setdefault(channel, deque())
+        now = time.time()
+        while queue and queue[0][0] < now:
+            queue.popleft()
+        if len(queue) >= self.capacity:
+            return False
+        queue.append((now + self.expiry, message))
+        return True
+
+    def receive(self, writer, request_id, channel):
+        queue = self.queues.get(channel)
+        now = time.time()
+        while queue:
+            expires_at, message = queue.popleft()
+            if expires_at >= now:
+                self.reply(writer, request_id, {'message': message})
+                return
+        self.waiters.setdefault(channel, deque()).append((writer, request_id))
+
+    def group_send(self, group, message):
+        members = self.groups.get(group)
+        if not members:
+            return
+        now = time.time()
+        for channel, expires_at in list(members.items()):
+            if expires_at < now:
+                del members[channel]
+                continue
+            # Переполненный канал пропускается, как в других channel layer
+            self.deliver(channel, message)
+
+    def drop_client(self, client):
+        """Удаляет каналы и членства воркера, который так и не переподключился"""
+        if self.clients.get(client):
+            return
+        self.clients.pop(client, None)
+        marker = f'{client}!'
+
+        for channels in (self.queues, self.waiters):
+            for channel in [channel for channel in channels if marker in channel]:
+                del channels[channel]
+        for group in list(self.groups):
+            members = self.groups[group]
+            for channel in [channel for channel in members if marker in channel]:
+                del members[channel]
+            if not members:
+                del self.groups[group]
+
+    async def sweep_forever(self, interval=30):
+        """Периодически убирает просроченные членства и сообщения"""
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            for group in list(self.groups):
+                members = self.groups[group]
+                for channel, expires_at in list(members.items()):
+                    if expires_at < now:
+                        del members[channel]
+                if not members:
+                    del self.groups[group]
+            for channel in list(self.queues):
+                queue = self.queues[channel]
+                while queue and queue[0][0] < now:
+                    queue.popleft()
+                if not queue:
+                    del self.queues[channel]
+
+
+class BrokerConnection:
+    """Соединение воркера с брокером в рамках одного event loop"""
+
+    def __init__(self, path, client, on_orphan):
+        self.path = path
+        self.client = client
+        self.on_orphan = on_orphan
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.cancelled = {}
+        self.write_lock = asyncio.Lock()
+        self.reader = self.writer = self.reader_task = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+        self.writer.write(pack_frame({'op': 'hello', 'client': self.client}))
+        self.reader_task = asyncio.ensure_future(self.read_loop())
+
+    async def read_loop(self):
+        try:
+            while True:
+                response = await read_frame(self.reader)
+                request_id = response.get('id')
+                future = self.pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+                elif request_id in self.cancelled and 'message' in response:
+                    # Сообщение пришло на уже отмененный receive — не теряем его
+                    self.on_orphan(self.cancelled.pop(request_id), response['message'])
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f'Брокер каналов недоступен: {e}'))
+            self.pending.clear()
+
+    async def write(self, payload):
+        async with self.write_lock:
+            self.writer.write(pack_frame(payload))
+            await self.writer.drain()
+
+    async def request(self, op, **payload):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        await self.write({'op': op, 'id': request_id, **payload})
+        response = await future
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+    async def receive(self, channel):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        await self.write({'op': 'receive', 'id': request_id, 'channel': channel})
+        try:
+            response = await future
+        except asyncio.CancelledError:
+            self.pending.pop(request_id, None)
+            self.cancelled[request_id] = channel
+            if not self.writer.is_closing():
+                self.writer.write(pack_frame({'op': 'cancel', 'channel': channel, 'receive_id': request_id}))
+            raise
+        return response['message']
+
+    @property
+    def closed(self):
+        return self.writer is None or self.writer.is_closing() or self.reader_task.done()
+
+    async def close(self):
+        if self.reader_task:
+            self.reader_task.cancel()
+        if self.writer:
+            self.writer.close()
+
+
+class UnixSocketChannelLayer(BaseChannelLayer):
+    """
+    Channel layer, работающий через ChannelBroker.
+    Подключение: CHANNEL_LAYERS['default'] = {
+        'BACKEND': 'core.channel_broker.UnixSocketChannelLayer',
+        'CONFIG': {'path': '/tmp/bebyblog-channels.sock', 'group_expiry': 86400},
+    }
+    Параметры capacity/expiry/group_expiry задаются при запуске брокера.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.path = path
+        self.group_expiry = group_expiry
+        self.client_prefix = uuid.uuid4().hex
+        self.connections = weakref.WeakKeyDictionary()
+        self.buffers = {}
+
+    async def connection(self):
+        """Соединение текущего event loop (async_to_sync создает свои loop)"""
+        loop = asyncio.get_running_loop()
+        connection = self.connections.get(loop)
+        if connection is None or connection.closed:
+            connection = BrokerConnection(self.path, self.client_prefix, self.buffer_orphan)
+            await connection.connect()
+            self.connections[loop] = connection
+            self.wrap_loop_close(loop)
+        return connection
+
+    def wrap_loop_close(self, loop):
+        """Закрывает соединение вместе с временным loop (как channels_redis)"""
+        if getattr(loop, '_channel_broker_wrapped', False):
+            return
+        original_close = loop.close
+
+        def close():
+            connection = self.connections.pop(loop, None)
+            if connection is not None and not loop.is_running():
+                loop.run_until_complete(connection.close())
+            return original_close()
+
+        loop.close = close
+        loop._channel_broker_wrapped = True
+
+    def buffer_orphan(self, channel, message):
+        self.buffers.setdefault(channel, deque()).append(message)
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        connection = await self.connection()
+        response = await connection.request('send', channel=channel, message=message)
+        if not response['ok']:
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        buffered = self.buffers.get(channel)
+        if buffered:
+            message = buffered.popleft()
+            if not buffered:
+                del self.buffers[channel]
+            return message
+        connection = await self.connection()
+        return await connection.receive(channel)
+
+    async def new_channel(self, prefix='specific.'):
+        suffix = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+        return f"{prefix}{self.client_prefix}!{suffix}"
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        connection = await self.connection()
+        await connection.request('group_add', group=group, channel=channel)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        connection = await self.connection()
+        await connection.request('group_discard', group=group, channel=channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_group_name(group), 'Group name not valid'
+        connection = await self.connection()
+        await connection.request('group_send', group=group, message=message)
+
+    async def flush(self):
+        self.buffers.clear()
+        connection = await self.connection()
+        await connection.request('flush')
+
+    async def close(self):
+        for connection in list(self.connections.values()):
+            await connection.close()
+        self.connections.clear()
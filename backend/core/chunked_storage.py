@@ -0,0 +1,83 @@
+"""
+Потоковая запись загрузок на диск с постоянным расходом памяти.
+
+Тело запроса копируется в файл блоками по COPY_BUFFER_SIZE, и тут же
+обновляется SHA-256: файл целиком в память не читается ни при загрузке,
+ни при подсчете хэша. Готовый файл переносится в MEDIA_ROOT через
+os.replace — временный каталог лежит на той же файловой системе, поэтому
+перенос атомарный и недокачанный файл никогда не виден по своему пути.
+
+Модуль не зависит от Django: его используют и users.chunked_uploads,
+и FastAPI (main.py).
+"""
+import hashlib
+import os
+import re
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+_extension_re = re.compile(r'^\.[a-z0-9]{1,10}$')
+
+
+def safe_extension(filename):
+    """Расширение исходного имени, если оно безопасно для пути (иначе пустая строка)"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    return extension if _extension_re.match(extension) else ''
+
+
+def append_chunk(path, offset, stream, length, hasher=None):
+    """
+    Пишет в файл path с позиции offset не больше length байт из stream
+    (объект с read(n)). Байты после offset, оставшиеся от оборванного
+    запроса, отбрасываются. Возвращает число записанных байт: при обрыве
+    соединения оно меньше length, и догрузка продолжится с нового offset.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    mode = 'r+b' if os.path.exists(path) else 'wb'
+    written = 0
+    with open(path, mode) as f:
+        f.truncate(offset)
+        f.seek(offset)
+        while written < length:
+            block = stream.read(min(COPY_BUFFER_SIZE, length - written))
+            if not block:
+                break
+            f.write(block)
+            if hasher is not None:
+                hasher.update(block)
+            written += len(block)
+        f.flush()
+        # Смещение сохраняется в БД только после того, как байты на диске
+        os.fsync(f.fileno())
+    return written
+
+
+def hash_file(path, length=None):
+    """SHA-256 первых length байт файла (всего файла, если length не задан)"""
+    hasher = hashlib.sha256()
+    remaining = length
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            size = COPY_BUFFER_SIZE if remaining is None else min(COPY_BUFFER_SIZE, remaining)
+            block = f.read(size)
+            if not block:
+                break
+            hasher.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return hasher
+
+
+def move_into_place(src, media_root, name):
+    """Атомарно переносит готовый файл в media_root/name"""
+    destination = os.path.join(media_root, name)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    os.replace(src, destination)
+    return destination
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
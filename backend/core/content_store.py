@@ -0,0 +1,89 @@
+"""
+Файлы, адресуемые по содержимому.
+
+Путь файла вычисляется из его SHA-256: blobs/ab/<sha256>.<ext>. Одинаковые
+файлы (пересланный мем, одна и та же фотография) занимают на диске одно
+место, а повторная загрузка сводится к подсчету хэша — запись в MEDIA_ROOT
+не нужна, если такой файл уже есть.
+
+Модуль не зависит от Django: его используют users.media_store и FastAPI
+(main.py). Учет ссылок и метаданные в БД — в users.media_store.
+"""
+import hashlib
+import os
+import uuid
+import wave
+
+from core.chunked_storage import move_into_place, remove_quietly, safe_extension
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow нужен только для размеров изображений
+    Image = None
+
+BLOB_DIRECTORY = 'blobs'
+
+
+def blob_name(digest, filename=''):
+    """Путь файла относительно MEDIA_ROOT; первые два символа хэша — подкаталог"""
+    return f"{BLOB_DIRECTORY}/{digest[:2]}/{digest}{safe_extension(filename)}"
+
+
+def temp_directory(media_root):
+    """Каталог недописанных файлов: на той же файловой системе, что и готовые"""
+    return os.path.join(media_root, BLOB_DIRECTORY, 'tmp')
+
+
+def write_temp(chunks, media_root):
+    """
+    Пишет блоки из chunks во временный файл, по ходу считая SHA-256.
+    Возвращает (путь временного файла, хэш, размер).
+    """
+    directory = temp_directory(media_root)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, 'wb') as f:
+            for block in chunks:
+                f.write(block)
+                hasher.update(block)
+                size += len(block)
+    except Exception:
+        remove_quietly(path)
+        raise
+    return path, hasher.hexdigest(), size
+
+
+def commit_blob(temp_path, media_root, name):
+    """
+    Переносит временный файл на место name. Если файл с таким содержимым
+    уже есть, временный удаляется. Возвращает True, если файл записан.
+    """
+    if os.path.exists(os.path.join(media_root, name)):
+        remove_quietly(temp_path)
+        return False
+    move_into_place(temp_path, media_root, name)
+    return True
+
+
+def probe_media(path, content_type=''):
+    """
+    Метаданные файла без чтения целиком: размеры изображения (только
+    заголовок, через Pillow) и длительность WAV. Остальное — None.
+    """
+    meta = {'width': None, 'height': None, 'duration': None}
+    if content_type.startswith('image/') and Image is not None:
+        try:
+            with Image.open(path) as image:
+                meta['width'], meta['height'] = image.size
+        except Exception:
+            pass
+    elif content_type in ('audio/wav', 'audio/x-wav', 'audio/wave'):
+        try:
+            with wave.open(path, 'rb') as audio:
+                meta['duration'] = audio.getnframes() / float(audio.getframerate())
+        except Exception:
+            pass
+    return meta
@@ -0,0 +1,65 @@
+"""
+Запуск Daphne с permessage-deflate для компактного протокола WebSocket.
+
+Daphne не включает сжатие WebSocket, а ASGI не дает приложению участвовать
+в согласовании расширений. Расширение выбирается в autobahn уже после того,
+как консьюмер принял подпротокол, поэтому сжатие включается только для
+соединений users.compact_protocol: JSON-клиенты работают как раньше и не
+тратят процессор и память на deflate.
+
+Окно и уровень памяти zlib уменьшены: события чата — сотни байт, а контекст
+сжатия держится на все время соединения.
+
+Запуск — как daphne, с теми же аргументами:
+    python -m core.daphne_server --bind 0.0.0.0 --port 8000 core.asgi:application
+"""
+from daphne.cli import CommandLineInterface
+from daphne.server import Server
+from daphne.ws_protocol import WebSocketProtocol
+
+from autobahn.websocket.compress import PerMessageDeflateOffer, PerMessageDeflateOfferAccept
+from twisted.internet import reactor
+
+from users.compact_protocol import COMPACT_SUBPROTOCOL
+
+DEFLATE_WINDOW_BITS = 12
+DEFLATE_MEM_LEVEL = 5
+
+
+class DeflateWebSocketProtocol(WebSocketProtocol):
+    """Принимает permessage-deflate, если выбран компактный подпротокол"""
+
+    def succeedHandshake(self, res):
+        self.perMessageCompressionAccept = self.accept_compression
+        return super().succeedHandshake(res)
+
+    def accept_compression(self, offers):
+        if self.websocket_protocol_in_use != COMPACT_SUBPROTOCOL:
+            return None
+        for offer in offers:
+            if isinstance(offer, PerMessageDeflateOffer):
+                window_bits = DEFLATE_WINDOW_BITS
+                if offer.request_max_window_bits:
+                    window_bits = min(window_bits, offer.request_max_window_bits)
+                return PerMessageDeflateOfferAccept(
+                    offer, window_bits=window_bits, mem_level=DEFLATE_MEM_LEVEL
+                )
+        return None
+
+
+class DeflateServer(Server):
+    def run(self):
+        # Фабрика WebSocket создается внутри Server.run, до запуска reactor
+        reactor.callWhenRunning(self.use_deflate_protocol)
+        super().run()
+
+    def use_deflate_protocol(self):
+        self.ws_factory.protocol = DeflateWebSocketProtocol
+
+
+class DeflateCommandLineInterface(CommandLineInterface):
+    server_class = DeflateServer
+
+
+if __name__ == '__main__':
+    DeflateCommandLineInterface.entrypoint()
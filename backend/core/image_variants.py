@@ -0,0 +1,90 @@
+"""
+Уменьшенные копии изображений (превью аватаров и картинок чата).
+
+render_variants() выполняется в отдельном процессе (ProcessPoolExecutor
+в users.media_pool): декодирование и сжатие больших фотографий не
+занимают GIL веб-воркера. Поэтому модуль не зависит от Django, а функция
+принимает и возвращает только простые значения.
+
+Копия кладется рядом с оригиналом: blobs/ab/<sha256>_<размер>.webp —
+содержимое оригинала определяет и имена его производных.
+"""
+import os
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # без Pillow превью не строятся, отдаются оригиналы
+    Image = None
+
+# Размер -> (сторона в пикселях, режим): crop — квадрат по центру
+# (аватары), fit — вписать в квадрат с сохранением пропорций (картинки)
+VARIANT_SPECS = {
+    's96': (96, 'crop'),
+    's192': (192, 'crop'),
+    'w480': (480, 'fit'),
+    'w1280': (1280, 'fit'),
+}
+
+FORMAT_EXTENSIONS = {
+    'WEBP': '.webp',
+    'AVIF': '.avif',
+}
+
+# MIME-типы производных (в mimetypes Python 3.8 их нет)
+EXTENSION_CONTENT_TYPES = {
+    '.webp': 'image/webp',
+    '.avif': 'image/avif',
+}
+
+
+def variant_name(name, size, image_format='WEBP'):
+    """Имя производной рядом с оригиналом: blobs/ab/<sha256>_s96.webp"""
+    base = os.path.splitext(name)[0]
+    return f"{base}_{size}{FORMAT_EXTENSIONS[image_format]}"
+
+
+def _prepare(image):
+    # Поворот по EXIF и режим, который понимают WebP/AVIF
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        return image.convert('RGBA')
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def render_variants(media_root, name, specs=None, image_format='WEBP', quality=80):
+    """
+    Строит производные изображения media_root/name. Копия в режиме fit не
+    делается, если оригинал и так меньше: клиент получит оригинал.
+    Возвращает {размер: имя файла относительно media_root}; для файлов,
+    которые не открываются как изображение, — пустой словарь.
+    """
+    if Image is None:
+        return {}
+    specs = specs or VARIANT_SPECS
+    variants = {}
+    try:
+        with Image.open(os.path.join(media_root, name)) as source:
+            original_size = source.size
+            largest = max(side for side, _ in specs.values())
+            # JPEG декодируется сразу в уменьшенном масштабе (в 2-8 раз быстрее)
+            source.draft('RGB', (largest * 2, largest * 2))
+            image = _prepare(source)
+            for size, (side, mode) in specs.items():
+                if mode == 'fit':
+                    if max(original_size) <= side:
+                        continue
+                    variant = image.copy()
+                    variant.thumbnail((side, side), Image.LANCZOS)
+                else:
+                    variant = ImageOps.fit(image, (side, side), Image.LANCZOS)
+                output = variant_name(name, size, image_format)
+                temp_path = os.path.join(media_root, f"{output}.part")
+                variant.save(temp_path, image_format, quality=quality)
+                os.replace(temp_path, os.path.join(media_root, output))
+                variants[size] = output
+    except Exception:
+        # Битый файл или не изображение: производных нет
+        return {}
+    return variants
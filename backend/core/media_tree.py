@@ -0,0 +1,59 @@
+"""
+Обход каталога медиафайлов и сравнение с отсортированным списком ссылок.
+
+walk_files() выдает файлы по возрастанию пути (порядок кодовых точек, как
+при сравнении строк в Python и бинарной сортировке в БД), держа в памяти
+только листинги каталогов текущего пути. unreferenced() сливает этот поток
+с отсортированным потоком имен из БД за один проход: ни дерево, ни набор
+ссылок целиком в память не загружаются.
+
+Модуль не зависит от Django (users.media_gc, manage.py gc_media).
+"""
+import os
+
+
+def walk_files(root, skip=()):
+    """
+    (путь относительно root через '/', размер, mtime) всех файлов по
+    возрастанию пути. skip — относительные пути каталогов, которые не обходятся
+    """
+    yield from _walk(root, '', frozenset(skip))
+
+
+def _walk(root, prefix, skip):
+    try:
+        with os.scandir(os.path.join(root, prefix)) as entries:
+            # Каталог сортируется как 'имя/': в полном пути за ним идет '/',
+            # поэтому 'a.txt' < 'a/b' < 'ab'
+            listing = sorted(
+                (entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name, entry)
+                for entry in entries
+            )
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for key, entry in listing:
+        path = prefix + entry.name
+        if key.endswith('/'):
+            if path not in skip:
+                yield from _walk(root, f"{path}/", skip)
+        elif entry.is_file(follow_symlinks=False):
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            yield path, stat.st_size, stat.st_mtime
+
+
+def unreferenced(files, references):
+    """
+    Файлы из files (кортежи, путь — первый элемент), которых нет в references.
+    Оба потока упорядочены по возрастанию пути; повторы в references допустимы
+    """
+    references = iter(references)
+    current = next(references, None)
+    for file in files:
+        path = file[0]
+        while current is not None and current < path:
+            current = next(references, None)
+        if current != path:
+            yield file
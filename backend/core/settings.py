@@ -203,6 +203,9 @@ AUTH_USER_MODEL = 'users.User'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Публичный адрес сайта для абсолютных ссылок вне HTTP-запроса (WebSocket, фоновые задачи)
+SITE_URL = os.environ.get('SITE_URL', 'http://93.183.80.220')
+
 # Static files
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
@@ -273,8 +276,112 @@ SIMPLE_JWT = {
 }
 
 # Channels settings
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+# Членство в группах channel layer истекает через столько секунд
+# (соединения ChatConsumer продлевают его, пока открыты)
+CHANNEL_GROUP_EXPIRY = int(os.environ.get('CHANNEL_GROUP_EXPIRY', 86400))
+CHANNEL_GROUP_REFRESH_INTERVAL = CHANNEL_GROUP_EXPIRY // 2
+
+# InMemoryChannelLayer работает только внутри одного процесса. Для нескольких
+# воркеров без Redis: manage.py run_channel_broker и CHANNEL_BROKER_SOCKET
+CHANNEL_BROKER_SOCKET = os.environ.get('CHANNEL_BROKER_SOCKET')
+if CHANNEL_BROKER_SOCKET:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'core.channel_broker.UnixSocketChannelLayer',
+            'CONFIG': {
+                'path': CHANNEL_BROKER_SOCKET,
+                'group_expiry': CHANNEL_GROUP_EXPIRY,
+            }
+        }
     }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CONFIG': {
+                'group_expiry': CHANNEL_GROUP_EXPIRY,
+            }
+        }
+    }
+
+# Хранение уведомлений: срок жизни по типам (дни) и параметры порционной очистки
+# (manage.py purge_notifications)
+NOTIFICATION_RETENTION_DAYS = {
+    'follow': 180,
+    'message': 30,
+    'like': 90,
+    'comment': 180,
 }
+NOTIFICATION_PURGE_BATCH_SIZE = 1000
+NOTIFICATION_PURGE_PAUSE = 0.1
+
+# Задержка (сек), за которую копятся отметки о прочтении из WebSocket перед записью курсора
+CHAT_READ_RECEIPT_DELAY = 1.0
+
+# Групповая запись сообщений из WebSocket: ожидание попутных сообщений (сек) и размер пачки
+CHAT_WRITE_BATCH_DELAY = 0.005
+CHAT_WRITE_BATCH_SIZE = 100
+
+# Присутствие (users.presence): срок жизни онлайн-статуса в кэше, период пакетного
+# продления, задержка перед объявлением офлайн и период записи User.last_seen (сек)
+PRESENCE_TTL = 60
+PRESENCE_HEARTBEAT_INTERVAL = 20
+PRESENCE_OFFLINE_GRACE = 10
+PRESENCE_LAST_SEEN_FLUSH_INTERVAL = 60
+
+# Догрузка после переподключения (users.chat_replay): сколько последних сообщений
+# чата хранится в кэше (одним ключом на чат) и сколько секунд
+CHAT_REPLAY_BUFFER_SIZE = 100
+CHAT_REPLAY_TTL = 3600
+
+# Загрузка файлов частями (users.chunked_uploads): каталог недокачанных файлов (на той же
+# файловой системе, что MEDIA_ROOT), предельный размер файла и части (байт) и срок жизни
+# брошенных загрузок (часы, manage.py purge_chunked_uploads)
+CHUNKED_UPLOAD_DIR = os.path.join(MEDIA_ROOT, 'uploads_tmp')
+CHUNKED_UPLOAD_MAX_SIZE = 200 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_CHUNK = 8 * 1024 * 1024
+CHUNKED_UPLOAD_EXPIRY_HOURS = 24
+
+# Хранилище вложений и аватаров по содержимому (users.media_store): файл без
+# ссылок удаляется manage.py media_blobs не раньше чем через столько часов
+MEDIA_BLOB_GRACE_HOURS = 24
+
+# Выдача файлов хранилища (users.media_views): адрес, префикс внутреннего location nginx
+# для X-Accel-Redirect (пусто — файл отдает Django, только для разработки) и срок кэша (сек)
+MEDIA_PROTECTED_URL = '/api/auth/media/'
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', '')
+MEDIA_CACHE_SECONDS = 365 * 24 * 3600
+# Срок действия подписанной ссылки на вложение чата (сек, users.media_access)
+CHAT_MEDIA_URL_MAX_AGE = 24 * 3600
+
+# Сборка мусора в MEDIA_ROOT (manage.py gc_media): куда переносятся файлы с --quarantine
+# и БД FastAPI (main.py, его DATABASE_URL): FastAPI пишет в тот же каталог, поэтому
+# без нее gc_media не запускается (кроме явного --without-fastapi)
+MEDIA_GC_QUARANTINE_DIR = os.path.join(BASE_DIR, 'media_quarantine')
+MEDIA_GC_FASTAPI_DATABASE_URL = os.environ.get('FASTAPI_DATABASE_URL', '')
+
+# Пул обработки медиафайлов (users.media_pool): процессов и заданий в очереди
+# (остальное подбирают build_media_variants и analyze_voice_messages)
+MEDIA_WORKERS = 2
+MEDIA_WORKER_QUEUE = 32
+
+# Превью изображений (users.media_variants): формат (WEBP или AVIF) и качество
+MEDIA_VARIANT_FORMAT = 'WEBP'
+MEDIA_VARIANT_QUALITY = 80
+
+# Карточки пользователей (users.user_cards): срок жизни карточки в кэше (сек); при
+# изменении профиля карточка инвалидируется сменой версии
+USER_CARD_CACHE_TIMEOUT = 3600
+
+# Индикатор печати (users.typing_indicators): пересылка в группу не чаще раза в интервал
+# и автоматическая остановка без событий от клиента (сек). Клиент скрывает индикатор через 3 с
+TYPING_FORWARD_INTERVAL = 2.0
+TYPING_IDLE_TIMEOUT = 3.0
+
+# Рассылка по WebSocket (core.ws_fanout): очередь исходящих кадров соединения, время на
+# отправку кадра (сек), политика для медленных клиентов (disconnect, drop_oldest, drop_newest)
+# и лимит одновременных соединений пользователя
+WS_SEND_QUEUE_SIZE = 256
+WS_SEND_TIMEOUT = 5.0
+WS_SLOW_CONSUMER_POLICY = 'disconnect'
+WS_MAX_CONNECTIONS_PER_USER = 5
@@ -55,6 +55,25 @@ except Exception:
         }
     }
 
+# Channel layer: Redis (channels-redis) общий для всех воркеров daphne и узлов.
+# Без пакета — локальный брокер по Unix-сокету, если он задан, иначе память процесса
+try:
+    import channels_redis  # type: ignore  # noqa: F401
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [os.environ.get('CHANNEL_REDIS_URL', os.environ.get('REDIS_URL', 'redis://redis:6379/0'))],
+                'group_expiry': CHANNEL_GROUP_EXPIRY,
+                'capacity': int(os.environ.get('CHANNEL_CAPACITY', 1000)),
+                'expiry': 60,
+                'prefix': 'bebyblog',
+            }
+        }
+    }
+except Exception:
+    pass
+
 # CORS настройки
 CORS_ALLOWED_ORIGINS = [
     "http://93.183.80.220",
@@ -0,0 +1,192 @@
+"""
+Рассылка по WebSocket-соединениям без ожидания медленных клиентов.
+
+Сообщение сериализуется один раз, а текст кладется в ограниченные очереди
+соединений. Каждую очередь разбирает своя задача-писатель, поэтому рассылка
+в комнату — это только постановка в очереди, и ее время не зависит от того,
+как быстро читают клиенты.
+
+Медленный клиент — тот, у кого очередь заполнена или отправка одного кадра
+дольше send_timeout. С ним поступают по политике:
+- disconnect — закрыть соединение (клиент переподключится и догрузит историю);
+- drop_oldest — выбросить самое старое сообщение из очереди;
+- drop_newest — не ставить новое сообщение.
+
+Число соединений одного пользователя ограничено: при превышении закрывается
+самое старое.
+
+Модуль не зависит от Django: его используют и users.websocket_pool (Channels),
+и websocket_manager (FastAPI). Текстовый кадр WebSocket в ASGI — str, поэтому
+сообщение сериализуется один раз в строку, а не в байты.
+"""
+import asyncio
+import json
+from collections import OrderedDict
+
+POLICY_DISCONNECT = 'disconnect'
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_DROP_NEWEST = 'drop_newest'
+
+# Коды закрытия: 1013 — «повторите позже» (медленный клиент),
+# 1008 — нарушение политики (превышен лимит соединений)
+SLOW_CONSUMER_CLOSE_CODE = 1013
+CONNECTION_LIMIT_CLOSE_CODE = 1008
+
+_CLOSE = object()
+
+
+def encode_message(message):
+    """Единственная сериализация сообщения для всех получателей"""
+    return json.dumps(message, ensure_ascii=False)
+
+
+class OutboundConnection:
+    """Очередь исходящих кадров одного соединения и задача-писатель"""
+
+    def __init__(self, hub, user_id, send, close):
+        self.hub = hub
+        self.user_id = user_id
+        self.send = send
+        self.close = close
+        self.queue = asyncio.Queue(maxsize=hub.max_queue)
+        self.rooms = set()
+        self.dropped = 0
+        self.closed = False
+        self.writer = asyncio.ensure_future(self.write_loop())
+
+    def push(self, payload):
+        """Ставит кадр в очередь без ожидания. False — кадр не принят"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        policy = self.hub.slow_consumer_policy
+        if policy == POLICY_DROP_OLDEST:
+            self.queue.get_nowait()
+            self.queue.put_nowait(payload)
+            self.dropped += 1
+            return True
+        self.dropped += 1
+        if policy == POLICY_DISCONNECT:
+            self.hub.drop(self, SLOW_CONSUMER_CLOSE_CODE)
+        return False
+
+    async def write_loop(self):
+        while True:
+            payload = await self.queue.get()
+            if payload is _CLOSE:
+                return
+            try:
+                await asyncio.wait_for(self.send(payload), self.hub.send_timeout)
+            except asyncio.TimeoutError:
+                if self.hub.slow_consumer_policy == POLICY_DISCONNECT:
+                    self.hub.drop(self, SLOW_CONSUMER_CLOSE_CODE)
+                    return
+                self.dropped += 1
+            except Exception:
+                # Соединение разорвано: дальнейшие кадры не доставить
+                self.hub.unregister(self)
+                return
+
+    def stop(self):
+        """Останавливает писателя после уже поставленных кадров"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.queue.put_nowait(_CLOSE)
+        except asyncio.QueueFull:
+            self.writer.cancel()
+
+
+class FanoutHub:
+    """Соединения, комнаты и рассылка с одной сериализацией на сообщение"""
+
+    def __init__(self, max_queue=256, send_timeout=5.0, slow_consumer_policy=POLICY_DISCONNECT,
+                 max_connections_per_user=5):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.slow_consumer_policy = slow_consumer_policy
+        self.max_connections_per_user = max_connections_per_user
+        self.rooms = {}
+        self.user_connections = {}
+
+    def register(self, user_id, send, close):
+        """
+        Новое соединение: send(text) и close(code) — корутины транспорта.
+        Если у пользователя уже максимум соединений, самое старое закрывается.
+        """
+        connection = OutboundConnection(self, user_id, send, close)
+        connections = self.user_connections.setdefault(user_id, OrderedDict())
+        connections[connection] = None
+        while len(connections) > self.max_connections_per_user:
+            oldest = next(iter(connections))
+            self.drop(oldest, CONNECTION_LIMIT_CLOSE_CODE)
+        return connection
+
+    def unregister(self, connection):
+        connection.stop()
+        for room in list(connection.rooms):
+            self.leave(room, connection)
+        connections = self.user_connections.get(connection.user_id)
+        if connections is not None:
+            connections.pop(connection, None)
+            if not connections:
+                del self.user_connections[connection.user_id]
+
+    def drop(self, connection, code):
+        """Отключает соединение по политике (медленный клиент, лимит соединений)"""
+        if connection.closed:
+            return
+        self.unregister(connection)
+        asyncio.ensure_future(self._close(connection, code))
+
+    async def _close(self, connection, code):
+        try:
+            await connection.close(code)
+        except Exception:
+            pass
+
+    def join(self, room, connection):
+        self.rooms.setdefault(room, set()).add(connection)
+        connection.rooms.add(room)
+
+    def leave(self, room, connection):
+        connection.rooms.discard(room)
+        members = self.rooms.get(room)
+        if members is not None:
+            members.discard(connection)
+            if not members:
+                del self.rooms[room]
+
+    def broadcast(self, room, message):
+        """Рассылка в комнату: одна сериализация и постановка в очереди"""
+        return self.push_to(list(self.rooms.get(room, ())), encode_message(message))
+
+    def send_to_user(self, user_id, message):
+        """Все соединения пользователя"""
+        return self.send_to_users([user_id], message)
+
+    def send_to_users(self, user_ids, message):
+        """Несколько пользователей одной сериализацией"""
+        payload = encode_message(message)
+        connections = []
+        for user_id in user_ids:
+            connections.extend(self.user_connections.get(user_id, ()))
+        return self.push_to(connections, payload)
+
+    def push_to(self, connections, payload):
+        """Возвращает число соединений, принявших кадр"""
+        return sum(1 for connection in connections if connection.push(payload))
+
+    def connection_count(self, room=None):
+        if room is not None:
+            return len(self.rooms.get(room, ()))
+        return sum(len(connections) for connections in self.user_connections.values())
+
+    def user_connection_count(self, user_id):
+        return len(self.user_connections.get(user_id, ()))
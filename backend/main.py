@@ -1,28 +1,55 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List, Optional
+import hashlib
 import json
 import os
 import uuid
 from datetime import datetime
 import aiofiles
 
-from database import get_db, engine
+from database import SessionLocal, get_db, engine
 from models import Base, User, Chat, Message, MessageFile
 from schemas import (
     UserCreate, UserResponse, ChatCreate, ChatResponse, 
-    MessageCreate, MessageResponse, MessageUpdate, MessageFileResponse
+    MessageCreate, MessageResponse, MessageUpdate, MessageFileResponse, MessagePage
 )
-from auth import get_current_user, create_access_token, verify_password, get_password_hash
+from auth import get_current_user, get_websocket_user, create_access_token, verify_password, get_password_hash
 from websocket_manager import ConnectionManager
+from core.chunked_storage import COPY_BUFFER_SIZE, remove_quietly
+from core.content_store import BLOB_DIRECTORY, blob_name, commit_blob
 
-# Создаем таблицы
-Base.metadata.create_all(bind=engine)
+# Размер страницы по умолчанию и максимальный для истории сообщений и списков
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
+# Код закрытия WebSocket без действительного токена (нарушение политики)
+WS_AUTH_FAILED_CLOSE_CODE = 1008
 
 app = FastAPI(title="Chat API", version="1.0.0")
 
+def create_tables(connection):
+    """Создает таблицы и индексы, которых нет (create_all не добавляет индексы в существующие таблицы)"""
+    Base.metadata.create_all(bind=connection)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+@app.on_event("startup")
+async def startup():
+    # Создаем таблицы
+    async with engine.begin() as connection:
+        await connection.run_sync(create_tables)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await engine.dispose()
+
 # CORS настройки
 app.add_middleware(
     CORSMiddleware,
@@ -43,15 +70,15 @@ os.makedirs("media/avatars", exist_ok=True)
 os.makedirs("media/messages", exist_ok=True)
 
 @app.post("/api/auth/register", response_model=UserResponse)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """Регистрация пользователя"""
     # Проверяем, существует ли пользователь
-    existing_user = db.query(User).filter(User.email == user.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user.email))
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Создаем нового пользователя
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = User(
         email=user.email,
         name=user.name,
@@ -60,8 +87,8 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
         avatar=user.avatar
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     # Создаем токен
     access_token = create_access_token(data={"sub": str(db_user.id)})
@@ -76,19 +103,19 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     )
 
 @app.post("/api/auth/login", response_model=UserResponse)
-async def login(email: str, password: str, db: Session = Depends(get_db)):
+async def login(email: str, password: str, db: AsyncSession = Depends(get_db)):
     """Вход пользователя"""
     print(f"=== LOGIN REQUEST ===")
     print(f"Email: {email}")
     
-    user = db.query(User).filter(User.email == email).first()
+    user = await db.scalar(select(User).where(User.email == email))
     print(f"User found: {user is not None}")
     if user:
         print(f"User ID: {user.id}")
         print(f"User name: {user.name}")
         print(f"User email: {user.email}")
     
-    if not user or not verify_password(password, user.hashed_password):
+    if not user or not await verify_password(password, user.hashed_password):
         print("Invalid credentials")
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
@@ -119,9 +146,17 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
     )
 
 @app.get("/api/users", response_model=List[UserResponse])
-async def get_users(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Получение списка пользователей"""
-    users = db.query(User).filter(User.id != current_user.id).all()
+async def get_users(
+    after_id: Optional[int] = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Получение списка пользователей по возрастанию id; следующая страница — after_id последнего"""
+    query = select(User).where(User.id != current_user.id)
+    if after_id is not None:
+        query = query.where(User.id > after_id)
+    users = (await db.scalars(query.order_by(User.id).limit(limit))).all()
     return [
         UserResponse(
             id=user.id,
@@ -136,14 +171,14 @@ async def get_users(current_user: User = Depends(get_current_user), db: Session
 async def create_chat(
     chat: ChatCreate, 
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Создание чата"""
     # Проверяем, существует ли чат между пользователями
-    existing_chat = db.query(Chat).filter(
+    existing_chat = await db.scalar(select(Chat).where(
         ((Chat.user1_id == current_user.id) & (Chat.user2_id == chat.user2_id)) |
         ((Chat.user1_id == chat.user2_id) & (Chat.user2_id == current_user.id))
-    ).first()
+    ))
     
     if existing_chat:
         return ChatResponse(
@@ -159,8 +194,8 @@ async def create_chat(
         user2_id=chat.user2_id
     )
     db.add(db_chat)
-    db.commit()
-    db.refresh(db_chat)
+    await db.commit()
+    await db.refresh(db_chat)
     
     return ChatResponse(
         id=db_chat.id,
@@ -171,13 +206,18 @@ async def create_chat(
 
 @app.get("/api/chats", response_model=List[ChatResponse])
 async def get_chats(
+    before_id: Optional[int] = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Получение списка чатов пользователя"""
-    chats = db.query(Chat).filter(
+    """Получение чатов пользователя, новые первыми; следующая страница — before_id последнего"""
+    query = select(Chat).where(
         (Chat.user1_id == current_user.id) | (Chat.user2_id == current_user.id)
-    ).all()
+    )
+    if before_id is not None:
+        query = query.where(Chat.id < before_id)
+    chats = (await db.scalars(query.order_by(Chat.id.desc()).limit(limit))).all()
     
     return [
         ChatResponse(
@@ -188,61 +228,68 @@ async def get_chats(
         ) for chat in chats
     ]
 
-@app.get("/api/chats/{chat_id}/messages", response_model=List[MessageResponse])
+def stream_message_page(messages, has_more):
+    """
+    Ответ MessagePage по частям: сообщения сериализуются по одному прямо
+    из ORM-объектов (файлы уже загружены), весь JSON в памяти не собирается
+    """
+    def chunks():
+        yield '{"messages":['
+        for index, message in enumerate(messages):
+            if index:
+                yield ","
+            yield MessageResponse.model_validate(message).model_dump_json()
+        next_before_id = messages[0].id if has_more else None
+        yield '],"has_more":%s,"next_before_id":%s}' % (json.dumps(has_more), json.dumps(next_before_id))
+
+    return StreamingResponse(chunks(), media_type="application/json")
+
+@app.get("/api/chats/{chat_id}/messages", response_model=MessagePage)
 async def get_messages(
     chat_id: int,
+    before_id: Optional[int] = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Получение сообщений чата"""
+    """
+    Страница истории чата: limit сообщений до before_id (без него — последние)
+    в хронологическом порядке. Следующая, более старая страница — before_id=next_before_id
+    """
     # Проверяем, что пользователь имеет доступ к чату
-    chat = db.query(Chat).filter(
+    chat = await db.scalar(select(Chat).where(
         Chat.id == chat_id,
         (Chat.user1_id == current_user.id) | (Chat.user2_id == current_user.id)
-    ).first()
+    ))
     
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     
-    messages = db.query(Message).filter(Message.chat_id == chat_id).order_by(Message.created_at).all()
-    
-    result = []
-    for message in messages:
-        files = []
-        for file in message.files:
-            files.append(MessageFileResponse(
-                id=file.id,
-                filename=file.filename,
-                file_path=file.file_path,
-                file_size=file.file_size,
-                file_type=file.file_type
-            ))
-        
-        result.append(MessageResponse(
-            id=message.id,
-            chat_id=message.chat_id,
-            sender_id=message.sender_id,
-            text=message.text,
-            created_at=message.created_at,
-            edited_at=message.edited_at,
-            files=files
-        ))
-    
-    return result
+    # Поиск по индексу (chat_id, id) с конца: время не зависит от длины чата.
+    # Файлы страницы — одним запросом IN вместо запроса на каждое сообщение
+    query = select(Message).options(selectinload(Message.files)).where(Message.chat_id == chat_id)
+    if before_id is not None:
+        query = query.where(Message.id < before_id)
+    messages = list((await db.scalars(query.order_by(Message.id.desc()).limit(limit + 1))).all())
+    
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+    return stream_message_page(messages, has_more)
 
 @app.post("/api/chats/{chat_id}/messages", response_model=MessageResponse)
 async def create_message(
     chat_id: int,
     message: MessageCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Создание сообщения"""
     # Проверяем, что пользователь имеет доступ к чату
-    chat = db.query(Chat).filter(
+    chat = await db.scalar(select(Chat).where(
         Chat.id == chat_id,
         (Chat.user1_id == current_user.id) | (Chat.user2_id == current_user.id)
-    ).first()
+    ))
     
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
@@ -254,8 +301,8 @@ async def create_message(
         text=message.text
     )
     db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    await db.commit()
+    await db.refresh(db_message)
     
     # Отправляем сообщение через WebSocket
     await manager.send_message_to_chat(chat_id, {
@@ -286,13 +333,13 @@ async def update_message(
     message_id: int,
     message_update: MessageUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Редактирование сообщения"""
-    message = db.query(Message).filter(
+    message = await db.scalar(select(Message).where(
         Message.id == message_id,
         Message.sender_id == current_user.id
-    ).first()
+    ))
     
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
@@ -300,8 +347,8 @@ async def update_message(
     # Обновляем сообщение
     message.text = message_update.text
     message.edited_at = datetime.utcnow()
-    db.commit()
-    db.refresh(message)
+    await db.commit()
+    await db.refresh(message)
     
     # Отправляем обновление через WebSocket
     await manager.send_message_to_chat(message.chat_id, {
@@ -331,20 +378,20 @@ async def update_message(
 async def delete_message(
     message_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Удаление сообщения"""
-    message = db.query(Message).filter(
+    message = await db.scalar(select(Message).where(
         Message.id == message_id,
         Message.sender_id == current_user.id
-    ).first()
+    ))
     
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
     chat_id = message.chat_id
-    db.delete(message)
-    db.commit()
+    await db.delete(message)
+    await db.commit()
     
     # Отправляем уведомление об удалении через WebSocket
     await manager.send_message_to_chat(chat_id, {
@@ -359,37 +406,51 @@ async def upload_file(
     message_id: int,
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Загрузка файла к сообщению"""
-    message = db.query(Message).filter(
+    message = await db.scalar(select(Message).where(
         Message.id == message_id,
         Message.sender_id == current_user.id
-    ).first()
+    ))
     
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
-    # Сохраняем файл
-    file_extension = os.path.splitext(file.filename)[1]
-    filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = f"media/messages/{filename}"
+    # Сохраняем файл потоком во временный файл, по ходу считая SHA-256: путь
+    # задается содержимым, и одинаковые файлы хранятся на диске один раз
+    temp_directory = os.path.join("media", BLOB_DIRECTORY, "tmp")
+    os.makedirs(temp_directory, exist_ok=True)
+    temp_path = os.path.join(temp_directory, f"{uuid.uuid4().hex}.part")
     
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    hasher = hashlib.sha256()
+    file_size = 0
+    try:
+        async with aiofiles.open(temp_path, 'wb') as f:
+            while True:
+                block = await file.read(COPY_BUFFER_SIZE)
+                if not block:
+                    break
+                await f.write(block)
+                hasher.update(block)
+                file_size += len(block)
+        file_path = f"media/{blob_name(hasher.hexdigest(), file.filename)}"
+        commit_blob(temp_path, ".", file_path)
+    except Exception:
+        remove_quietly(temp_path)
+        raise
     
     # Создаем запись о файле
     db_file = MessageFile(
         message_id=message_id,
         filename=file.filename,
         file_path=file_path,
-        file_size=len(content),
+        file_size=file_size,
         file_type=file.content_type
     )
     db.add(db_file)
-    db.commit()
-    db.refresh(db_file)
+    await db.commit()
+    await db.refresh(db_file)
     
     return MessageFileResponse(
         id=db_file.id,
@@ -399,9 +460,28 @@ async def upload_file(
         file_type=db_file.file_type
     )
 
+async def user_in_chat(user_id: int, chat_id: int) -> bool:
+    async with SessionLocal() as db:
+        chat_id = await db.scalar(select(Chat.id).where(
+            Chat.id == chat_id,
+            (Chat.user1_id == user_id) | (Chat.user2_id == user_id)
+        ))
+    return chat_id is not None
+
+@app.websocket("/ws")
 @app.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: int):
-    """WebSocket соединение для чата"""
+async def websocket_endpoint(websocket: WebSocket, user_id: Optional[int] = None):
+    """
+    WebSocket соединение для чата. Пользователь определяется по токену
+    (/ws?token=...); id в старом адресе /ws/{user_id} должен с ним совпадать
+    """
+    user = await get_websocket_user(websocket)
+    if user is None or (user_id is not None and user_id != user.id):
+        # Закрытие до accept — отказ в рукопожатии
+        await websocket.close(code=WS_AUTH_FAILED_CLOSE_CODE)
+        return
+    
+    user_id = user.id
     await manager.connect(websocket, user_id)
     try:
         while True:
@@ -409,15 +489,20 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
             message_data = json.loads(data)
             
             if message_data["type"] == "join_chat":
-                chat_id = message_data["chat_id"]
-                await manager.join_chat(user_id, chat_id)
+                chat_id = int(message_data["chat_id"])
+                # Подписка только на свои чаты
+                if await user_in_chat(user_id, chat_id):
+                    await manager.join_chat(user_id, chat_id)
             
             elif message_data["type"] == "leave_chat":
-                chat_id = message_data["chat_id"]
+                chat_id = int(message_data["chat_id"])
                 await manager.leave_chat(user_id, chat_id)
                 
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
+        pass
+    finally:
+        # Соединение снимается и при ошибке разбора кадра
+        manager.disconnect(user_id, websocket)
 
 if __name__ == "__main__":
     import uvicorn
@@ -2,6 +2,8 @@ from rest_framework import serializers
 from .models import Post, Category, Comment, Like
 from django.contrib.auth import get_user_model
 
+from users.user_cards import CardListSerializer, context_card
+
 User = get_user_model()
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -16,34 +18,50 @@ class CategorySerializer(serializers.ModelSerializer):
         return obj.posts.filter(status='published').count()
 
 class UserSerializer(serializers.ModelSerializer):
-    """Сериализатор для автора поста"""
+    """
+    Сериализатор для автора поста: карточка из кэша (users.user_cards) по
+    id, поэтому поле объявляется с source='author_id' и join с User не нужен.
+    Аватар отдается превью размера context['avatar_size'] (s192 по
+    умолчанию — лента и комментарии)
+    """
+    avatar = serializers.SerializerMethodField()
     avatar_url = serializers.SerializerMethodField()
     
     class Meta:
         model = User
         fields = ['id', 'first_name', 'last_name', 'username', 'avatar', 'avatar_url', 'city']
     
-    def get_avatar_url(self, obj):
-        if obj.avatar:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.avatar.url)
-            return obj.avatar.url
-        return None
+    def to_representation(self, instance):
+        # instance — id пользователя или сам User
+        user_id = getattr(instance, 'pk', instance)
+        card = context_card(self.context, user_id, self.context.get('avatar_size', 's192'))
+        if card is None:
+            return None
+        return {
+            'id': card['id'],
+            'first_name': card['first_name'],
+            'last_name': card['last_name'],
+            'username': card['username'],
+            'avatar': card['avatar'],
+            'avatar_url': card['avatar'],
+            'city': card['city'],
+        }
 
 class CommentSerializer(serializers.ModelSerializer):
     """Сериализатор для комментариев"""
-    author = UserSerializer(read_only=True)
+    author = UserSerializer(source='author_id', read_only=True)
     created_at = serializers.DateTimeField(read_only=True)
     
     class Meta:
         model = Comment
         fields = ['id', 'content', 'author', 'created_at', 'parent', 'is_approved']
         read_only_fields = ['author', 'is_approved']
+        list_serializer_class = CardListSerializer
+        card_user_fields = ('author_id',)
 
 class PostListSerializer(serializers.ModelSerializer):
     """Сериализатор для списка постов"""
-    author = UserSerializer(read_only=True)
+    author = UserSerializer(source='author_id', read_only=True)
     category = CategorySerializer(read_only=True)
     comments_enabled = serializers.SerializerMethodField()
     created_at = serializers.DateTimeField(read_only=True)
@@ -57,6 +75,8 @@ class PostListSerializer(serializers.ModelSerializer):
             'likes_count',
             'created_at', 'published_at', 'uuid', 'comments_enabled'
         ]
+        list_serializer_class = CardListSerializer
+        card_user_fields = ('author_id',)
     
     def get_comments_enabled(self, obj):
         """Комментарии всегда разрешены"""
@@ -64,7 +84,7 @@ class PostListSerializer(serializers.ModelSerializer):
 
 class PostDetailSerializer(serializers.ModelSerializer):
     """Сериализатор для детального просмотра поста"""
-    author = UserSerializer(read_only=True)
+    author = UserSerializer(source='author_id', read_only=True)
     category = CategorySerializer(read_only=True)
     comments = serializers.SerializerMethodField()
     comments_enabled = serializers.SerializerMethodField()
@@ -94,12 +114,12 @@ class PostDetailSerializer(serializers.ModelSerializer):
     
     def get_comments(self, obj):
         """Получаем только одобренные комментарии"""
-        comments = obj.comments.filter(is_approved=True).select_related('author')
+        comments = obj.comments.filter(is_approved=True)
         return CommentSerializer(comments, many=True, context=self.context).data
 
 class PostCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания поста"""
-    author = UserSerializer(read_only=True)
+    author = UserSerializer(source='author_id', read_only=True)
     comments_enabled = serializers.SerializerMethodField()
     
     class Meta:
@@ -137,7 +157,7 @@ class PostCreateSerializer(serializers.ModelSerializer):
 
 class PostUpdateSerializer(serializers.ModelSerializer):
     """Сериализатор для обновления поста"""
-    author = UserSerializer(read_only=True)
+    author = UserSerializer(source='author_id', read_only=True)
     comments_enabled = serializers.SerializerMethodField()
     
     class Meta:
@@ -162,7 +182,7 @@ class PostUpdateSerializer(serializers.ModelSerializer):
 
 class CommentCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания комментария"""
-    author = UserSerializer(read_only=True)
+    author = UserSerializer(source='author_id', read_only=True)
     
     class Meta:
         model = Comment
@@ -182,7 +202,7 @@ class CommentCreateSerializer(serializers.ModelSerializer):
 
 class LikeSerializer(serializers.ModelSerializer):
     """Сериализатор для лайков"""
-    user = UserSerializer(read_only=True)
+    user = UserSerializer(source='user_id', read_only=True)
     
     class Meta:
         model = Like
@@ -48,7 +48,7 @@ class PostListView(generics.ListAPIView):
         print(f"Параметры запроса: {self.request.query_params}")
         
         # Базовый queryset - только опубликованные посты
-        queryset = Post.objects.filter(status='published').select_related('author', 'category').prefetch_related('likes', 'comments')
+        queryset = Post.objects.filter(status='published').select_related('category').prefetch_related('likes', 'comments')
         
         # Если запрашиваются посты конкретного автора и пользователь аутентифицирован
         author_id = self.request.query_params.get('author')
@@ -59,11 +59,11 @@ class PostListView(generics.ListAPIView):
             # Если пользователь запрашивает свои посты, показываем все (включая черновики)
             if str(self.request.user.id) == str(author_id):
                 print("Пользователь запрашивает свои посты - показываем все (включая черновики)")
-                queryset = Post.objects.filter(author_id=author_id).select_related('author', 'category').prefetch_related('likes', 'comments')
+                queryset = Post.objects.filter(author_id=author_id).select_related('category').prefetch_related('likes', 'comments')
             else:
                 print("Пользователь запрашивает посты другого пользователя - показываем только опубликованные")
                 # Если запрашиваются посты другого пользователя, показываем только опубликованные
-                queryset = Post.objects.filter(author_id=author_id, status='published').select_related('author', 'category').prefetch_related('likes', 'comments')
+                queryset = Post.objects.filter(author_id=author_id, status='published').select_related('category').prefetch_related('likes', 'comments')
         
         # Фильтрация по категории
         category_slug = self.request.query_params.get('category')
@@ -150,7 +150,7 @@ class PostDetailView(generics.RetrieveAPIView):
             
             # Получаем комментарии только для опубликованных постов
             if post.can_comment:
-                comments = post.comments.filter(is_approved=True).select_related('author')
+                comments = post.comments.filter(is_approved=True)
             else:
                 comments = []
             
@@ -319,7 +319,7 @@ class UserPostsView(generics.ListAPIView):
             return Post.objects.none()
         
         # Возвращаем все посты пользователя, включая черновики
-        queryset = Post.objects.filter(author_id=user_id).select_related('author', 'category').order_by('-created_at')
+        queryset = Post.objects.filter(author_id=user_id).select_related('category').order_by('-created_at')
         
         print(f"Найдено постов: {queryset.count()}")
         for post in queryset:
@@ -333,7 +333,7 @@ class CurrentUserPostsView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Post.objects.filter(author=self.request.user).select_related('author', 'category').order_by('-created_at')
+        return Post.objects.filter(author=self.request.user).select_related('category').order_by('-created_at')
     
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
@@ -479,7 +479,7 @@ def search_posts(request):
     posts = Post.objects.filter(
         Q(status='published') &
         (Q(title__icontains=query) | Q(content__icontains=query) | Q(short_description__icontains=query))
-    ).select_related('author', 'category')
+    ).select_related('category')
     
     serializer = PostListSerializer(posts, many=True)
     
@@ -528,7 +528,7 @@ class PublishedUserPostsView(generics.ListAPIView):
         queryset = Post.objects.filter(
             author_id=user_id, 
             status='published'
-        ).select_related('author', 'category').order_by('-created_at')
+        ).select_related('category').order_by('-created_at')
         
         print(f"Найдено опубликованных постов: {queryset.count()}")
         for post in queryset:
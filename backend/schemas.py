@@ -60,6 +60,11 @@ class MessageResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class MessagePage(BaseModel):
+    messages: List[MessageResponse]
+    has_more: bool
+    next_before_id: Optional[int] = None
+
 
 
 
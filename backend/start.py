@@ -17,10 +17,10 @@ def check_python_version():
 
 def check_requirements():
     """Проверка и установка зависимостей"""
-    requirements_file = Path(__file__).parent / "requirements.txt"
+    requirements_file = Path(__file__).parent / "requirements-fastapi.txt"
     
     if not requirements_file.exists():
-        print("❌ Файл requirements.txt не найден")
+        print("❌ Файл requirements-fastapi.txt не найден")
         sys.exit(1)
     
     print("📦 Установка зависимостей...")
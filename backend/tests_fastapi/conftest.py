@@ -0,0 +1,51 @@
+"""
+Тесты чата на FastAPI (main.py): приложение на временной SQLite через
+aiosqlite, запросы через httpx.AsyncClient без сети.
+
+database.py создает движок при импорте, а main.py — каталоги media/ в
+текущем каталоге, поэтому main импортируется в сессионной фикстуре
+chat_app: перед импортом она задает DATABASE_URL и временный рабочий
+каталог, а после тестов возвращает прежние.
+"""
+import importlib
+import os
+
+import httpx
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def chat_app(tmp_path_factory):
+    work_dir = tmp_path_factory.mktemp("chat")
+    (work_dir / "media").mkdir()
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("DATABASE_URL", f"sqlite+aiosqlite:///{work_dir / 'chat.db'}")
+        patch.chdir(work_dir)
+        patch.syspath_prepend(BACKEND_DIR)
+        yield importlib.import_module("main")
+
+
+@pytest.fixture
+def auth(chat_app):
+    return importlib.import_module("auth")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def client(chat_app):
+    from database import engine
+    from models import Base
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+    await chat_app.startup()
+    transport = httpx.ASGITransport(app=chat_app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+    await engine.dispose()
@@ -0,0 +1,20 @@
+"""Общие шаги тестов API чата"""
+
+
+def auth_headers(user):
+    return {"Authorization": f"Bearer {user['access_token']}"}
+
+
+async def register(client, email, password="secret"):
+    """Регистрирует пользователя; возвращает ответ с access_token"""
+    response = await client.post(
+        "/api/auth/register", json={"email": email, "name": email.split("@")[0], "password": password}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def create_chat(client, first, second):
+    response = await client.post("/api/chats", json={"user2_id": second["id"]}, headers=auth_headers(first))
+    assert response.status_code == 200, response.text
+    return response.json()
@@ -0,0 +1,111 @@
+import threading
+
+import pytest
+
+from helpers import auth_headers, create_chat, register
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_password_hashing_runs_in_thread_pool(client, auth, monkeypatch):
+    threads = []
+    original_hash = auth.pwd_context.hash
+    original_verify = auth.pwd_context.verify
+
+    def recording_hash(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return original_hash(*args, **kwargs)
+
+    def recording_verify(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return original_verify(*args, **kwargs)
+
+    monkeypatch.setattr(auth.pwd_context, "hash", recording_hash)
+    monkeypatch.setattr(auth.pwd_context, "verify", recording_verify)
+
+    await register(client, "anna@example.com", password="right")
+    response = await client.post("/api/auth/login", params={"email": "anna@example.com", "password": "right"})
+    assert response.status_code == 200
+    assert response.json()["access_token"]
+    response = await client.post("/api/auth/login", params={"email": "anna@example.com", "password": "wrong"})
+    assert response.status_code == 401
+
+    assert len(threads) == 3
+    assert all(name.startswith("password-hash") for name in threads)
+
+
+async def test_get_current_user(client, auth):
+    user = await register(client, "boris@example.com")
+
+    response = await client.get("/api/users/me", headers=auth_headers(user))
+    assert response.status_code == 200
+    assert response.json()["email"] == "boris@example.com"
+
+    response = await client.get("/api/users/me", headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 401
+
+    missing = auth.create_access_token({"sub": "999"})
+    response = await client.get("/api/users/me", headers={"Authorization": f"Bearer {missing}"})
+    assert response.status_code == 401
+
+
+async def test_create_message(client):
+    first = await register(client, "vera@example.com")
+    second = await register(client, "gleb@example.com")
+    outsider = await register(client, "dina@example.com")
+    chat = await create_chat(client, first, second)
+
+    response = await client.post(
+        f"/api/chats/{chat['id']}/messages", json={"text": "Привет"}, headers=auth_headers(first)
+    )
+    assert response.status_code == 200
+    message = response.json()
+    assert message["text"] == "Привет"
+    assert message["sender_id"] == first["id"]
+    assert message["chat_id"] == chat["id"]
+    assert message["files"] == []
+
+    response = await client.post(
+        f"/api/chats/{chat['id']}/messages", json={"text": "Чужой"}, headers=auth_headers(outsider)
+    )
+    assert response.status_code == 404
+
+
+async def test_get_messages_pages(client):
+    first = await register(client, "egor@example.com")
+    second = await register(client, "zoya@example.com")
+    chat = await create_chat(client, first, second)
+    ids = []
+    for number in range(7):
+        response = await client.post(
+            f"/api/chats/{chat['id']}/messages", json={"text": f"m{number}"}, headers=auth_headers(first)
+        )
+        ids.append(response.json()["id"])
+    response = await client.post(
+        f"/api/messages/{ids[-1]}/files",
+        files={"file": ("note.txt", b"hello", "text/plain")},
+        headers=auth_headers(first),
+    )
+    assert response.status_code == 200
+
+    url = f"/api/chats/{chat['id']}/messages"
+    page = (await client.get(url, params={"limit": 3}, headers=auth_headers(second))).json()
+    assert [message["id"] for message in page["messages"]] == ids[4:]
+    assert page["has_more"] is True
+    assert page["messages"][-1]["files"][0]["filename"] == "note.txt"
+
+    page = (await client.get(
+        url, params={"limit": 3, "before_id": page["next_before_id"]}, headers=auth_headers(second)
+    )).json()
+    assert [message["id"] for message in page["messages"]] == ids[1:4]
+    assert page["has_more"] is True
+
+    page = (await client.get(
+        url, params={"limit": 3, "before_id": page["next_before_id"]}, headers=auth_headers(second)
+    )).json()
+    assert [message["id"] for message in page["messages"]] == ids[:1]
+    assert page["has_more"] is False
+    assert page["next_before_id"] is None
+
+    response = await client.get(url, params={"limit": 1000}, headers=auth_headers(second))
+    assert response.status_code == 422
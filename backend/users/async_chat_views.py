@@ -0,0 +1,323 @@
+"""
+Асинхронные REST-представления чата (/api/users/async/...).
+
+Обработчики — корутины Django, выполняются прямо в event loop ASGI-приложения
+(core.asgi) без asyncio.run и без отдельного потока на каждый шаг.
+Чтение идет через async ORM, независимые запросы запускаются через
+asyncio.gather. В поток уходят только записи с транзакциями и побочными
+эффектами в ChatMessage.save (уведомления, WebSocket).
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.views import View
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .models import Chat, ChatMember, ChatMessage
+from .serializers import ChatMessageSerializer
+from .chat_history import (
+    aget_chat_history,
+    clamp_history_page_size,
+    get_history_pagination,
+    parse_message_id,
+)
+from .chat_inbox import aget_inbox_page, aget_read_cursors, clamp_inbox_page_size, serialize_inbox_entry
+from .chat_receipts import mark_chat_read_and_notify
+from .chunked_uploads import UploadError, atake_completed_upload, message_type_for
+from .direct_chats import direct_chat_pair, get_or_create_direct_chat
+from .presence import aget_presence_map
+
+User = get_user_model()
+
+jwt_authentication = JWTAuthentication()
+
+
+def api_response(data, status=200):
+    """JSON-ответ с тем же форматом дат, что у DRF"""
+    return JsonResponse(
+        data,
+        status=status,
+        encoder=JSONEncoder,
+        json_dumps_params={'ensure_ascii': False}
+    )
+
+
+async def authenticate_request(request):
+    """Пользователь по JWT из заголовка Authorization (или None)"""
+    header = jwt_authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = jwt_authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    try:
+        token = jwt_authentication.get_validated_token(raw_token)
+    except (InvalidToken, TokenError):
+        return None
+
+    user = await User.objects.filter(id=token['user_id']).afirst()
+    if user is None or not user.is_active:
+        return None
+    return user
+
+
+def get_request_data(request):
+    """Тело запроса: JSON или form-data (с файлами)"""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST
+
+
+def serialize_messages(messages, request, read_cursors=None):
+    """Сериализация без обращений к БД: sender подгружен через select_related"""
+    return ChatMessageSerializer(
+        messages,
+        many=True,
+        context={'request': request, 'read_cursors': read_cursors}
+    ).data
+
+
+class AsyncAPIView(View):
+    """
+    Базовое асинхронное представление: JWT-аутентификация,
+    без CSRF (как у APIView) и ответ 500 в формате API при ошибке
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await authenticate_request(request)
+        if user is None:
+            return api_response({
+                'detail': 'Учетные данные не были предоставлены.'
+            }, status=401)
+        request.user = user
+
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except Exception as e:
+            return api_response({
+                'success': False,
+                'message': str(e)
+            }, status=500)
+
+    async def get_direct_chat(self, request, user_id):
+        """
+        Личный чат с пользователем user_id: проверка собеседника и поиск
+        чата идут параллельно. Возвращает (chat, created) или None.
+        """
+        min_user_id, max_user_id = direct_chat_pair(request.user.id, user_id)
+        user_exists, chat = await asyncio.gather(
+            User.objects.filter(id=user_id).aexists(),
+            Chat.objects.filter(
+                min_user_id=min_user_id,
+                max_user_id=max_user_id,
+                is_active=True
+            ).afirst(),
+        )
+        if not user_exists:
+            return None
+        if chat is not None:
+            return chat, False
+        return await sync_to_async(get_or_create_direct_chat)(request.user.id, user_id)
+
+    def user_not_found(self):
+        return api_response({
+            'success': False,
+            'message': 'Пользователь не найден'
+        }, status=404)
+
+
+class AsyncChatListView(AsyncAPIView):
+    """Асинхронное представление для получения списка чатов"""
+
+    async def get(self, request):
+        cursor = request.GET.get('cursor')
+        page_size = clamp_inbox_page_size(request.GET.get('page_size'))
+
+        page = await aget_inbox_page(request.user, cursor, page_size)
+        presence = await aget_presence_map(member.other_user for member in page['results'])
+
+        return api_response({
+            'success': True,
+            'chats': [serialize_inbox_entry(member, request, presence) for member in page['results']],
+            'has_next': page['has_next'],
+            'next_cursor': page['next_cursor']
+        })
+
+
+class AsyncChatCreateView(AsyncAPIView):
+    """Асинхронное представление для создания чата"""
+
+    async def post(self, request, user_id):
+        result = await self.get_direct_chat(request, user_id)
+        if result is None:
+            return self.user_not_found()
+        chat, created = result
+
+        member = await ChatMember.objects.select_related('chat', 'user', 'other_user').aget(
+            chat=chat,
+            user=request.user
+        )
+
+        return api_response({
+            'success': True,
+            'chat': serialize_inbox_entry(member, request),
+            'created': created
+        })
+
+
+class AsyncChatMessagesView(AsyncAPIView):
+    """Асинхронное представление для получения сообщений чата"""
+
+    async def get(self, request, user_id):
+        result = await self.get_direct_chat(request, user_id)
+        if result is None:
+            return self.user_not_found()
+        chat, created = result
+
+        page_size = clamp_history_page_size(request.GET.get('page_size'), 20)
+
+        # История, сдвиг курсора прочтения и курсоры собеседников независимы
+        history, read_cursor, read_cursors = await asyncio.gather(
+            aget_chat_history(
+                chat,
+                before_id=parse_message_id(request.GET.get('before_id')),
+                after_id=parse_message_id(request.GET.get('after_id')),
+                limit=page_size
+            ),
+            sync_to_async(mark_chat_read_and_notify)(chat, request.user.id),
+            aget_read_cursors(chat.id),
+        )
+        if read_cursor:
+            read_cursors[request.user.id] = read_cursor
+
+        return api_response({
+            'success': True,
+            'messages': serialize_messages(history['messages'], request, read_cursors),
+            'pagination': get_history_pagination(history, page_size),
+            'chat_id': chat.id,
+            'created': created
+        })
+
+
+class AsyncChatMessageCreateView(AsyncAPIView):
+    """Асинхронное представление для создания сообщения"""
+
+    async def post(self, request, user_id):
+        result = await self.get_direct_chat(request, user_id)
+        if result is None:
+            return self.user_not_found()
+        chat, created = result
+
+        data = get_request_data(request)
+        content = data.get('content', '')
+        message_type = data.get('message_type', 'text')
+        reply_to_id = data.get('reply_to')
+
+        reply_to = None
+        if reply_to_id:
+            reply_to = await ChatMessage.objects.aget(id=reply_to_id, chat=chat)
+
+        # Файл прикладывается только к изображениям и файлам
+        file = request.FILES.get('file')
+        if not (file and message_type in ['image', 'file']):
+            file = None
+        
+        # Файл, загруженный частями (uploads/), приходит как upload_id
+        upload_id = data.get('upload_id')
+        if upload_id:
+            try:
+                file, content_type = await atake_completed_upload(request.user, upload_id, 'chat_file')
+            except UploadError as e:
+                return api_response({
+                    'success': False,
+                    'message': e.message
+                }, status=e.status)
+            message_type = message_type_for(content_type)
+
+        message = await ChatMessage.objects.acreate(
+            chat=chat,
+            sender=request.user,
+            content=content,
+            message_type=message_type,
+            file=file,
+            reply_to=reply_to
+        )
+
+        serializer_data = serialize_messages([message], request)
+
+        return api_response({
+            'success': True,
+            'message': serializer_data[0] if serializer_data else None,
+            'chat_id': chat.id
+        })
+
+
+class AsyncChatMessageUpdateView(AsyncAPIView):
+    """Асинхронное представление для редактирования сообщения"""
+
+    async def put(self, request, message_id):
+        content = get_request_data(request).get('content', '')
+        if not content:
+            return api_response({
+                'success': False,
+                'message': 'Содержимое сообщения не может быть пустым'
+            }, status=400)
+
+        message = await ChatMessage.objects.select_related('blob').filter(
+            id=message_id,
+            sender=request.user
+        ).afirst()
+
+        if not message:
+            return api_response({
+                'success': False,
+                'message': 'Сообщение не найдено или у вас нет прав на его редактирование'
+            }, status=404)
+
+        message.content = content
+        message.is_edited = True
+        await message.asave()
+
+        serializer_data = serialize_messages([message], request)
+
+        return api_response({
+            'success': True,
+            'message': serializer_data[0] if serializer_data else None
+        })
+
+
+class AsyncChatMessageDeleteView(AsyncAPIView):
+    """Асинхронное представление для удаления сообщения"""
+
+    async def delete(self, request, message_id):
+        message = await ChatMessage.objects.filter(
+            id=message_id,
+            sender=request.user
+        ).afirst()
+
+        if not message:
+            return api_response({
+                'success': False,
+                'message': 'Сообщение не найдено или у вас нет прав на его удаление'
+            }, status=404)
+
+        await message.adelete()
+
+        return api_response({
+            'success': True,
+            'message': 'Сообщение удалено'
+        })
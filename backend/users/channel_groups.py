@@ -0,0 +1,34 @@
+"""
+Продление членства в группах channel layer.
+
+Членство истекает через CHANNEL_GROUP_EXPIRY секунд (channels-redis,
+core.channel_broker), чтобы каналы упавших воркеров не копились в группах.
+Открытое соединение повторяет group_add раз в CHANNEL_GROUP_REFRESH_INTERVAL,
+поэтому долгие сессии из групп не выпадают.
+"""
+import asyncio
+
+from django.conf import settings
+
+CHANNEL_GROUP_REFRESH_INTERVAL = getattr(settings, 'CHANNEL_GROUP_REFRESH_INTERVAL', 43200)
+
+
+async def refresh_groups_forever(channel_layer, channel_name, get_groups, interval=CHANNEL_GROUP_REFRESH_INTERVAL):
+    """Периодически продлевает членство канала во всех группах из get_groups()"""
+    while True:
+        await asyncio.sleep(interval)
+        for group in get_groups():
+            await channel_layer.group_add(group, channel_name)
+
+
+def start_group_refresh(consumer, get_groups):
+    """Фоновое продление групп соединения; задачу отменяет stop_group_refresh"""
+    consumer.group_refresh_task = asyncio.ensure_future(
+        refresh_groups_forever(consumer.channel_layer, consumer.channel_name, get_groups)
+    )
+
+
+def stop_group_refresh(consumer):
+    task = getattr(consumer, 'group_refresh_task', None)
+    if task is not None:
+        task.cancel()
@@ -0,0 +1,78 @@
+"""
+История сообщений чата с keyset-пагинацией по индексу (chat, id)
+"""
+from .models import ChatMessage
+
+CHAT_HISTORY_PAGE_SIZE = 50
+CHAT_HISTORY_MAX_PAGE_SIZE = 200
+
+
+def parse_message_id(value):
+    """Приводит параметр запроса к id сообщения (или None)"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def clamp_history_page_size(value, default=CHAT_HISTORY_PAGE_SIZE):
+    """Ограничивает размер страницы истории"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(value, CHAT_HISTORY_MAX_PAGE_SIZE))
+
+
+def _history_query(chat, before_id, after_id, limit):
+    chat_id = chat.id if hasattr(chat, 'id') else chat
+    queryset = ChatMessage.objects.filter(chat_id=chat_id).select_related('blob')
+    if after_id is not None:
+        return queryset.filter(id__gt=after_id).order_by('id')[:limit + 1]
+    if before_id is not None:
+        queryset = queryset.filter(id__lt=before_id)
+    return queryset.order_by('-id')[:limit + 1]
+
+
+def _history_page(rows, after_id, limit):
+    has_more = len(rows) > limit
+    messages = rows[:limit]
+    if after_id is None:
+        messages.reverse()
+
+    return {
+        'messages': messages,
+        'has_more': has_more,
+        'oldest_id': messages[0].id if messages else None,
+        'newest_id': messages[-1].id if messages else None,
+    }
+
+
+def get_chat_history(chat, before_id=None, after_id=None, limit=CHAT_HISTORY_PAGE_SIZE):
+    """
+    Страница истории чата в хронологическом порядке.
+
+    Без параметров — последние limit сообщений; before_id — более старые
+    сообщения (прокрутка вверх); after_id — новые сообщения после
+    указанного (догрузка после переподключения).
+    Без COUNT и OFFSET: берется limit + 1 строка, лишняя означает has_more.
+    """
+    rows = list(_history_query(chat, before_id, after_id, limit))
+    return _history_page(rows, after_id, limit)
+
+
+async def aget_chat_history(chat, before_id=None, after_id=None, limit=CHAT_HISTORY_PAGE_SIZE):
+    """Асинхронный вариант get_chat_history (async ORM)"""
+    rows = [message async for message in _history_query(chat, before_id, after_id, limit)]
+    return _history_page(rows, after_id, limit)
+
+
+def get_history_pagination(history, page_size):
+    """Блок pagination для ответа API"""
+    return {
+        'page_size': page_size,
+        'has_more': history['has_more'],
+        'oldest_id': history['oldest_id'],
+        'newest_id': history['newest_id'],
+    }
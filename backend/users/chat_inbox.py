@@ -0,0 +1,254 @@
+"""
+Денормализованный список чатов (inbox): последнее сообщение хранится в Chat,
+собеседник, курсор прочтения и счетчик непрочитанных — в строке ChatMember
+каждого участника
+"""
+from django.db.models import Case, ExpressionWrapper, F, PositiveIntegerField, When
+
+from .models import Chat, ChatMember, ChatMessage
+from .pagination_utils import get_keyset_paginated_data, aget_keyset_paginated_data
+from .user_cards import build_user_card
+
+SNIPPET_LENGTH = 255
+
+CHAT_INBOX_PAGE_SIZE = 50
+CHAT_INBOX_MAX_PAGE_SIZE = 100
+
+# Подпись вместо текста для сообщений без содержимого
+MESSAGE_TYPE_LABELS = dict(ChatMessage.MESSAGE_TYPES)
+
+
+def message_snippet(message):
+    """Короткий текст сообщения для списка чатов"""
+    if message.content:
+        return message.content[:SNIPPET_LENGTH]
+    if message.message_type != 'text':
+        return MESSAGE_TYPE_LABELS.get(message.message_type, '')
+    return ''
+
+
+def ensure_chat_members(chat, user_ids=None):
+    """
+    Создает недостающие строки ChatMember для участников чата.
+    Вызывается после добавления участников в chat.participants.
+    """
+    if user_ids is None:
+        user_ids = list(chat.participants.values_list('id', flat=True))
+    user_ids = list(user_ids)
+
+    members = []
+    for user_id in user_ids:
+        others = [other_id for other_id in user_ids if other_id != user_id]
+        members.append(ChatMember(
+            chat=chat,
+            user_id=user_id,
+            other_user_id=others[0] if others else None,
+            last_activity_at=chat.last_message_at or chat.updated_at or chat.created_at,
+        ))
+    ChatMember.objects.bulk_create(members, ignore_conflicts=True)
+
+
+def record_new_message(message):
+    """
+    Обновляет последнее сообщение чата и строки участников.
+    Возвращает id получателей (всех участников, кроме отправителя).
+    """
+    member_ids = record_new_messages(message.chat_id, [message])
+    return [user_id for user_id in member_ids if user_id != message.sender_id]
+
+
+def record_new_messages(chat_id, messages):
+    """
+    То же для пачки сообщений одного чата (в порядке id): одно обновление
+    Chat и одно обновление ChatMember. Возвращает id всех участников чата.
+    """
+    last = messages[-1]
+    Chat.objects.filter(id=chat_id).update(
+        last_message=last,
+        last_message_snippet=message_snippet(last),
+        last_message_type=last.message_type,
+        last_message_sender_id=last.sender_id,
+        last_message_at=last.created_at,
+        updated_at=last.created_at,
+    )
+
+    member_ids = list(ChatMember.objects.filter(chat_id=chat_id).values_list('user_id', flat=True))
+    if not member_ids:
+        return member_ids
+
+    # Одним UPDATE: всем поднимаем чат наверх, получателям увеличиваем счетчик
+    ChatMember.objects.filter(chat_id=chat_id).update(
+        last_activity_at=last.created_at,
+        unread_count=Case(
+            *[
+                When(user_id=user_id, then=ExpressionWrapper(
+                    F('unread_count') + sum(1 for message in messages if message.sender_id != user_id),
+                    output_field=PositiveIntegerField()
+                ))
+                for user_id in member_ids
+            ],
+            default=F('unread_count'),
+        ),
+    )
+    return member_ids
+
+
+def record_edited_message(message):
+    """Обновляет фрагмент текста, если отредактировано последнее сообщение"""
+    Chat.objects.filter(id=message.chat_id, last_message_id=message.id).update(
+        last_message_snippet=message_snippet(message),
+        last_message_type=message.message_type,
+    )
+
+
+def record_deleted_message(message, message_id):
+    """
+    Пересчитывает последнее сообщение и счетчики после удаления сообщения.
+    message_id передается отдельно: после delete() у экземпляра id = None.
+    """
+    # Сообщение было непрочитанным у тех, чей курсор до него не дошел
+    ChatMember.objects.filter(
+        chat_id=message.chat_id,
+        last_read_message_id__lt=message_id,
+        unread_count__gt=0
+    ).exclude(user_id=message.sender_id).update(unread_count=F('unread_count') - 1)
+
+    if not Chat.objects.filter(id=message.chat_id, last_message__isnull=True).exists():
+        return
+    refresh_last_message(message.chat_id)
+
+
+def refresh_last_message(chat_id):
+    """Заново вычисляет денормализованное последнее сообщение чата"""
+    last = ChatMessage.objects.filter(chat_id=chat_id).order_by('-id').first()
+    Chat.objects.filter(id=chat_id).update(
+        last_message=last,
+        last_message_snippet=message_snippet(last) if last else '',
+        last_message_type=last.message_type if last else '',
+        last_message_sender_id=last.sender_id if last else None,
+        last_message_at=last.created_at if last else None,
+    )
+
+
+def count_unread(chat_id, user_id, last_read_message_id):
+    """Число входящих сообщений после курсора (диапазон по индексу chat, id)"""
+    return ChatMessage.objects.filter(
+        chat_id=chat_id,
+        id__gt=last_read_message_id
+    ).exclude(sender_id=user_id).count()
+
+
+def mark_chat_read(chat, user_id, up_to_id=None):
+    """
+    Сдвигает курсор прочтения участника одним UPDATE, сколько бы
+    сообщений ни было непрочитано. Курсор только растет.
+    Возвращает новый курсор или None, если сдвигать было нечего.
+    """
+    last_message_id = chat.last_message_id or 0
+    if up_to_id is None or up_to_id > last_message_id:
+        up_to_id = last_message_id
+    if not up_to_id:
+        return None
+
+    # Дочитали до конца — счетчик обнуляется без подсчета
+    unread = 0
+    if up_to_id < last_message_id:
+        unread = count_unread(chat.id, user_id, up_to_id)
+
+    updated = ChatMember.objects.filter(
+        chat_id=chat.id,
+        user_id=user_id,
+        last_read_message_id__lt=up_to_id
+    ).update(last_read_message_id=up_to_id, unread_count=unread)
+    return up_to_id if updated else None
+
+
+def get_read_cursors(chat_id):
+    """Курсоры прочтения всех участников чата: {user_id: last_read_message_id}"""
+    return dict(
+        ChatMember.objects.filter(chat_id=chat_id).values_list('user_id', 'last_read_message_id')
+    )
+
+
+async def aget_read_cursors(chat_id):
+    """Асинхронный вариант get_read_cursors"""
+    rows = ChatMember.objects.filter(chat_id=chat_id).values_list('user_id', 'last_read_message_id')
+    return {user_id: cursor async for user_id, cursor in rows}
+
+
+def is_read_by_others(message, read_cursors):
+    """Прочитано ли сообщение кем-то из участников, кроме отправителя"""
+    return any(
+        cursor >= message.id
+        for user_id, cursor in read_cursors.items()
+        if user_id != message.sender_id
+    )
+
+
+def clamp_inbox_page_size(value, default=CHAT_INBOX_PAGE_SIZE):
+    """Ограничивает размер страницы списка чатов"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(value, CHAT_INBOX_MAX_PAGE_SIZE))
+
+
+def inbox_queryset(user):
+    return ChatMember.objects.filter(
+        user=user,
+        chat__is_active=True
+    ).select_related('chat', 'user', 'other_user')
+
+
+def get_inbox_page(user, cursor=None, page_size=30):
+    """
+    Страница списка чатов пользователя одним запросом
+    по индексу (user, last_activity_at, id)
+    """
+    return get_keyset_paginated_data(inbox_queryset(user), cursor, page_size, 'last_activity_at')
+
+
+async def aget_inbox_page(user, cursor=None, page_size=30):
+    """Асинхронный вариант get_inbox_page"""
+    return await aget_keyset_paginated_data(inbox_queryset(user), cursor, page_size, 'last_activity_at')
+
+
+def serialize_inbox_entry(member, request=None, presence=None):
+    """
+    Элемент списка чатов в формате, совместимом с ChatSerializer
+    (participants — карточки обоих участников, их читает ChatModal.js).
+    member загружается с select_related('chat', 'user', 'other_user').
+    presence — статусы собеседников страницы (users.presence.get_presence_map)
+    """
+    chat = member.chat
+    other_user = member.other_user
+    other_participant = None
+    if other_user:
+        other_participant = {
+            **build_user_card(other_user, request),
+            'city': other_user.city
+        }
+        if presence and other_user.id in presence:
+            other_participant.update(presence[other_user.id])
+
+    last_message = None
+    if chat.last_message_id:
+        last_message = {
+            'id': chat.last_message_id,
+            'content': chat.last_message_snippet,
+            'message_type': chat.last_message_type,
+            'sender': chat.last_message_sender_id,
+            'created_at': chat.last_message_at,
+        }
+
+    return {
+        'id': chat.id,
+        'participants': [build_user_card(user, request) for user in (member.user, other_user) if user],
+        'other_participant': other_participant,
+        'last_message': last_message,
+        'unread_count': member.unread_count,
+        'created_at': chat.created_at,
+        'updated_at': chat.updated_at,
+        'is_active': chat.is_active,
+    }
@@ -0,0 +1,118 @@
+"""
+Отчеты о прочтении сообщений: курсор прочтения участника рассылается
+собеседникам одним событием messages_read вместо флага на каждом сообщении
+"""
+import asyncio
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .models import Chat, ChatMember
+from .chat_inbox import mark_chat_read
+
+# Сколько секунд копить отметки о прочтении от клиента перед записью в БД
+READ_RECEIPT_DELAY = getattr(settings, 'CHAT_READ_RECEIPT_DELAY', 1.0)
+
+
+def build_read_receipt(chat_id, reader_id, last_read_message_id):
+    """Событие для channel layer (обрабатывается ChatConsumer.messages_read)"""
+    return {
+        'type': 'messages_read',
+        'chat_id': chat_id,
+        'user_id': reader_id,
+        'last_read_message_id': last_read_message_id,
+    }
+
+
+def get_receipt_recipients(chat_id, reader_id):
+    """Участники чата, которым нужен отчет о прочтении"""
+    return list(
+        ChatMember.objects.filter(chat_id=chat_id)
+        .exclude(user_id=reader_id)
+        .values_list('user_id', flat=True)
+    )
+
+
+def send_read_receipt(chat_id, reader_id, last_read_message_id):
+    """Отправляет отчет о прочтении собеседникам в их группы user_<id>"""
+    try:
+        channel_layer = get_channel_layer()
+        if not channel_layer:
+            return
+        event = build_read_receipt(chat_id, reader_id, last_read_message_id)
+        for user_id in get_receipt_recipients(chat_id, reader_id):
+            async_to_sync(channel_layer.group_send)(f"user_{user_id}", event)
+    except Exception as e:
+        # Отчет о прочтении не должен ломать открытие чата
+        print(f"Ошибка отправки отчета о прочтении: {e}")
+
+
+def mark_chat_read_and_notify(chat, user_id, up_to_id=None):
+    """
+    Сдвигает курсор прочтения и после коммита отправляет собеседникам
+    один отчет о прочтении. Возвращает новый курсор или None.
+    """
+    cursor = mark_chat_read(chat, user_id, up_to_id)
+    if cursor:
+        transaction.on_commit(lambda: send_read_receipt(chat.id, user_id, cursor))
+    return cursor
+
+
+class ReadReceiptBatcher:
+    """
+    Копит отметки о прочтении, пришедшие по WebSocket, и раз в
+    READ_RECEIPT_DELAY секунд записывает по одному курсору на чат.
+    Пролистывание сотни сообщений дает одну запись и один отчет.
+    """
+
+    def __init__(self, user_id, channel_layer, delay=READ_RECEIPT_DELAY):
+        self.user_id = user_id
+        self.channel_layer = channel_layer
+        self.delay = delay
+        self.pending = {}
+        self.flush_task = None
+
+    def add(self, chat_id, message_id):
+        """Запоминает максимальный прочитанный id по чату"""
+        if message_id > self.pending.get(chat_id, 0):
+            self.pending[chat_id] = message_id
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.delay)
+        await self.flush()
+
+    async def flush(self):
+        """Записывает накопленные курсоры и рассылает отчеты"""
+        pending, self.pending = self.pending, {}
+        for chat_id, message_id in pending.items():
+            cursor, recipients = await self.advance(chat_id, message_id)
+            if not cursor:
+                continue
+            event = build_read_receipt(chat_id, self.user_id, cursor)
+            for user_id in recipients:
+                await self.channel_layer.group_send(f"user_{user_id}", event)
+
+    async def close(self):
+        """Досылает накопленное при отключении клиента"""
+        if self.flush_task and not self.flush_task.done():
+            self.flush_task.cancel()
+        if self.pending:
+            await self.flush()
+
+    @database_sync_to_async
+    def advance(self, chat_id, message_id):
+        chat = Chat.objects.filter(
+            id=chat_id,
+            members__user_id=self.user_id
+        ).only('id', 'last_message_id').first()
+        if not chat:
+            return None, []
+        cursor = mark_chat_read(chat, self.user_id, message_id)
+        if not cursor:
+            return None, []
+        return cursor, get_receipt_recipients(chat_id, self.user_id)
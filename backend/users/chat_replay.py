@@ -0,0 +1,169 @@
+"""
+Догрузка пропущенных сообщений после переподключения WebSocket.
+
+У каждого сообщения есть номер в чате ChatMessage.seq (1, 2, 3...), счетчик
+хранится в Chat.last_seq и увеличивается в транзакции вставки. Последние
+CHAT_REPLAY_BUFFER_SIZE сообщений чата лежат в кэше одним ключом
+chat_replay_<chat_id> — словарем {seq: данные сообщения}, из которого при
+записи выбрасываются номера старше последних CHAT_REPLAY_BUFFER_SIZE. Один
+ключ на чат, а не на сообщение, не вытесняет из кэша ключи присутствия,
+уведомлений и версий карточек.
+
+В продакшене кэш — Redis (django-redis), буфер общий для всех воркеров. С
+LocMemCache (core/settings.py для разработки) у каждого процесса свой буфер,
+и догрузка работает только при одном процессе.
+
+Два воркера, одновременно дописывающие один чат, могут затереть сообщения
+друг друга в буфере; догрузка видит такой пропуск и отвечает replay_gap.
+
+Клиент при join_chat сообщает last_seq — номер последнего полученного
+сообщения. Если все сообщения после него еще в буфере, они отправляются
+одним кадром replay; иначе клиент получает replay_gap и догружает историю
+по REST (after_id). Полная история при каждом переподключении больше
+не запрашивается.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import Chat
+from .direct_chats import direct_chat_pair
+
+CHAT_REPLAY_BUFFER_SIZE = getattr(settings, 'CHAT_REPLAY_BUFFER_SIZE', 100)
+CHAT_REPLAY_TTL = getattr(settings, 'CHAT_REPLAY_TTL', 3600)
+
+
+def replay_key(chat_id):
+    return f"chat_replay_{chat_id}"
+
+
+def _trim(ring):
+    """Оставляет в буфере последние CHAT_REPLAY_BUFFER_SIZE номеров"""
+    oldest_seq = max(ring) - CHAT_REPLAY_BUFFER_SIZE
+    return {seq: message_data for seq, message_data in ring.items() if seq > oldest_seq}
+
+
+def parse_seq(value):
+    """Приводит параметр клиента к номеру сообщения (или None)"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value >= 0 else None
+
+
+def allocate_chat_seq(chat_id, count=1):
+    """
+    Выдает count подряд идущих номеров сообщений чата и возвращает первый.
+    Вызывается в транзакции вставки: UPDATE держит блокировку строки чата
+    до коммита, а откат возвращает счетчик, поэтому номера идут без
+    пропусков и повторов.
+    """
+    Chat.objects.filter(id=chat_id).update(last_seq=F('last_seq') + count)
+    last_seq = Chat.objects.filter(id=chat_id).values_list('last_seq', flat=True).get()
+    return last_seq - count + 1
+
+
+def remember_chat_events(entries):
+    """
+    Дописывает сообщения в буферы их чатов: [(chat_id, seq, данные сообщения)].
+    На пачку — один get_many и один set_many по ключу на чат
+    """
+    if not entries:
+        return
+    by_chat = {}
+    for chat_id, seq, message_data in entries:
+        by_chat.setdefault(chat_id, {})[seq] = message_data
+    keys = {replay_key(chat_id): chat_id for chat_id in by_chat}
+    rings = cache.get_many(list(keys))
+    updated = {}
+    for key, chat_id in keys.items():
+        ring = dict(rings.get(key) or {})
+        ring.update(by_chat[chat_id])
+        updated[key] = _trim(ring)
+    cache.set_many(updated, CHAT_REPLAY_TTL)
+
+
+def _replace_buffered(chat_id, seq, message_data):
+    """Заменяет сообщение в буфере, если оно еще не вытеснено более новыми"""
+    key = replay_key(chat_id)
+    ring = cache.get(key)
+    if ring is not None and seq in ring:
+        ring[seq] = message_data
+        cache.set(key, ring, CHAT_REPLAY_TTL)
+
+
+def _serialize(message):
+    from .serializers import ChatMessageSerializer
+    return ChatMessageSerializer(message).data
+
+
+def remember_chat_message_on_commit(message):
+    """Новое сообщение, сохраненное через ChatMessage.save()"""
+    transaction.on_commit(
+        lambda: remember_chat_events([(message.chat_id, message.seq, _serialize(message))])
+    )
+
+
+def refresh_chat_message_on_commit(message):
+    """Отредактированное сообщение: догрузка отдаст новый текст"""
+    transaction.on_commit(lambda: _replace_buffered(message.chat_id, message.seq, _serialize(message)))
+
+
+def forget_chat_message_on_commit(chat_id, seq):
+    """Удаленное сообщение: номер остается занятым, но догрузка его пропускает"""
+    transaction.on_commit(lambda: _replace_buffered(chat_id, seq, None))
+
+
+def get_replay_messages(chat_id, last_seq, current_seq):
+    """
+    Сообщения с номерами last_seq + 1 .. current_seq из буфера по порядку.
+
+    Возвращает None, если часть из них уже вытеснена или потеряна (перед
+    найденным в буфере сообщением есть пропуск). Отсутствие только последних номеров — это сообщения,
+    которые записаны, но еще не разосланы: они придут в группу чата обычным
+    порядком, и догрузка заканчивается перед ними.
+    """
+    if current_seq <= last_seq:
+        return []
+    if current_seq - last_seq > CHAT_REPLAY_BUFFER_SIZE:
+        return None
+
+    ring = cache.get(replay_key(chat_id)) or {}
+
+    messages = []
+    replayed_seq = last_seq
+    for seq in range(last_seq + 1, current_seq + 1):
+        if seq not in ring:
+            # Еще не разослано либо вытеснено: решает следующее найденное
+            continue
+        if seq != replayed_seq + 1:
+            # Перед сообщением есть пропуск
+            return None
+        replayed_seq = seq
+        if ring[seq] is not None:
+            messages.append(ring[seq])
+
+    if replayed_seq == last_seq:
+        # В буфере ничего нет: вытесненное не отличить от неразосланного
+        return None
+    return messages
+
+
+def get_chat_replay(user_id, other_user_id, last_seq):
+    """
+    Догрузка для личного чата двух пользователей.
+    Возвращает (chat_id, current_seq, messages); chat_id None — чата еще нет,
+    messages None — разрыв больше буфера, нужна история по REST.
+    """
+    min_user_id, max_user_id = direct_chat_pair(user_id, other_user_id)
+    chat = Chat.objects.filter(
+        min_user_id=min_user_id, max_user_id=max_user_id
+    ).values_list('id', 'last_seq').first()
+    if chat is None:
+        return None, 0, []
+    chat_id, current_seq = chat
+    if last_seq is None:
+        return chat_id, current_seq, []
+    return chat_id, current_seq, get_replay_messages(chat_id, last_seq, current_seq)
@@ -0,0 +1,284 @@
+"""
+Групповая запись сообщений чата из WebSocket (group commit).
+
+Сообщения копятся несколько миллисекунд (CHAT_WRITE_BATCH_DELAY) или до
+CHAT_WRITE_BATCH_SIZE штук и сохраняются одной транзакцией за один переход
+в поток: вставка пачкой, одно обновление Chat и ChatMember на чат,
+уведомления пачкой. Затем каждое сообщение рассылается в группу чата
+в порядке id, и отправитель получает подтверждение. Номера сообщений
+в чате (seq) выдаются в той же транзакции, а сообщения попадают в буфер
+догрузки после переподключения (users.chat_replay).
+
+Пачки записываются строго по очереди, поэтому порядок сообщений внутри
+чата совпадает с порядком их поступления в процесс.
+"""
+import asyncio
+import logging
+import weakref
+from collections import OrderedDict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, models, transaction
+from django.db.models import Q
+
+from .models import Chat, ChatMessage, Notification
+from .serializers import ChatMessageSerializer, NotificationSerializer
+from .chat_inbox import record_new_messages
+from .chat_replay import allocate_chat_seq, remember_chat_events
+from .direct_chats import direct_chat_pair, get_or_create_direct_chat
+from .notification_cache import bump_notifications_version_on_commit
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# Сколько секунд ждать попутные сообщения и максимальный размер пачки
+CHAT_WRITE_BATCH_DELAY = getattr(settings, 'CHAT_WRITE_BATCH_DELAY', 0.005)
+CHAT_WRITE_BATCH_SIZE = getattr(settings, 'CHAT_WRITE_BATCH_SIZE', 100)
+
+
+class PendingMessage:
+    """Сообщение, ожидающее записи, и future для подтверждения отправителю"""
+
+    def __init__(self, sender, recipient_id, content, message_type, reply_to_id, future):
+        self.sender = sender
+        self.recipient_id = recipient_id
+        self.content = content
+        self.message_type = message_type
+        self.reply_to_id = reply_to_id
+        self.future = future
+        self.message = None
+        self.message_data = None
+
+
+def chat_group_name(user1_id, user2_id):
+    """Группа channel layer личного чата (как в ChatConsumer.join_chat)"""
+    min_user_id, max_user_id = direct_chat_pair(user1_id, user2_id)
+    return f"chat_{min_user_id}_{max_user_id}"
+
+
+def insert_rows(model, objects, key_fields=None):
+    """
+    Вставка пачкой. Если СУБД не возвращает id из bulk INSERT (MySQL), id
+    читаются обратно одним SELECT по уникальному ключу key_fields; без ключа
+    строки вставляются по одной в той же транзакции — коммит все равно один.
+    Переопределенный save() моделей не вызывается.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        model.objects.bulk_create(objects)
+        return
+    if key_fields is None:
+        for obj in objects:
+            models.Model.save(obj, force_insert=True)
+        return
+
+    model.objects.bulk_create(objects)
+    # Условия по каждому полю ключа отдельно могут захватить и чужие строки:
+    # они просто не найдутся среди ключей пачки
+    lookups = {
+        f'{field}__in': {getattr(obj, field) for obj in objects}
+        for field in key_fields
+    }
+    ids = {
+        tuple(row[:-1]): row[-1]
+        for row in model.objects.filter(**lookups).values_list(*key_fields, 'pk')
+    }
+    for obj in objects:
+        obj.pk = ids[tuple(getattr(obj, field) for field in key_fields)]
+
+
+def resolve_chats(items):
+    """Личные чаты для всех пар отправитель/получатель пачки: {пара: chat}"""
+    pairs = {direct_chat_pair(item.sender.id, item.recipient_id) for item in items}
+    if not pairs:
+        return {}
+
+    query = Q()
+    for min_user_id, max_user_id in pairs:
+        query |= Q(min_user_id=min_user_id, max_user_id=max_user_id)
+    chats = {(chat.min_user_id, chat.max_user_id): chat for chat in Chat.objects.filter(query)}
+
+    inactive = [chat.id for chat in chats.values() if not chat.is_active]
+    if inactive:
+        Chat.objects.filter(id__in=inactive).update(is_active=True)
+
+    for pair in pairs - set(chats):
+        chats[pair], _ = get_or_create_direct_chat(*pair)
+    return chats
+
+
+def persist_message_batch(items):
+    """
+    Сохраняет пачку сообщений одной транзакцией.
+    Возвращает данные уведомлений для рассылки: [(recipient_id, data)].
+    Сообщения с несуществующим получателем получают message_data = None.
+    """
+    recipient_ids = {item.recipient_id for item in items}
+    existing = set(User.objects.filter(id__in=recipient_ids).values_list('id', flat=True))
+    items = [item for item in items if item.recipient_id in existing]
+    if not items:
+        return []
+
+    chats = resolve_chats(items)
+
+    # Снимки цитат одним запросом; цитировать можно только сообщение того же чата
+    reply_ids = {item.reply_to_id for item in items if item.reply_to_id}
+    replies = {
+        reply.id: reply
+        for reply in ChatMessage.objects.filter(id__in=reply_ids).select_related('sender')
+    } if reply_ids else {}
+
+    by_chat = OrderedDict()
+    for item in items:
+        chat = chats[direct_chat_pair(item.sender.id, item.recipient_id)]
+        reply = replies.get(item.reply_to_id)
+        if reply and reply.chat_id != chat.id:
+            reply = None
+        item.message = ChatMessage(
+            chat=chat,
+            sender=item.sender,
+            content=item.content,
+            message_type=item.message_type,
+            reply_to_id=reply.id if reply else None,
+            reply_preview=reply.build_reply_preview() if reply else None,
+        )
+        by_chat.setdefault(chat.id, []).append(item.message)
+
+    notifications = []
+    with transaction.atomic():
+        # Номера в чатах выдаются в порядке id чатов, чтобы параллельные пачки
+        # блокировали строки Chat в одном порядке
+        for chat_id in sorted(by_chat):
+            first_seq = allocate_chat_seq(chat_id, len(by_chat[chat_id]))
+            for offset, message in enumerate(by_chat[chat_id]):
+                message.seq = first_seq + offset
+
+        insert_rows(ChatMessage, [item.message for item in items], key_fields=('chat_id', 'seq'))
+
+        for chat_id, messages in by_chat.items():
+            member_ids = record_new_messages(chat_id, messages)
+            for message in messages:
+                for user_id in member_ids:
+                    if user_id == message.sender_id:
+                        continue
+                    notifications.append(Notification(
+                        recipient_id=user_id,
+                        sender=message.sender,
+                        notification_type='message',
+                        message=f'{message.sender.first_name or message.sender.username} отправил вам сообщение в чате'
+                    ))
+
+        insert_rows(Notification, notifications)
+        for user_id in {notification.recipient_id for notification in notifications}:
+            bump_notifications_version_on_commit(user_id)
+
+    for item in items:
+        item.message_data = ChatMessageSerializer(item.message).data
+    # В буфер догрузки до рассылки: переподключившийся клиент получит сообщение
+    # либо из буфера, либо из группы чата
+    remember_chat_events([
+        (item.message.chat_id, item.message.seq, item.message_data) for item in items
+    ])
+
+    return [
+        (notification.recipient_id, NotificationSerializer(notification).data)
+        for notification in notifications
+    ]
+
+
+class ChatWriteBatcher:
+    """Очередь записи сообщений одного event loop"""
+
+    def __init__(self, channel_layer, delay=CHAT_WRITE_BATCH_DELAY, max_batch=CHAT_WRITE_BATCH_SIZE):
+        self.channel_layer = channel_layer
+        self.delay = delay
+        self.max_batch = max_batch
+        self.pending = []
+        self.batch_full = asyncio.Event()
+        self.flush_task = None
+
+    def enqueue(self, sender, recipient_id, content, message_type='text', reply_to_id=None):
+        """
+        Ставит сообщение в очередь без переключения задач: порядок вызовов
+        задает порядок записи. Возвращает future с сериализованным
+        сообщением (None, если получателя нет).
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(PendingMessage(sender, recipient_id, content, message_type, reply_to_id, future))
+
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.ensure_future(self.flush_loop())
+        elif len(self.pending) >= self.max_batch:
+            self.batch_full.set()
+        return future
+
+    async def submit(self, sender, recipient_id, content, message_type='text', reply_to_id=None):
+        """Ставит сообщение в очередь и ждет его записи и рассылки"""
+        return await self.enqueue(sender, recipient_id, content, message_type, reply_to_id)
+
+    async def flush_loop(self):
+        """Пока есть очередь: ждем попутные сообщения не дольше delay и пишем пачку"""
+        while self.pending:
+            if len(self.pending) < self.max_batch:
+                self.batch_full.clear()
+                try:
+                    await asyncio.wait_for(self.batch_full.wait(), self.delay)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self.pending[:self.max_batch]
+            self.pending = self.pending[self.max_batch:]
+            await self.flush(batch)
+
+    async def flush(self, batch):
+        try:
+            notifications = await database_sync_to_async(persist_message_batch)(batch)
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        # Рассылка в порядке записи сохраняет порядок сообщений в каждом чате.
+        # Строки уже закоммичены: сбой рассылки одного сообщения (брокер, Redis)
+        # не мешает остальным, и отправитель получает подтверждение в любом случае
+        for item in batch:
+            try:
+                if item.message_data is not None:
+                    await self.channel_layer.group_send(
+                        chat_group_name(item.sender.id, item.recipient_id),
+                        {
+                            'type': 'chat_message',
+                            'chat_id': item.message.chat_id,
+                            'message': item.message_data
+                        }
+                    )
+            except Exception:
+                logger.exception('Не удалось разослать сообщение %s', item.message.id)
+            finally:
+                if not item.future.done():
+                    item.future.set_result(item.message_data)
+
+        for recipient_id, notification_data in notifications:
+            try:
+                await self.channel_layer.group_send(
+                    f"notifications_{recipient_id}",
+                    {
+                        'type': 'notification_created',
+                        'notification': notification_data
+                    }
+                )
+            except Exception:
+                logger.exception('Не удалось разослать уведомление %s', notification_data.get('id'))
+
+
+_batchers = weakref.WeakKeyDictionary()
+
+
+def get_chat_write_batcher(channel_layer):
+    """Общий батчер для всех соединений текущего event loop"""
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = _batchers[loop] = ChatWriteBatcher(channel_layer)
+    return batcher
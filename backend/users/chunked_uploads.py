@@ -0,0 +1,285 @@
+"""
+Загрузка файлов частями с догрузкой после обрыва соединения.
+
+1. POST uploads/ — клиент сообщает имя, размер, MIME-тип и назначение
+   (chat_file или avatar) и получает id загрузки.
+2. PUT uploads/<id>/chunk/ с заголовком Upload-Offset — сырое тело
+   дописывается во временный файл CHUNKED_UPLOAD_DIR/<id>.part. Если
+   соединение оборвалось, клиент запрашивает GET uploads/<id>/ и
+   продолжает с возвращенного offset.
+3. POST uploads/<id>/complete/ — проверяется размер и (если клиент его
+   прислал) SHA-256, файл переносится в хранилище по содержимому
+   (users.media_store); если такой файл там уже есть, копия удаляется.
+4. Готовая загрузка прикладывается к сообщению (upload_id в MessageCreateView
+   и AsyncChatMessageCreateView) или становится аватаром.
+
+Тело части копируется блоками (core.chunked_storage), поэтому память
+воркера не зависит от размера файла. SHA-256 считается по ходу загрузки:
+состояние хэша хранится в памяти процесса между частями, а если следующая
+часть пришла в другой воркер, хэш восстанавливается чтением уже записанной
+части файла с диска.
+"""
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from asgiref.sync import sync_to_async
+
+from core.chunked_storage import append_chunk, hash_file, remove_quietly
+from .media_store import acquire_blob, ingest_file, is_blob_name, release_blob
+from .models import ChunkedUpload
+
+CHUNKED_UPLOAD_DIR = getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.MEDIA_ROOT, 'uploads_tmp'))
+CHUNKED_UPLOAD_MAX_SIZE = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 200 * 1024 * 1024)
+CHUNKED_UPLOAD_MAX_CHUNK = getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK', 8 * 1024 * 1024)
+CHUNKED_UPLOAD_EXPIRY_HOURS = getattr(settings, 'CHUNKED_UPLOAD_EXPIRY_HOURS', 24)
+
+UPLOAD_PURPOSES = dict(ChunkedUpload.PURPOSES)
+AVATAR_CONTENT_TYPES = ('image/',)
+
+# Состояние SHA-256 незавершенных загрузок этого процесса: {id: (offset, hasher)}
+HASHER_CACHE_SIZE = 256
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    """Ошибка загрузки с HTTP-статусом для ответа API"""
+
+    def __init__(self, message, status=400, upload=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.upload = upload
+
+
+def part_path(upload):
+    return os.path.join(CHUNKED_UPLOAD_DIR, f"{upload.id}.part")
+
+
+def serialize_upload(upload):
+    return {
+        'id': str(upload.id),
+        'filename': upload.filename,
+        'content_type': upload.content_type,
+        'purpose': upload.purpose,
+        'size': upload.size,
+        'offset': upload.offset,
+        'status': upload.status,
+        'sha256': upload.sha256 or None,
+    }
+
+
+def _take_hasher(upload):
+    """Хэш уже записанных байт: из памяти процесса или дочитыванием с диска"""
+    with _hashers_lock:
+        cached = _hashers.pop(upload.id, None)
+    if cached is not None and cached[0] == upload.offset:
+        return cached[1]
+    if upload.offset == 0:
+        return hashlib.sha256()
+    return hash_file(part_path(upload), upload.offset)
+
+
+def _keep_hasher(upload, hasher):
+    with _hashers_lock:
+        _hashers[upload.id] = (upload.offset, hasher)
+        while len(_hashers) > HASHER_CACHE_SIZE:
+            _hashers.popitem(last=False)
+
+
+def _forget_hasher(upload):
+    with _hashers_lock:
+        _hashers.pop(upload.id, None)
+
+
+def create_upload(user, filename, size, content_type='', purpose='chat_file'):
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('Не указан размер файла')
+    if size <= 0 or size > CHUNKED_UPLOAD_MAX_SIZE:
+        raise UploadError(f'Размер файла должен быть от 1 байта до {CHUNKED_UPLOAD_MAX_SIZE} байт')
+    if purpose not in UPLOAD_PURPOSES:
+        raise UploadError('Неизвестное назначение загрузки')
+    content_type = (content_type or '')[:100]
+    if purpose == 'avatar' and not content_type.startswith(AVATAR_CONTENT_TYPES):
+        raise UploadError('Аватар должен быть изображением')
+    return ChunkedUpload.objects.create(
+        user=user,
+        purpose=purpose,
+        filename=os.path.basename(filename or 'file')[:255],
+        content_type=content_type,
+        size=size,
+    )
+
+
+def get_upload(user, upload_id, for_update=False):
+    queryset = ChunkedUpload.objects.filter(id=upload_id, user=user)
+    if for_update:
+        queryset = queryset.select_for_update()
+    upload = queryset.first()
+    if upload is None:
+        raise UploadError('Загрузка не найдена', status=404)
+    return upload
+
+
+def append_to_upload(user, upload_id, offset, stream, length):
+    """
+    Дописывает часть из stream. offset — с какого байта клиент начинает
+    часть: он должен совпадать с уже загруженным, иначе 409 и текущий offset.
+    Строка загрузки заблокирована на время записи, поэтому параллельные
+    части одной загрузки выполняются по очереди.
+    """
+    try:
+        offset = int(offset)
+        length = int(length)
+    except (TypeError, ValueError):
+        raise UploadError('Нужны заголовки Upload-Offset и Content-Length')
+    if length <= 0 or length > CHUNKED_UPLOAD_MAX_CHUNK:
+        raise UploadError(f'Размер части должен быть от 1 до {CHUNKED_UPLOAD_MAX_CHUNK} байт')
+
+    with transaction.atomic():
+        upload = get_upload(user, upload_id, for_update=True)
+        if upload.status != 'uploading':
+            raise UploadError('Загрузка уже завершена', status=409, upload=upload)
+        if offset != upload.offset:
+            raise UploadError('Смещение не совпадает с загруженным', status=409, upload=upload)
+        if offset + length > upload.size:
+            raise UploadError('Часть выходит за объявленный размер файла', upload=upload)
+
+        hasher = _take_hasher(upload)
+        written = append_chunk(part_path(upload), offset, stream, length, hasher)
+        upload.offset = offset + written
+        upload.save(update_fields=['offset', 'updated_at'])
+    _keep_hasher(upload, hasher)
+    return upload
+
+
+def complete_upload(user, upload_id, expected_sha256=None):
+    """
+    Проверяет размер и хэш и переносит файл в хранилище. Пока загрузка не
+    приложена к сообщению или профилю, она сама держит ссылку на файл
+    """
+    with transaction.atomic():
+        upload = get_upload(user, upload_id, for_update=True)
+        if upload.status == 'complete':
+            return upload
+        if upload.offset != upload.size:
+            raise UploadError('Файл загружен не полностью', status=409, upload=upload)
+
+        hasher = _take_hasher(upload)
+        digest = hasher.hexdigest()
+        corrupted = bool(expected_sha256) and expected_sha256.lower() != digest
+        if corrupted:
+            # Содержимое испорчено: загрузку придется начать заново. Ошибка
+            # поднимается после транзакции, иначе удаление строки откатится
+            _forget_hasher(upload)
+            remove_quietly(part_path(upload))
+            upload.delete()
+        else:
+            blob = ingest_file(part_path(upload), digest, upload.size, upload.filename, upload.content_type)
+            acquire_blob(blob.name)
+            upload.status = 'complete'
+            upload.sha256 = digest
+            upload.stored_name = blob.name
+            upload.save(update_fields=['status', 'sha256', 'stored_name', 'updated_at'])
+    if corrupted:
+        raise UploadError('Контрольная сумма не совпадает', status=422)
+    return upload
+
+
+def _drop_upload_files(upload):
+    """Удаляет недокачанную часть или отпускает ссылку готовой загрузки на файл"""
+    _forget_hasher(upload)
+    if upload.status == 'uploading':
+        remove_quietly(part_path(upload))
+    elif is_blob_name(upload.stored_name):
+        release_blob(upload.stored_name)
+    else:
+        remove_quietly(os.path.join(settings.MEDIA_ROOT, upload.stored_name))
+
+
+def abort_upload(user, upload_id):
+    with transaction.atomic():
+        upload = get_upload(user, upload_id, for_update=True)
+        _drop_upload_files(upload)
+        upload.delete()
+
+
+def _completed_upload_queryset(user, upload_id, purpose):
+    try:
+        upload_id = uuid.UUID(str(upload_id))
+    except ValueError:
+        raise UploadError('Загрузка не найдена или не завершена', status=404)
+    return ChunkedUpload.objects.filter(id=upload_id, user=user, purpose=purpose, status='complete')
+
+
+def take_completed_upload(user, upload_id, purpose):
+    """
+    Забирает готовую загрузку для сохранения в модель: возвращает
+    (путь относительно MEDIA_ROOT, MIME-тип), строка загрузки удаляется
+    вместе со своей ссылкой на файл — ее заменит ссылка сохраненной модели.
+    Вызывается в транзакции сохранения сообщения или профиля.
+    """
+    upload = _completed_upload_queryset(user, upload_id, purpose).select_for_update().first()
+    if upload is None:
+        raise UploadError('Загрузка не найдена или не завершена', status=404)
+    upload.delete()
+    release_blob(upload.stored_name)
+    return upload.stored_name, upload.content_type
+
+
+async def atake_completed_upload(user, upload_id, purpose):
+    """Асинхронный вариант take_completed_upload для async-представлений"""
+    upload = await _completed_upload_queryset(user, upload_id, purpose).afirst()
+    if upload is None:
+        raise UploadError('Загрузка не найдена или не завершена', status=404)
+    deleted, _ = await ChunkedUpload.objects.filter(id=upload.id).adelete()
+    if not deleted:
+        # Загрузку одновременно забрал другой запрос
+        raise UploadError('Загрузка не найдена или не завершена', status=404)
+    # Файл без ссылок удаляется только через MEDIA_BLOB_GRACE_HOURS,
+    # поэтому сообщение успеет сослаться на него после освобождения
+    await sync_to_async(release_blob)(upload.stored_name)
+    return upload.stored_name, upload.content_type
+
+
+def message_type_for(content_type):
+    """Тип сообщения чата по MIME-типу файла (как в MessageCreateView)"""
+    if content_type.startswith('image/'):
+        return 'image'
+    if content_type.startswith('audio/'):
+        return 'voice'
+    return 'file'
+
+
+def purge_expired_uploads(expiry_hours=None, dry_run=False):
+    """
+    Удаляет загрузки без активности дольше срока: недокачанные части и
+    готовые файлы, которые так и не приложили к сообщению (их ссылка на
+    файл хранилища освобождается, сам файл удалит manage.py media_blobs).
+    Возвращает (число загрузок, освобождено байт недокачанных частей).
+    """
+    if expiry_hours is None:
+        expiry_hours = CHUNKED_UPLOAD_EXPIRY_HOURS
+    threshold = timezone.now() - timedelta(hours=expiry_hours)
+    count = 0
+    reclaimed = 0
+    for upload in ChunkedUpload.objects.filter(updated_at__lt=threshold).iterator():
+        count += 1
+        if upload.status == 'uploading':
+            path = part_path(upload)
+            reclaimed += os.path.getsize(path) if os.path.exists(path) else 0
+        if dry_run:
+            continue
+        _drop_upload_files(upload)
+        upload.delete()
+    return count, reclaimed
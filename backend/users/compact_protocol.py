@@ -0,0 +1,134 @@
+"""
+Компактный протокол WebSocket для мобильных клиентов.
+
+Клиент выбирает его подпротоколом COMPACT_SUBPROTOCOL
+(new WebSocket(url, ['bebyblog.msgpack.v1'])): события идут бинарными
+кадрами MessagePack, длинные ключи заменяются короткими по таблице
+SHORT_KEYS (sender_info -> si, reply_to_message -> rm), а служебные тексты
+вроде «Подключение к чату установлено» не отправляются. Ключи, которых нет
+в таблице, передаются как есть. Клиент может слать события и короткими,
+и полными ключами.
+
+Для этого подпротокола сервер принимает permessage-deflate (core.daphne_server).
+Без подпротокола все как раньше: JSON текстом.
+"""
+import json
+
+import msgpack
+
+COMPACT_SUBPROTOCOL = 'bebyblog.msgpack.v1'
+
+SHORT_KEYS = {
+    # Конверт событий
+    'type': 't',
+    'message': 'm',
+    'messages': 'ms',
+    'chat_id': 'ch',
+    'chat_group': 'g',
+    'client_id': 'k',
+    'user_id': 'u',
+    'user_ids': 'us',
+    'user_name': 'un',
+    'users': 'uz',
+    'typists': 'ty',
+    'seq': 'q',
+    'last_seq': 'lq',
+    'current_seq': 'cq',
+    'message_id': 'mi',
+    'last_read_message_id': 'lr',
+    'is_online': 'o',
+    'last_seen': 'ls',
+    'notification': 'n',
+    'notification_id': 'ni',
+    'success': 'ok',
+    # Сообщение чата (ChatMessageSerializer)
+    'id': 'i',
+    'content': 'c',
+    'message_type': 'mt',
+    'file_url': 'fu',
+    'file_size': 'fs',
+    'reply_to': 'rt',
+    'reply_to_message': 'rm',
+    'is_read': 'r',
+    'is_edited': 'e',
+    'created_at': 'ca',
+    'updated_at': 'ua',
+    'sender': 's',
+    'sender_name': 'sn',
+    'sender_avatar': 'sa',
+    'sender_info': 'si',
+    # Карточка пользователя (build_user_card)
+    'username': 'nm',
+    'first_name': 'fn',
+    'last_name': 'ln',
+    'avatar': 'av',
+    # Уведомление (NotificationSerializer)
+    'notification_type': 'nt',
+    'post': 'p',
+    'post_info': 'pi',
+    'title': 'ti',
+    'slug': 'sl',
+    'category': 'ct',
+}
+LONG_KEYS = {short: long for long, short in SHORT_KEYS.items()}
+
+# События, в которых поле message — текст для человека, а не данные
+STATUS_EVENTS = {'connection_established', 'joined_chat', 'left_chat'}
+
+
+class InvalidFrame(ValueError):
+    """Бинарный кадр не разбирается как MessagePack-объект"""
+
+
+def _rename_keys(value, keys):
+    # Рекурсия только во вложенные объекты и списки: скаляры копируются как есть
+    if type(value) is list:
+        return [_rename_keys(item, keys) if type(item) in (dict, list) else item for item in value]
+    get = keys.get
+    return {
+        get(key, key): _rename_keys(item, keys) if type(item) in (dict, list) else item
+        for key, item in value.items()
+    }
+
+
+def encode_compact(event):
+    """Событие -> бинарный кадр компактного протокола"""
+    if event.get('type') in STATUS_EVENTS and isinstance(event.get('message'), str):
+        event = {key: value for key, value in event.items() if key != 'message'}
+    return msgpack.packb(_rename_keys(event, SHORT_KEYS), use_bin_type=True)
+
+
+def decode_compact(frame):
+    """Бинарный кадр клиента -> событие с полными ключами"""
+    try:
+        event = msgpack.unpackb(frame, raw=False)
+    except Exception as e:
+        raise InvalidFrame(str(e))
+    if not isinstance(event, dict):
+        raise InvalidFrame('Ожидается объект')
+    return _rename_keys(event, LONG_KEYS)
+
+
+class CompactProtocolMixin:
+    """
+    Выбор формата событий для AsyncWebsocketConsumer: accept_protocol()
+    вместо accept(), send_event() вместо send(text_data=json.dumps(...)),
+    decode_event() для входящих кадров
+    """
+    compact = False
+
+    async def accept_protocol(self):
+        self.compact = COMPACT_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        await self.accept(COMPACT_SUBPROTOCOL if self.compact else None)
+
+    async def send_event(self, event):
+        if self.compact:
+            await self.send(bytes_data=encode_compact(event))
+        else:
+            await self.send(text_data=json.dumps(event))
+
+    def decode_event(self, text_data=None, bytes_data=None):
+        """Текстовый кадр — всегда JSON, бинарный — MessagePack"""
+        if bytes_data is not None:
+            return decode_compact(bytes_data)
+        return json.loads(text_data)
@@ -1,16 +1,28 @@
 import json
 import asyncio
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from django.utils import timezone
-from .models import Chat, ChatMessage, Notification
-from .serializers import ChatMessageSerializer, NotificationSerializer
+from .models import Notification
+from .notification_cache import bump_notifications_version_on_commit
+from .chat_write_batcher import chat_group_name, get_chat_write_batcher
+from .chat_receipts import ReadReceiptBatcher
+from .chat_replay import get_chat_replay, parse_seq
+from .compact_protocol import CompactProtocolMixin, InvalidFrame
+from .channel_groups import start_group_refresh, stop_group_refresh
+from .typing_indicators import get_typing_coordinator
+from .presence import (
+    PRESENCE_MAX_SUBSCRIPTIONS,
+    get_presence_snapshot,
+    get_presence_tracker,
+    presence_group_name,
+)
 
 User = get_user_model()
 
 
-class ChatConsumer(AsyncWebsocketConsumer):
+class ChatConsumer(CompactProtocolMixin, AsyncWebsocketConsumer):
     async def connect(self):
         # Получаем токен из query параметров
         token = self.scope.get('query_string', b'').decode('utf-8')
@@ -42,207 +54,347 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
-        await self.accept()
+        # Отметки о прочтении копятся и пишутся пачкой
+        self.read_receipts = ReadReceiptBatcher(self.user.id, self.channel_layer)
+        # Отправки, ожидающие записи батчером
+        self.send_tasks = set()
+        # Пользователи, чей статус клиент показывает на экране
+        self.presence_subscriptions = set()
+        self.presence = get_presence_tracker(self.channel_layer)
+        await self.presence.connect(self.user.id)
+        # События печати прореживаются и объединяются на сервере
+        self.typing_indicators = get_typing_coordinator(self.channel_layer)
+        # Номер последнего полученного сообщения при переподключении (?last_seq=):
+        # относится к первому join_chat без своего last_seq
+        self.handshake_last_seq = parse_seq(
+            parse_qs(self.scope.get('query_string', b'').decode('utf-8')).get('last_seq', [None])[0]
+        )
+        # {chat_id: номер}: сообщения до него клиент уже получил при догрузке
+        self.replayed_seqs = {}
+        # Членство в группах истекает — продлеваем, пока соединение открыто
+        start_group_refresh(self, self.get_group_names)
+        
+        await self.accept_protocol()
         
         # Отправляем подтверждение подключения
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'connection_established',
             'message': 'Подключение к чату установлено'
-        }))
+        })
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'user_group_name'):
+            return
+        
+        stop_group_refresh(self)
+        
+        if hasattr(self, 'read_receipts'):
+            await self.read_receipts.close()
+        
+        if hasattr(self, 'presence'):
+            await self.update_presence_subscriptions(set())
+            await self.presence.disconnect(self.user.id)
+        
+        if hasattr(self, 'chat_group_name'):
+            await self.typing_indicators.stop(self.chat_group_name, self.user.id)
+        
         # Покидаем группу пользователя
         await self.channel_layer.group_discard(
             self.user_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
+    def get_group_names(self):
+        """Группы, в которых сейчас состоит соединение"""
+        groups = [self.user_group_name]
+        if hasattr(self, 'chat_group_name'):
+            groups.append(self.chat_group_name)
+        groups.extend(presence_group_name(user_id) for user_id in self.presence_subscriptions)
+        return groups
+
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
+            data = self.decode_event(text_data, bytes_data)
             message_type = data.get('type')
             
-            if message_type == 'join_chat':
+            if message_type == 'mark_read':
+                await self.mark_read(data)
+            elif message_type == 'join_chat':
                 await self.join_chat(data)
             elif message_type == 'leave_chat':
                 await self.leave_chat(data)
             elif message_type == 'send_message':
-                await self.send_message(data)
+                # Не ждем записи: следующие сообщения соединения попадут в ту же пачку,
+                # порядок сохраняет очередь батчера
+                task = asyncio.ensure_future(self.send_message(data))
+                self.send_tasks.add(task)
+                task.add_done_callback(self.send_tasks.discard)
             elif message_type == 'typing':
                 await self.typing(data)
             elif message_type == 'stop_typing':
                 await self.stop_typing(data)
+            elif message_type == 'ping':
+                self.presence.touch(self.user.id)
+                await self.send_event({'type': 'pong'})
+            elif message_type == 'presence_subscribe':
+                await self.presence_subscribe(data)
                 
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
+        except (json.JSONDecodeError, InvalidFrame):
+            await self.send_event({
                 'type': 'error',
-                'message': 'Неверный формат JSON'
-            }))
+                'message': 'Неверный формат сообщения'
+            })
         except Exception as e:
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'error',
                 'message': str(e)
-            }))
+            })
 
     async def join_chat(self, data):
         """Присоединиться к чату"""
         user_id = data.get('user_id')
         if not user_id:
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'error',
                 'message': 'ID пользователя не указан'
-            }))
+            })
             return
         
         # Создаем группу для чата
-        chat_group_name = f"chat_{min(self.user.id, int(user_id))}_{max(self.user.id, int(user_id))}"
+        group_name = chat_group_name(self.user.id, int(user_id))
+        
+        # Индикатор печати в прежнем чате завершается
+        if hasattr(self, 'chat_group_name') and self.chat_group_name != group_name:
+            await self.typing_indicators.stop(self.chat_group_name, self.user.id)
         
         # Присоединяемся к группе чата
         await self.channel_layer.group_add(
-            chat_group_name,
+            group_name,
             self.channel_name
         )
         
         # Сохраняем имя группы чата
-        self.chat_group_name = chat_group_name
+        self.chat_group_name = group_name
         
-        await self.send(text_data=json.dumps({
+        # Догрузка пропущенного после переподключения: вступаем в группу до чтения
+        # буфера, а то, что придет в группу повторно, отсекается по replayed_seqs
+        last_seq = parse_seq(data.get('last_seq'))
+        if last_seq is None:
+            last_seq = self.handshake_last_seq
+        self.handshake_last_seq = None
+        chat_id, current_seq, missed = await database_sync_to_async(get_chat_replay)(
+            self.user.id, int(user_id), last_seq
+        )
+        
+        await self.send_event({
             'type': 'joined_chat',
-            'chat_group': chat_group_name,
+            'chat_group': group_name,
+            'chat_id': chat_id,
+            'last_seq': current_seq,
             'message': 'Вы присоединились к чату'
-        }))
+        })
+        
+        if last_seq is None or chat_id is None:
+            return
+        if missed is None:
+            # Разрыв больше буфера: клиент догружает историю по REST (after_id)
+            await self.send_event({
+                'type': 'replay_gap',
+                'chat_id': chat_id,
+                'last_seq': last_seq,
+                'current_seq': current_seq
+            })
+            return
+        self.replayed_seqs[chat_id] = missed[-1]['seq'] if missed else last_seq
+        if missed:
+            await self.send_event({
+                'type': 'replay',
+                'chat_id': chat_id,
+                'messages': missed
+            })
 
     async def leave_chat(self, data):
         """Покинуть чат"""
         if hasattr(self, 'chat_group_name'):
+            await self.typing_indicators.stop(self.chat_group_name, self.user.id)
             await self.channel_layer.group_discard(
                 self.chat_group_name,
                 self.channel_name
             )
             delattr(self, 'chat_group_name')
             
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'left_chat',
                 'message': 'Вы покинули чат'
-            }))
+            })
 
     async def send_message(self, data):
-        """Отправить сообщение"""
+        """
+        Отправить сообщение. Выполняется отдельной задачей, которую receive
+        не ждет, поэтому ошибки отправляются клиенту здесь
+        """
+        try:
+            await self._send_message(data)
+        except Exception as e:
+            await self.send_event({
+                'type': 'error',
+                'message': str(e)
+            })
+
+    async def _send_message(self, data):
         user_id = data.get('user_id')
         content = data.get('content', '')
         message_type = data.get('message_type', 'text')
         reply_to = data.get('reply_to')
         
         if not user_id or not content:
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'error',
                 'message': 'Не указан получатель или содержимое сообщения'
-            }))
+            })
+            return
+        try:
+            recipient_id = int(user_id)
+        except (TypeError, ValueError):
+            await self.send_event({
+                'type': 'error',
+                'message': 'Неверный ID получателя'
+            })
             return
         
-        # Создаем сообщение в базе данных
-        message_data = await self.create_message(
-            user_id, content, message_type, reply_to
-        )
+        # Сообщение встает в очередь батчера до первого await: send_message
+        # каждого кадра — отдельная задача, и любое переключение до постановки
+        # в очередь перемешало бы порядок (и seq) сообщений соединения.
+        # Батчер запишет его пачкой вместе с соседними и разошлет участникам чата
+        batcher = get_chat_write_batcher(self.channel_layer)
+        pending = batcher.enqueue(self.user, recipient_id, content, message_type, reply_to)
         
-        if message_data:
-            # Отправляем сообщение всем участникам чата
-            chat_group_name = f"chat_{min(self.user.id, int(user_id))}_{max(self.user.id, int(user_id))}"
-            
-            await self.channel_layer.group_send(
-                chat_group_name,
-                {
-                    'type': 'chat_message',
-                    'message': message_data
-                }
-            )
+        # Отправленное сообщение завершает индикатор печати отправителя
+        await self.typing_indicators.stop(chat_group_name(self.user.id, recipient_id), self.user.id)
+        
+        message_data = await pending
+        if message_data is None:
+            await self.send_event({
+                'type': 'error',
+                'message': 'Получатель не найден'
+            })
+            return
+        
+        await self.send_event({
+            'type': 'message_sent',
+            'client_id': data.get('client_id'),
+            'message': message_data
+        })
 
     async def typing(self, data):
-        """Пользователь печатает"""
+        """Пользователь печатает (в группу уходит не чаще раза в интервал)"""
         user_id = data.get('user_id')
         if user_id and hasattr(self, 'chat_group_name'):
-            await self.channel_layer.group_send(
+            await self.typing_indicators.typing(
                 self.chat_group_name,
-                {
-                    'type': 'user_typing',
-                    'user_id': self.user.id,
-                    'user_name': self.user.first_name or self.user.username
-                }
+                self.user.id,
+                self.user.first_name or self.user.username
             )
 
     async def stop_typing(self, data):
         """Пользователь перестал печатать"""
         user_id = data.get('user_id')
         if user_id and hasattr(self, 'chat_group_name'):
-            await self.channel_layer.group_send(
-                self.chat_group_name,
-                {
-                    'type': 'user_stop_typing',
-                    'user_id': self.user.id
-                }
-            )
+            await self.typing_indicators.stop(self.chat_group_name, self.user.id)
+
+    async def mark_read(self, data):
+        """Клиент дочитал чат до message_id"""
+        try:
+            chat_id = int(data.get('chat_id'))
+            message_id = int(data.get('message_id'))
+        except (TypeError, ValueError):
+            await self.send_event({
+                'type': 'error',
+                'message': 'Не указан чат или сообщение'
+            })
+            return
+        self.read_receipts.add(chat_id, message_id)
+
+    async def presence_subscribe(self, data):
+        """
+        Клиент сообщает, чьи статусы у него на экране (список заменяет прежний).
+        В ответ — текущие статусы, дальше только изменения по этим пользователям
+        """
+        try:
+            user_ids = [int(user_id) for user_id in data.get('user_ids', [])]
+        except (TypeError, ValueError):
+            await self.send_event({
+                'type': 'error',
+                'message': 'Неверный список пользователей'
+            })
+            return
+        user_ids = list(dict.fromkeys(user_ids))[:PRESENCE_MAX_SUBSCRIPTIONS]
+
+        await self.update_presence_subscriptions(set(user_ids))
+        snapshot = await database_sync_to_async(get_presence_snapshot)(user_ids)
+        await self.send_event({
+            'type': 'presence_snapshot',
+            'users': [{'user_id': user_id, **snapshot[user_id]} for user_id in user_ids]
+        })
+
+    async def update_presence_subscriptions(self, user_ids):
+        """Вступает в группы presence_<id> новых пользователей и покидает лишние"""
+        for user_id in self.presence_subscriptions - user_ids:
+            await self.channel_layer.group_discard(presence_group_name(user_id), self.channel_name)
+        for user_id in user_ids - self.presence_subscriptions:
+            await self.channel_layer.group_add(presence_group_name(user_id), self.channel_name)
+        self.presence_subscriptions = user_ids
+
+    async def presence_changed(self, event):
+        """Пользователь из подписки появился в сети или вышел"""
+        await self.send_event({
+            'type': 'presence',
+            'user_id': event['user_id'],
+            'is_online': event['is_online'],
+            'last_seen': event['last_seen']
+        })
+
+    async def messages_read(self, event):
+        """Собеседник прочитал сообщения до last_read_message_id"""
+        await self.send_event({
+            'type': 'messages_read',
+            'chat_id': event['chat_id'],
+            'user_id': event['user_id'],
+            'last_read_message_id': event['last_read_message_id']
+        })
 
     async def chat_message(self, event):
         """Получить сообщение чата"""
         message = event['message']
-        await self.send(text_data=json.dumps({
+        if message.get('seq', 0) <= self.replayed_seqs.get(event.get('chat_id'), 0):
+            # Уже отправлено клиенту при догрузке
+            return
+        await self.send_event({
             'type': 'new_message',
             'message': message
-        }))
+        })
 
     async def user_typing(self, event):
-        """Пользователь печатает"""
-        if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps({
+        """Печатают один или несколько участников (себя не показываем)"""
+        typists = [
+            typist for typist in event.get('typists', [event])
+            if typist['user_id'] != self.user.id
+        ]
+        if typists:
+            await self.send_event({
                 'type': 'user_typing',
-                'user_id': event['user_id'],
-                'user_name': event['user_name']
-            }))
+                'user_id': typists[0]['user_id'],
+                'user_name': typists[0]['user_name'],
+                'typists': typists
+            })
 
     async def user_stop_typing(self, event):
         """Пользователь перестал печатать"""
         if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'user_stop_typing',
                 'user_id': event['user_id']
-            }))
-
-    @database_sync_to_async
-    def create_message(self, user_id, content, message_type, reply_to):
-        """Создать сообщение в базе данных"""
-        try:
-            other_user = User.objects.get(id=user_id)
-            
-            # Получаем или создаем чат
-            chat, created = Chat.objects.get_or_create(
-                participants__in=[self.user, other_user],
-                defaults={'is_active': True}
-            )
-            if created:
-                chat.participants.add(self.user, other_user)
-            
-            # Создаем сообщение
-            message = ChatMessage.objects.create(
-                chat=chat,
-                sender=self.user,
-                content=content,
-                message_type=message_type,
-                reply_to_id=reply_to
-            )
-            
-            # Обновляем время последнего обновления чата
-            chat.updated_at = timezone.now()
-            chat.save()
-            
-            # Сериализуем сообщение
-            serializer = ChatMessageSerializer(message)
-            return serializer.data
-            
-        except User.DoesNotExist:
-            return None
-        except Exception as e:
-            print(f"Ошибка создания сообщения: {e}")
-            return None
+            })
 
     @database_sync_to_async
     def get_user_from_token(self, token):
@@ -267,7 +419,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return None
 
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+class NotificationConsumer(CompactProtocolMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope["user"]
         if not self.user.is_authenticated:
@@ -282,25 +434,31 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             self.notification_group_name,
             self.channel_name
         )
+        start_group_refresh(self, lambda: [self.notification_group_name])
         
-        await self.accept()
+        await self.accept_protocol()
         
         # Отправляем подтверждение подключения
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'connection_established',
             'message': 'Подключение к уведомлениям установлено'
-        }))
+        })
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'notification_group_name'):
+            return
+        
+        stop_group_refresh(self)
+        
         # Покидаем группу уведомлений
         await self.channel_layer.group_discard(
             self.notification_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
+            data = self.decode_event(text_data, bytes_data)
             message_type = data.get('type')
             
             if message_type == 'mark_notification_read':
@@ -308,51 +466,51 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             elif message_type == 'mark_all_read':
                 await self.mark_all_notifications_read()
                 
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
+        except (json.JSONDecodeError, InvalidFrame):
+            await self.send_event({
                 'type': 'error',
-                'message': 'Неверный формат JSON'
-            }))
+                'message': 'Неверный формат сообщения'
+            })
         except Exception as e:
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'error',
                 'message': str(e)
-            }))
+            })
 
     async def notification_created(self, event):
         """Получить новое уведомление"""
         notification = event['notification']
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'new_notification',
             'notification': notification
-        }))
+        })
 
     async def notification_updated(self, event):
         """Обновление уведомления"""
         notification = event['notification']
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'notification_updated',
             'notification': notification
-        }))
+        })
 
     async def mark_notification_read(self, data):
         """Отметить уведомление как прочитанное"""
         notification_id = data.get('notification_id')
         if notification_id:
             success = await self.mark_notification_as_read(notification_id)
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'notification_marked_read',
                 'success': success,
                 'notification_id': notification_id
-            }))
+            })
 
     async def mark_all_notifications_read(self):
         """Отметить все уведомления как прочитанные"""
         success = await self.mark_all_as_read()
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'all_notifications_marked_read',
             'success': success
-        }))
+        })
 
     @database_sync_to_async
     def mark_notification_as_read(self, notification_id):
@@ -363,7 +521,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                 recipient=self.user
             )
             notification.is_read = True
-            notification.save()
+            notification.save(update_fields=['is_read'])
             return True
         except Notification.DoesNotExist:
             return False
@@ -376,6 +534,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                 recipient=self.user,
                 is_read=False
             ).update(is_read=True)
+            bump_notifications_version_on_commit(self.user.id)
             return True
         except Exception:
             return False
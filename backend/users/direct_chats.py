@@ -0,0 +1,45 @@
+"""
+Личные чаты, адресуемые канонической парой участников (min_user_id, max_user_id).
+Поиск — одно чтение по уникальному индексу, создание безопасно при гонке
+REST- и WebSocket-запросов.
+"""
+from django.db import IntegrityError, transaction
+
+from .models import Chat
+from .chat_inbox import ensure_chat_members
+
+
+def direct_chat_pair(user1_id, user2_id):
+    """Каноническая пара id: меньший первым"""
+    return min(user1_id, user2_id), max(user1_id, user2_id)
+
+
+def find_direct_chat(user1_id, user2_id):
+    """Личный чат двух пользователей или None"""
+    min_user_id, max_user_id = direct_chat_pair(user1_id, user2_id)
+    return Chat.objects.filter(min_user_id=min_user_id, max_user_id=max_user_id).first()
+
+
+def get_or_create_direct_chat(user1_id, user2_id):
+    """
+    Возвращает (chat, created). Если параллельный запрос успел создать
+    чат первым, уникальный индекс отклонит вставку и вернется его чат.
+    Неактивный чат снова становится активным.
+    """
+    min_user_id, max_user_id = direct_chat_pair(user1_id, user2_id)
+
+    chat = find_direct_chat(min_user_id, max_user_id)
+    if chat is None:
+        try:
+            with transaction.atomic():
+                chat = Chat.objects.create(min_user_id=min_user_id, max_user_id=max_user_id)
+                chat.participants.add(min_user_id, max_user_id)
+                ensure_chat_members(chat, [min_user_id, max_user_id])
+            return chat, True
+        except IntegrityError:
+            chat = Chat.objects.get(min_user_id=min_user_id, max_user_id=max_user_id)
+
+    if not chat.is_active:
+        Chat.objects.filter(id=chat.id).update(is_active=True)
+        chat.is_active = True
+    return chat, False
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.media_pool import MEDIA_WORKERS
+from users.voice_analysis import analyze_pending_audio
+
+
+class Command(BaseCommand):
+    help = (
+        'Считает длительность и огибающую аудиофайлов хранилища, для которых '
+        'их еще нет (переполнение очереди при загрузке, импорт старых файлов)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Файлов в одной порции')
+        parser.add_argument('--loop', type=int, default=0, help='Повторять каждые N секунд (фоновый режим)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Процессов в пуле: {MEDIA_WORKERS}')
+        while True:
+            total = 0
+            while True:
+                started = time.perf_counter()
+                count = analyze_pending_audio(limit=options['batch_size'])
+                if not count:
+                    break
+                total += count
+                self.stdout.write(f'- {count} файлов за {time.perf_counter() - started:.1f} с')
+            self.stdout.write(self.style.SUCCESS(f'Проанализировано аудиофайлов: {total}'))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,176 @@
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.channel_broker import ChannelBroker, UnixSocketChannelLayer
+
+FANOUT_GROUP = 'fanout_benchmark'
+
+
+def make_layer(backend, address, capacity):
+    """Channel layer, общий для всех процессов замера"""
+    if backend == 'redis':
+        from channels_redis.core import RedisChannelLayer
+        return RedisChannelLayer(hosts=[address], capacity=capacity, prefix='fanout_benchmark')
+    return UnixSocketChannelLayer(path=address, capacity=capacity)
+
+
+def run_broker(path, capacity):
+    asyncio.run(ChannelBroker(path=path, capacity=capacity).serve_forever())
+
+
+async def subscribe_and_measure(layer, subscribers, messages, ready, timeout):
+    """Подписывает каналы на группу и замеряет задержку доставки каждого сообщения"""
+    channels = [await layer.new_channel() for _ in range(subscribers)]
+    for channel in channels:
+        await layer.group_add(FANOUT_GROUP, channel)
+    ready.put(os.getpid())
+
+    latencies = []
+
+    async def consume(channel):
+        for _ in range(messages):
+            message = await layer.receive(channel)
+            latencies.append(time.time() - message['sent_at'])
+
+    tasks = [asyncio.ensure_future(consume(channel)) for channel in channels]
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    for channel in channels:
+        await layer.group_discard(FANOUT_GROUP, channel)
+    return latencies
+
+
+def run_subscriber_worker(backend, address, capacity, subscribers, messages, timeout, ready, results):
+    """Процесс-воркер: свой event loop и свое соединение с channel layer, как у daphne"""
+    layer = make_layer(backend, address, capacity)
+    latencies = asyncio.run(subscribe_and_measure(layer, subscribers, messages, ready, timeout))
+    results.put(latencies)
+
+
+async def publish(layer, messages, rate):
+    """Рассылает messages сообщений в группу с заданной частотой"""
+    interval = 1.0 / rate if rate else 0
+    started = time.perf_counter()
+    for seq in range(messages):
+        await layer.group_send(FANOUT_GROUP, {
+            'type': 'fanout.message',
+            'seq': seq,
+            'sent_at': time.time(),
+        })
+        if interval:
+            delay = started + (seq + 1) * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    return time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный замер рассылки в группу channel layer: несколько '
+        'процессов-подписчиков (как воркеры daphne), задержка доставки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=['broker', 'redis'], default='broker',
+                            help='broker — локальный брокер по Unix-сокету, redis — channels-redis')
+        parser.add_argument('--socket', help='Сокет запущенного брокера (по умолчанию поднимается временный)')
+        parser.add_argument('--redis-url', default=os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+        parser.add_argument('--workers', type=int, default=4, help='Процессов-подписчиков')
+        parser.add_argument('--subscribers', type=int, default=100, help='Каналов в каждом процессе')
+        parser.add_argument('--messages', type=int, default=200, help='Сообщений в группу')
+        parser.add_argument('--rate', type=float, default=100, help='Сообщений в секунду (0 — без паузы)')
+        parser.add_argument('--capacity', type=int, default=1000, help='Емкость очереди канала')
+        parser.add_argument('--timeout', type=float, default=60, help='Предельное время замера, сек')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('Нужен хотя бы один процесс-подписчик')
+
+        context = multiprocessing.get_context('spawn')
+        broker_process = None
+        backend = options['backend']
+
+        if backend == 'redis':
+            address = options['redis_url']
+        elif options['socket']:
+            address = options['socket']
+        else:
+            address = os.path.join(tempfile.mkdtemp(prefix='fanout-'), 'channels.sock')
+            broker_process = context.Process(target=run_broker, args=(address, options['capacity']), daemon=True)
+            broker_process.start()
+            self.wait_for_socket(address)
+
+        ready = context.Queue()
+        results = context.Queue()
+        workers = [
+            context.Process(
+                target=run_subscriber_worker,
+                args=(
+                    backend, address, options['capacity'], options['subscribers'],
+                    options['messages'], options['timeout'], ready, results
+                ),
+            )
+            for _ in range(options['workers'])
+        ]
+        try:
+            for worker in workers:
+                worker.start()
+            for _ in workers:
+                ready.get(timeout=options['timeout'])
+
+            layer = make_layer(backend, address, options['capacity'])
+            elapsed = asyncio.run(publish(layer, options['messages'], options['rate']))
+
+            latencies = []
+            for _ in workers:
+                latencies.extend(results.get(timeout=options['timeout'] + 10))
+            for worker in workers:
+                worker.join()
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            if broker_process is not None:
+                broker_process.terminate()
+                broker_process.join()
+
+        self.report(options, elapsed, latencies)
+
+    def wait_for_socket(self, path, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(path):
+            if time.monotonic() > deadline:
+                raise CommandError(f'Брокер не создал сокет {path}')
+            time.sleep(0.05)
+
+    def report(self, options, elapsed, latencies):
+        expected = options['workers'] * options['subscribers'] * options['messages']
+        self.stdout.write(
+            f'{options["backend"]}: процессов {options["workers"]}, '
+            f'каналов {options["workers"] * options["subscribers"]}, сообщений {options["messages"]}'
+        )
+        self.stdout.write(
+            f'доставлено {len(latencies)} из {expected} '
+            f'за {elapsed:.2f} с публикации ({len(latencies) / elapsed:.0f} доставок/с)'
+        )
+        if not latencies:
+            return
+        latencies.sort()
+
+        def percentile(value):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * value))] * 1000
+
+        self.stdout.write(
+            f'задержка, мс: mean {statistics.mean(latencies) * 1000:.2f}, '
+            f'p50 {percentile(0.5):.2f}, p95 {percentile(0.95):.2f}, '
+            f'p99 {percentile(0.99):.2f}, max {latencies[-1] * 1000:.2f}'
+        )
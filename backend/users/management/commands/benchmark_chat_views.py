@@ -0,0 +1,198 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import AsyncRequestFactory, RequestFactory
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.models import Chat, ChatMessage, User
+from users.serializers import ChatMessageSerializer
+from users.views import ChatDetailView, ChatInboxView
+from users.async_chat_views import AsyncChatListView, AsyncChatMessagesView
+from users.chat_history import get_chat_history
+from users.chat_inbox import get_inbox_page, get_read_cursors, serialize_inbox_entry
+from users.chat_receipts import mark_chat_read_and_notify
+from users.direct_chats import get_or_create_direct_chat
+
+
+def mark_read_and_get_cursors(chat, user_id):
+    mark_chat_read_and_notify(chat, user_id)
+    return get_read_cursors(chat.id)
+
+
+class LegacyChatListView(APIView):
+    """Прежняя схема: синхронный APIView и asyncio.run на каждый шаг"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        page = asyncio.run(sync_to_async(get_inbox_page)(request.user, None, 50))
+        chats = asyncio.run(sync_to_async(
+            lambda: [serialize_inbox_entry(member, request) for member in page['results']]
+        )())
+        return Response({'success': True, 'chats': chats})
+
+
+class LegacyChatMessagesView(APIView):
+    """Прежняя схема для истории сообщений (пять вызовов asyncio.run)"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, user_id):
+        other_user = asyncio.run(sync_to_async(User.objects.get)(id=user_id))
+        chat, created = asyncio.run(sync_to_async(get_or_create_direct_chat)(request.user.id, other_user.id))
+        history = asyncio.run(sync_to_async(get_chat_history)(chat, limit=20))
+        read_cursors = asyncio.run(sync_to_async(mark_read_and_get_cursors)(chat, request.user.id))
+        messages = asyncio.run(sync_to_async(
+            lambda: ChatMessageSerializer(
+                history['messages'], many=True,
+                context={'request': request, 'read_cursors': read_cursors}
+            ).data
+        )())
+        return Response({'success': True, 'messages': messages, 'chat_id': chat.id})
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает чатовые REST-представления: синхронные, прежние '
+        '"async" (asyncio.run) и асинхронные на event loop'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на вариант')
+        parser.add_argument('--concurrency', type=int, default=10, help='Одновременных запросов')
+        parser.add_argument('--messages', type=int, default=200, help='Сообщений в тестовом чате')
+        parser.add_argument('--chats', type=int, default=20, help='Чатов у тестового пользователя')
+
+    def handle(self, *args, **options):
+        user, peer, chat = self.create_fixtures(options['chats'], options['messages'])
+        try:
+            auth = f'Bearer {AccessToken.for_user(user)}'
+            total = options['requests']
+            concurrency = options['concurrency']
+
+            factory = RequestFactory()
+            async_factory = AsyncRequestFactory()
+
+            sync_list = ChatInboxView.as_view()
+            sync_detail = ChatDetailView.as_view()
+            legacy_list = LegacyChatListView.as_view()
+            legacy_messages = LegacyChatMessagesView.as_view()
+            async_list = AsyncChatListView.as_view()
+            async_messages = AsyncChatMessagesView.as_view()
+
+            def sync_get(view, path, **kwargs):
+                return lambda: view(factory.get(path, HTTP_AUTHORIZATION=auth), **kwargs)
+
+            def async_get(view, path, **kwargs):
+                return lambda: view(async_factory.get(path, headers={'Authorization': auth}), **kwargs)
+
+            self.stdout.write(
+                f'{total} запросов на вариант, параллельно {concurrency}; '
+                f'чатов {options["chats"]}, сообщений в чате {options["messages"]}'
+            )
+            self.stdout.write(f'{"вариант":<28}{"req/s":>10}{"mean, мс":>12}{"p95, мс":>12}')
+
+            scenarios = [
+                ('список: sync', 'sync', sync_get(sync_list, '/api/users/chats/inbox/')),
+                ('список: asyncio.run', 'sync', sync_get(legacy_list, '/api/users/async/chats/')),
+                ('список: async', 'async', async_get(async_list, '/api/users/async/chats/')),
+                ('история: sync', 'sync', sync_get(
+                    sync_detail, f'/api/users/chats/{chat.id}/?page_size=20', chat_id=chat.id
+                )),
+                ('история: asyncio.run', 'sync', sync_get(
+                    legacy_messages, f'/api/users/async/chats/{peer.id}/messages/', user_id=peer.id
+                )),
+                ('история: async', 'async', async_get(
+                    async_messages, f'/api/users/async/chats/{peer.id}/messages/', user_id=peer.id
+                )),
+            ]
+            for label, kind, call in scenarios:
+                if kind == 'async':
+                    elapsed, latencies = asyncio.run(self.run_async(call, total, concurrency))
+                else:
+                    elapsed, latencies = self.run_threads(call, total, concurrency)
+                self.report(label, total, elapsed, latencies)
+        finally:
+            self.delete_fixtures(user, peer)
+
+    def run_threads(self, call, total, concurrency):
+        """Синхронные варианты: пул потоков, как у WSGI-воркера с потоками"""
+        def timed(_):
+            started = time.perf_counter()
+            response = call()
+            self.check_response(response)
+            latency = time.perf_counter() - started
+            close_old_connections()
+            return latency
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(timed, range(total)))
+        return time.perf_counter() - started, latencies
+
+    async def run_async(self, call, total, concurrency):
+        """Асинхронный вариант: concurrency корутин в одном event loop"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await call()
+                self.check_response(response)
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(timed() for _ in range(total)))
+        return time.perf_counter() - started, latencies
+
+    def check_response(self, response):
+        if response.status_code != 200:
+            raise RuntimeError(f'Ответ {response.status_code}: {getattr(response, "data", response.content)}')
+
+    def report(self, label, total, elapsed, latencies):
+        latencies = sorted(latencies)
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        self.stdout.write(
+            f'{label:<28}{total / elapsed:>10.1f}'
+            f'{statistics.mean(latencies) * 1000:>12.2f}{p95 * 1000:>12.2f}'
+        )
+
+    def create_fixtures(self, chats, messages):
+        """Тестовые пользователи и чаты (удаляются после замера)"""
+        stamp = int(time.time() * 1000)
+
+        def make_user(suffix):
+            return User.objects.create_user(
+                username=f'bench_{stamp}_{suffix}',
+                email=f'bench_{stamp}_{suffix}@bench.local',
+                password=None
+            )
+
+        user = make_user('main')
+        peer = make_user('peer')
+        chat, _ = get_or_create_direct_chat(user.id, peer.id)
+        for index in range(messages):
+            ChatMessage.objects.create(
+                chat=chat,
+                sender=peer if index % 2 else user,
+                content=f'Сообщение {index}'
+            )
+
+        for index in range(chats - 1):
+            other = make_user(index)
+            other_chat, _ = get_or_create_direct_chat(user.id, other.id)
+            ChatMessage.objects.create(chat=other_chat, sender=other, content='Привет')
+
+        return user, peer, chat
+
+    def delete_fixtures(self, user, peer):
+        prefix = user.username.rsplit('_', 1)[0]
+        users = User.objects.filter(username__startswith=f'{prefix}_')
+        Chat.objects.filter(participants__in=users).delete()
+        users.delete()
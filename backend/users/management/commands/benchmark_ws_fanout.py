@@ -0,0 +1,118 @@
+import asyncio
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.ws_fanout import FanoutHub, POLICY_DISCONNECT
+
+
+class FakeSocket:
+    """Соединение с заданной задержкой отправки кадра"""
+
+    def __init__(self, delay, deliveries):
+        self.delay = delay
+        self.deliveries = deliveries
+        self.closed_with = None
+
+    async def send(self, text):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        else:
+            await asyncio.sleep(0)
+        if not self.delay:
+            self.deliveries.append((json.loads(text)['sent_at'], time.perf_counter()))
+
+    async def close(self, code):
+        self.closed_with = code
+
+
+async def legacy_broadcast(sockets, message):
+    """Прежняя схема: json.dumps и await send по очереди для каждого клиента"""
+    for socket in sockets:
+        await socket.send(json.dumps(message))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает рассылку в комнату WebSocket: прежняя последовательная '
+        'и core.ws_fanout (очереди и писатели) при одном медленном клиенте'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000', help='Размеры комнат через запятую')
+        parser.add_argument('--messages', type=int, default=20, help='Сообщений в комнату')
+        parser.add_argument('--slow-delay', type=float, default=0.05, help='Задержка медленного клиента, сек')
+        parser.add_argument('--interval', type=float, default=0.02, help='Пауза между сообщениями, сек')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(
+            f'{options["messages"]} сообщений в комнату, один клиент отправляет кадр '
+            f'{options["slow_delay"] * 1000:.0f} мс; задержка доставки быстрым клиентам '
+            f'и время вызова рассылки, мс'
+        )
+        self.stdout.write(
+            f'{"клиентов":>10}{"схема":>14}{"mean":>10}{"p95":>10}{"max":>10}{"рассылка":>12}'
+        )
+        for size in sizes:
+            for label, runner in (('прежняя', self.run_legacy), ('fanout', self.run_fanout)):
+                latencies, publish_times = asyncio.run(runner(
+                    size, options['messages'], options['slow_delay'], options['interval']
+                ))
+                self.report(size, label, latencies, publish_times)
+
+    async def publish(self, broadcast, messages, interval):
+        """Сообщения с заданным интервалом; возвращает время каждого вызова рассылки"""
+        started = time.perf_counter()
+        publish_times = []
+        for seq in range(messages):
+            sent_at = time.perf_counter()
+            await broadcast({'type': 'chat_message', 'seq': seq, 'sent_at': sent_at})
+            publish_times.append(time.perf_counter() - sent_at)
+            delay = started + (seq + 1) * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        return publish_times
+
+    async def run_legacy(self, size, messages, slow_delay, interval):
+        deliveries = []
+        sockets = [FakeSocket(slow_delay, deliveries)] + [FakeSocket(0, deliveries) for _ in range(size - 1)]
+
+        async def broadcast(message):
+            await legacy_broadcast(sockets, message)
+
+        publish_times = await self.publish(broadcast, messages, interval)
+        return [received - sent for sent, received in deliveries], publish_times
+
+    async def run_fanout(self, size, messages, slow_delay, interval):
+        deliveries = []
+        hub = FanoutHub(max_queue=messages * 2, send_timeout=1.0, slow_consumer_policy=POLICY_DISCONNECT)
+        sockets = [FakeSocket(slow_delay, deliveries)] + [FakeSocket(0, deliveries) for _ in range(size - 1)]
+        connections = []
+        for user_id, socket in enumerate(sockets):
+            connection = hub.register(user_id, socket.send, socket.close)
+            hub.join('room', connection)
+            connections.append(connection)
+
+        async def broadcast(message):
+            hub.broadcast('room', message)
+
+        publish_times = await self.publish(broadcast, messages, interval)
+
+        expected = (size - 1) * messages
+        while len(deliveries) < expected:
+            await asyncio.sleep(0.001)
+        for connection in connections:
+            hub.unregister(connection)
+        return [received - sent for sent, received in deliveries], publish_times
+
+    def report(self, size, label, latencies, publish_times):
+        latencies = sorted(latencies)
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        self.stdout.write(
+            f'{size:>10}{label:>14}{statistics.mean(latencies) * 1000:>10.2f}'
+            f'{p95 * 1000:>10.2f}{latencies[-1] * 1000:>10.2f}'
+            f'{statistics.mean(publish_times) * 1000:>12.2f}'
+        )
@@ -0,0 +1,93 @@
+import json
+import random
+import time
+import zlib
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.daphne_server import DEFLATE_MEM_LEVEL, DEFLATE_WINDOW_BITS
+from users.compact_protocol import encode_compact
+from users.models import Chat, ChatMessage, User
+from users.serializers import ChatMessageSerializer
+
+WORDS = (
+    'привет как дела завтра идем к педиатру напомни взять карту прививок ок смотри '
+    'что нашла про прикорм в 6 месяцев очень подробно расписано по неделям спасибо '
+    'малыш спит плохо зубки режутся гуляли в парке купили коляску 😊 👍'
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает JSON и компактный протокол WebSocket (users.compact_protocol): '
+        'байт на событие new_message с permessage-deflate и без, время кодирования'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000, help='Сколько событий кодировать')
+
+    def handle(self, *args, **options):
+        events = self.build_events(options['messages'])
+        self.stdout.write(f'{len(events)} событий new_message, байт на событие и мкс на кодирование')
+        self.stdout.write(f'{"формат":>24}{"байт":>10}{"мкс":>10}')
+
+        def encode_json(event):
+            return json.dumps(event).encode()
+
+        for label, encode, wbits, mem_level in (
+            ('json', encode_json, None, None),
+            ('json + deflate', encode_json, 15, 8),
+            ('compact', encode_compact, None, None),
+            ('compact + deflate', encode_compact, DEFLATE_WINDOW_BITS, DEFLATE_MEM_LEVEL),
+        ):
+            size, elapsed = self.measure(events, encode, wbits, mem_level)
+            self.stdout.write(
+                f'{label:>24}{size / len(events):>10.1f}{elapsed / len(events) * 1e6:>10.2f}'
+            )
+
+    def build_events(self, count):
+        """События в том виде, в каком их рассылает батчер (сообщения не сохраняются)"""
+        rng = random.Random(1)
+        texts = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 25))) for _ in range(count)]
+        sender = User(id=1, username='anna_mama', first_name='Анна', last_name='Смирнова')
+        chat = Chat(id=1)
+        now = timezone.now()
+        events = []
+        for index in range(count):
+            message = ChatMessage(
+                id=index + 1,
+                seq=index + 1,
+                chat=chat,
+                sender=sender,
+                content=texts[index],
+                created_at=now,
+                updated_at=now,
+            )
+            if index % 4 == 3:
+                message.reply_to_id = index
+                message.reply_preview = {
+                    'id': index,
+                    'content': texts[index - 1],
+                    'sender_name': 'Борис',
+                    'message_type': 'text',
+                }
+            events.append({'type': 'new_message', 'message': ChatMessageSerializer(message).data})
+        # Данные сериализатора содержат ReturnDict и OrderedDict — как в consumers
+        return json.loads(json.dumps(events))
+
+    def measure(self, events, encode, wbits, mem_level):
+        """Поток одного соединения: контекст deflate общий для всех кадров"""
+        compressor = None
+        if wbits is not None:
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -wbits, mem_level)
+        size = 0
+        started = time.perf_counter()
+        for event in events:
+            frame = encode(event)
+            if compressor is not None:
+                # Хвост 00 00 ff ff не передается (RFC 7692)
+                frame = compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                frame = frame[:-4]
+            size += len(frame)
+        return size, time.perf_counter() - started
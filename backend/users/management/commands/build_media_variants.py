@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.media_pool import MEDIA_WORKERS
+from users.media_variants import build_pending_variants
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит превью изображений хранилища, для которых их еще нет '
+        '(переполнение очереди при загрузке, импорт старых файлов)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Изображений в одной порции')
+        parser.add_argument('--loop', type=int, default=0, help='Повторять каждые N секунд (фоновый режим)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Процессов в пуле: {MEDIA_WORKERS}')
+        while True:
+            total = 0
+            while True:
+                started = time.perf_counter()
+                count = build_pending_variants(limit=options['batch_size'])
+                if not count:
+                    break
+                total += count
+                self.stdout.write(f'- {count} изображений за {time.perf_counter() - started:.1f} с')
+            self.stdout.write(self.style.SUCCESS(f'Построены превью: {total}'))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
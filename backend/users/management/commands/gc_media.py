@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.media_gc import MEDIA_GC_QUARANTINE_DIR, MediaGCError, collect_orphans
+from users.media_store import MEDIA_BLOB_GRACE_HOURS
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаление файлов MEDIA_ROOT, на которые не ссылается ни одна строка БД '
+        '(по cron); --quarantine — перенести вместо удаления'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=int, default=MEDIA_BLOB_GRACE_HOURS,
+            help='Не трогать файлы моложе стольких часов'
+        )
+        parser.add_argument(
+            '--quarantine', action='store_true',
+            help=f'Переносить файлы в {MEDIA_GC_QUARANTINE_DIR} вместо удаления'
+        )
+        parser.add_argument(
+            '--fastapi-database', default=None,
+            help='URL БД FastAPI (main.py): ее файлы сообщений тоже считаются ссылками'
+        )
+        parser.add_argument(
+            '--without-fastapi', action='store_true',
+            help='FastAPI не пишет в этот MEDIA_ROOT: запуск без его БД'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, ничего не менять')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        try:
+            stats = collect_orphans(
+                grace_hours=options['grace_hours'],
+                dry_run=dry_run,
+                quarantine=options['quarantine'],
+                fastapi_database_url=options['fastapi_database'],
+                without_fastapi=options['without_fastapi'],
+            )
+        except MediaGCError as error:
+            raise CommandError(str(error))
+        self.stdout.write(
+            f'Просмотрено файлов: {stats["scanned"]}, '
+            f'без ссылок, но моложе {options["grace_hours"]} ч: {stats["recent"]}'
+        )
+        if dry_run:
+            label = 'Найдено файлов без ссылок'
+        elif options['quarantine']:
+            label = 'Перенесено в карантин'
+        else:
+            label = 'Удалено файлов без ссылок'
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: {stats["orphans"]}, освобождено {stats["reclaimed"] / (1024 * 1024):.1f} МБ'
+        ))
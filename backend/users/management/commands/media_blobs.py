@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from users.media_store import (
+    MEDIA_BLOB_GRACE_HOURS,
+    import_legacy_files,
+    purge_unreferenced_blobs,
+    recount_blob_references,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Обслуживание хранилища файлов по содержимому: пересчет ссылок и удаление '
+        'файлов без ссылок (по cron), --import — перенос старых файлов в хранилище'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--import', dest='import_legacy', action='store_true',
+            help='Перенести файлы, сохраненные до хранилища, удалив одинаковые копии'
+        )
+        parser.add_argument(
+            '--grace-hours', type=int, default=MEDIA_BLOB_GRACE_HOURS,
+            help='Сколько часов хранить файл без ссылок'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, ничего не менять')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if options['import_legacy']:
+            stats = import_legacy_files(dry_run=dry_run)
+            self.stdout.write(
+                f'Старых файлов: {stats.get("files", 0)}, одинаковых копий: {stats.get("duplicates", 0)} '
+                f'({stats.get("reclaimed", 0) / (1024 * 1024):.1f} МБ)'
+            )
+
+        fixed = recount_blob_references(dry_run=dry_run)
+        self.stdout.write(f'Исправлено счетчиков ссылок: {fixed}')
+
+        count, reclaimed = purge_unreferenced_blobs(options['grace_hours'], dry_run=dry_run)
+        label = 'Найдено файлов без ссылок' if dry_run else 'Удалено файлов без ссылок'
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: {count}, освобождено {reclaimed / (1024 * 1024):.1f} МБ'
+        ))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from users.notification_retention import (
+    partitioning_supported,
+    is_partitioned,
+    build_partitioning_sql,
+    ensure_future_partitions,
+)
+
+
+class Command(BaseCommand):
+    help = 'Переводит таблицу уведомлений на помесячные партиции (только MySQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3, help='Сколько будущих месяцев создать')
+        parser.add_argument('--apply', action='store_true', help='Выполнить SQL (по умолчанию только печать)')
+
+    def handle(self, *args, **options):
+        if not partitioning_supported():
+            raise CommandError('Партиционирование поддерживается только для MySQL')
+
+        if is_partitioned():
+            created = ensure_future_partitions(options['months_ahead'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Таблица уже партиционирована, новых партиций: {len(created)}'
+            ))
+            return
+
+        statements = build_partitioning_sql(options['months_ahead'])
+        for sql in statements:
+            self.stdout.write(f'{sql};')
+
+        if not options['apply']:
+            self.stdout.write(self.style.WARNING('Запустите с --apply, чтобы выполнить SQL'))
+            return
+
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+        self.stdout.write(self.style.SUCCESS('Таблица уведомлений партиционирована'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from users.chunked_uploads import CHUNKED_UPLOAD_EXPIRY_HOURS, purge_expired_uploads
+
+
+class Command(BaseCommand):
+    help = 'Удаляет брошенные загрузки частями: недокачанные файлы и неприложенные к сообщениям (по cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=CHUNKED_UPLOAD_EXPIRY_HOURS,
+            help='Сколько часов загрузка может простаивать'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, ничего не удалять')
+
+    def handle(self, *args, **options):
+        count, reclaimed = purge_expired_uploads(options['hours'], dry_run=options['dry_run'])
+        label = 'Найдено брошенных загрузок' if options['dry_run'] else 'Удалено загрузок'
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: {count}, освобождено {reclaimed / (1024 * 1024):.1f} МБ'
+        ))
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.notification_retention import (
+    purge_expired_notifications,
+    get_retention_days,
+    is_partitioned,
+    ensure_future_partitions,
+    drop_expired_partitions,
+)
+
+
+class Command(BaseCommand):
+    help = 'Удаляет просроченные уведомления порциями (запускается по cron или в цикле)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Строк в одной порции')
+        parser.add_argument('--pause', type=float, default=None, help='Пауза между порциями, сек')
+        parser.add_argument('--max-batches', type=int, default=None, help='Ограничение числа порций за запуск')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, ничего не удалять')
+        parser.add_argument('--loop', type=int, default=0, help='Повторять каждые N секунд (фоновый режим)')
+
+    def handle(self, *args, **options):
+        while True:
+            self.run_once(options)
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
+
+    def run_once(self, options):
+        retention = ', '.join(f'{t}={d}д' for t, d in get_retention_days().items())
+        self.stdout.write(f'Сроки хранения: {retention}')
+
+        if not options['dry_run'] and is_partitioned():
+            created = ensure_future_partitions()
+            if created:
+                self.stdout.write(f'Созданы партиции: {", ".join(created)}')
+            for name, count in drop_expired_partitions().items():
+                self.stdout.write(f'Удалена партиция {name}: {count} строк')
+
+        purged = purge_expired_notifications(
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            max_batches=options['max_batches'],
+            dry_run=options['dry_run'],
+        )
+
+        for notification_type, count in purged.items():
+            self.stdout.write(f'- {notification_type}: {count}')
+
+        label = 'Найдено просроченных' if options['dry_run'] else 'Удалено уведомлений'
+        self.stdout.write(self.style.SUCCESS(f'{label}: {sum(purged.values())}'))
@@ -0,0 +1,41 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.channel_broker import DEFAULT_SOCKET_PATH, ChannelBroker
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает локальный брокер channel layer на Unix-сокете '
+        '(общие группы для нескольких ASGI-воркеров без Redis)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            default=getattr(settings, 'CHANNEL_BROKER_SOCKET', None) or DEFAULT_SOCKET_PATH,
+            help='Путь к Unix-сокету'
+        )
+        parser.add_argument('--capacity', type=int, default=100, help='Сообщений в очереди канала')
+        parser.add_argument('--expiry', type=int, default=60, help='Срок жизни сообщения в очереди, сек')
+        parser.add_argument(
+            '--group-expiry',
+            type=int,
+            default=getattr(settings, 'CHANNEL_GROUP_EXPIRY', 86400),
+            help='Срок членства в группе, сек'
+        )
+
+    def handle(self, *args, **options):
+        broker = ChannelBroker(
+            path=options['socket'],
+            capacity=options['capacity'],
+            expiry=options['expiry'],
+            group_expiry=options['group_expiry'],
+        )
+        self.stdout.write(f'Брокер каналов слушает {options["socket"]}')
+        try:
+            asyncio.run(broker.serve_forever())
+        except KeyboardInterrupt:
+            self.stdout.write('Брокер остановлен')
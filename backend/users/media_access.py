@@ -0,0 +1,122 @@
+"""
+Права доступа к файлам хранилища по содержимому (users.media_views).
+
+Имя файла хранилища задает его содержимое (blobs/ab/<sha256>...), поэтому
+URL файла не меняется и кэшируется на год. Файл, который сейчас чей-то
+аватар, публичный. Вложения чатов открываются только по ссылке с
+подписью: сериализатор сообщения добавляет к URL номер чата, метку времени
+и подпись (?c=<чат>&t=<метка>&s=<подпись>). Ссылка действует
+CHAT_MEDIA_URL_MAX_AGE секунд и пока файл приложен к сообщению этого чата;
+клиент получает новые ссылки вместе с историей. Если запрос несет JWT
+(fetch из приложения), кроме того проверяется, что пользователь —
+участник чата.
+
+Подпись привязана к чату, а не к пользователю: сообщение сериализуется
+один раз для всех участников (рассылка по WebSocket, буфер догрузки
+users.chat_replay), а тег <img>/<audio> не передает токен. Поэтому
+утекшая ссылка открывается кем угодно, но только до истечения срока.
+Метка округляется до часа: в течение часа URL файла не меняется, и
+браузер берет его из кэша.
+"""
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core import signing
+
+from core.image_variants import EXTENSION_CONTENT_TYPES
+from .media_store import is_blob_name
+from .models import Chat, ChatMessage, MediaBlob, User
+from .user_cards import absolute_url
+
+CHAT_MEDIA_URL_MAX_AGE = getattr(settings, 'CHAT_MEDIA_URL_MAX_AGE', 24 * 3600)
+_TIMESTAMP_STEP = 3600
+
+
+class _HourlyTimestampSigner(signing.TimestampSigner):
+    """Подпись с меткой, округленной до часа"""
+
+    def timestamp(self):
+        return signing.b62_encode(int(time.time()) // _TIMESTAMP_STEP * _TIMESTAMP_STEP)
+
+
+_signer = _HourlyTimestampSigner(salt='users.media_access')
+_DIGEST = re.compile(r'[0-9a-f]{64}')
+
+
+class MediaAccessError(Exception):
+    """Файл не отдается: HTTP-статус для ответа"""
+
+    def __init__(self, message, status=404):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def sign_chat_media(chat_id, name):
+    """(метка, подпись) ссылки на файл name в чате chat_id"""
+    timestamp, signature = _signer.sign(f"{chat_id}:{name}").rsplit(':', 2)[1:]
+    return timestamp, signature
+
+
+def check_chat_media_signature(chat_id, name, timestamp, signature):
+    try:
+        _signer.unsign(f"{chat_id}:{name}:{timestamp}:{signature}", max_age=CHAT_MEDIA_URL_MAX_AGE)
+    except signing.SignatureExpired:
+        raise MediaAccessError('Срок действия ссылки истек', 403)
+    except signing.BadSignature:
+        raise MediaAccessError('Недействительная ссылка', 403)
+
+
+def chat_media_url(file, chat_id, request=None, name=None):
+    """URL вложения сообщения (или его превью name) с подписью чата"""
+    if not file:
+        return None
+    name = name or file.name
+    url = absolute_url(file.storage.url(name), request)
+    if not is_blob_name(name):
+        # Старые файлы вне хранилища отдаются из /media/ как раньше
+        return url
+    timestamp, signature = sign_chat_media(chat_id, name)
+    return f"{url}?c={chat_id}&t={timestamp}&s={signature}"
+
+
+def resolve_media(name):
+    """
+    MediaBlob и MIME-тип файла name — оригинала или его производной.
+    Имя сверяется с БД, поэтому путь за пределы хранилища не пройдет
+    """
+    digest = _DIGEST.match(os.path.basename(name))
+    if not is_blob_name(name) or not digest:
+        raise MediaAccessError('Файл не найден')
+    blob = MediaBlob.objects.filter(sha256=digest.group()).first()
+    if blob is None:
+        raise MediaAccessError('Файл не найден')
+    if name == blob.name:
+        return blob, blob.content_type or 'application/octet-stream'
+    if name in (blob.variants or {}).values():
+        extension = os.path.splitext(name)[1]
+        return blob, EXTENSION_CONTENT_TYPES.get(extension, 'application/octet-stream')
+    raise MediaAccessError('Файл не найден')
+
+
+def check_media_access(blob, name, chat_id=None, timestamp=None, signature=None, user=None):
+    """
+    True — файл публичный (аватар), False — вложение, доступное по этой
+    ссылке; иначе MediaAccessError
+    """
+    if chat_id is None:
+        if User.objects.filter(avatar=blob.name).exists():
+            return True
+        raise MediaAccessError('Файл не найден')
+    chat_id = str(chat_id)
+    if not chat_id.isdigit() or not timestamp or not signature:
+        raise MediaAccessError('Недействительная ссылка', 403)
+    check_chat_media_signature(chat_id, name, timestamp, signature)
+    if user is not None and not Chat.objects.filter(id=chat_id, participants=user).exists():
+        raise MediaAccessError('Нет доступа к чату', 403)
+    # Удаленное сообщение (или замененный файл) закрывает доступ по старой ссылке
+    if not ChatMessage.objects.filter(chat_id=chat_id, blob=blob).exists():
+        raise MediaAccessError('Файл не найден')
+    return False
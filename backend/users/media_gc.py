@@ -0,0 +1,200 @@
+"""
+Сборка мусора в MEDIA_ROOT: файлы, на которые не ссылается ни одна
+строка БД (manage.py gc_media).
+
+Такие файлы остаются после удалений, которые не проходят через delete()
+моделей (каскады, QuerySet.delete(), удаление сообщений в FastAPI), после
+сбоев посреди записи (blobs/tmp/*.part) и от старых версий кода, которые
+не удаляли замененные аватары.
+
+Дерево файлов (core.media_tree.walk_files) и ссылки из БД читаются
+потоками в одном порядке и сравниваются слиянием. Ссылки выбираются
+страницами по REFERENCE_CHUNK_SIZE с бинарной сортировкой (порядок
+кодовых точек, как у строк Python): сортировка по умолчанию в MySQL
+не различает регистр и разошлась бы с порядком обхода каталогов.
+
+Ссылкой считаются:
+- файлы хранилища MediaBlob и их превью (в том числе с ref_count = 0 —
+  их удаляет manage.py media_blobs после MEDIA_BLOB_GRACE_HOURS);
+- ChatMessage.file, User.avatar и ChunkedUpload.stored_name, включая
+  старые имена вне хранилища (chat_files/, avatars/);
+- файлы сообщений FastAPI (message_files), если задана его БД.
+
+Файл моложе grace_hours не трогается: его строка в БД могла еще не
+закоммититься.
+
+FastAPI пишет в тот же MEDIA_ROOT (messages/, blobs/ без строки MediaBlob),
+поэтому без его БД сборка не запускается: иначе все его файлы сочлись бы
+мусором. Если FastAPI не развернут, это подтверждается явно (without_fastapi).
+"""
+import heapq
+import os
+import shutil
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.db.models.functions import Collate
+
+from core.chunked_storage import remove_quietly
+from core.media_tree import unreferenced, walk_files
+from .media_store import MEDIA_BLOB_GRACE_HOURS
+from .models import ChatMessage, ChunkedUpload, MediaBlob, User
+
+MEDIA_GC_QUARANTINE_DIR = getattr(
+    settings, 'MEDIA_GC_QUARANTINE_DIR', os.path.join(settings.BASE_DIR, 'media_quarantine')
+)
+MEDIA_GC_FASTAPI_DATABASE_URL = getattr(settings, 'MEDIA_GC_FASTAPI_DATABASE_URL', '')
+
+REFERENCE_CHUNK_SIZE = 2000
+
+
+class MediaGCError(Exception):
+    """Сборку нельзя запускать с такими настройками"""
+
+# Бинарная сортировка строк (порядок кодовых точек) по СУБД
+BINARY_COLLATIONS = {
+    'mysql': 'utf8mb4_bin',
+    'postgresql': 'C',
+    'sqlite': 'BINARY',
+}
+
+
+def _sorted_rows(queryset, field, *extra):
+    """Строки (field, *extra) по возрастанию field в бинарном порядке, страницами"""
+    collation = BINARY_COLLATIONS.get(connections[queryset.db].vendor)
+    queryset = (
+        queryset.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+        .alias(gc_key=Collate(F(field), collation) if collation else F(field))
+        .order_by('gc_key')
+        .values_list(field, *extra)
+    )
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(gc_key__gt=last)
+        rows = list(page[:REFERENCE_CHUNK_SIZE])
+        if not rows:
+            return
+        yield from rows
+        last = rows[-1][0]
+
+
+def _names(queryset, field):
+    for row in _sorted_rows(queryset, field):
+        yield row[0]
+
+
+def _blob_names():
+    # Превью начинаются с того же хэша, что и оригинал, поэтому соседствуют
+    # с ним в общем порядке: достаточно отсортировать имена одного файла
+    for name, variants in _sorted_rows(MediaBlob.objects.all(), 'name', 'variants'):
+        yield from sorted([name, *(variants or {}).values()])
+
+
+def fastapi_references(database_url):
+    """Файлы сообщений FastAPI (пути 'media/...') относительно MEDIA_ROOT"""
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_url)
+    collation = BINARY_COLLATIONS.get(engine.dialect.name)
+    key = 'mf.file_path'
+    if engine.dialect.name == 'postgresql':
+        key = f'{key} COLLATE "{collation}"'
+    elif collation:
+        key = f'{key} COLLATE {collation}'
+    # Строки файлов удаленных сообщений FastAPI остаются: учитываются только живые
+    query = (
+        f"SELECT mf.file_path FROM message_files mf JOIN messages m ON m.id = mf.message_id "
+        f"WHERE {key} > :last ORDER BY {key} LIMIT {REFERENCE_CHUNK_SIZE}"
+    )
+    last = ''
+    try:
+        with engine.connect() as db:
+            while True:
+                paths = [row[0] for row in db.execute(text(query), {'last': last})]
+                if not paths:
+                    return
+                for path in paths:
+                    if path.startswith('media/'):
+                        yield path[len('media/'):]
+                last = paths[-1]
+    finally:
+        engine.dispose()
+
+
+def referenced_names(fastapi_database_url=None):
+    """Все имена файлов, на которые есть ссылки, по возрастанию (с повторами)"""
+    streams = [
+        _blob_names(),
+        _names(ChatMessage.objects.all(), 'file'),
+        _names(User.objects.all(), 'avatar'),
+        _names(ChunkedUpload.objects.filter(status='complete'), 'stored_name'),
+    ]
+    if fastapi_database_url:
+        streams.append(fastapi_references(fastapi_database_url))
+    return heapq.merge(*streams)
+
+
+def skipped_directories():
+    """Каталоги MEDIA_ROOT, которыми управляют другие механизмы"""
+    skip = []
+    for directory in (settings.CHUNKED_UPLOAD_DIR, MEDIA_GC_QUARANTINE_DIR):
+        relative = os.path.relpath(directory, settings.MEDIA_ROOT)
+        if not relative.startswith('..'):
+            skip.append(relative.replace(os.sep, '/'))
+    return skip
+
+
+def quarantine_file(name):
+    """Переносит файл в MEDIA_GC_QUARANTINE_DIR с тем же относительным путем"""
+    target = os.path.join(MEDIA_GC_QUARANTINE_DIR, name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.move(os.path.join(settings.MEDIA_ROOT, name), target)
+
+
+def collect_orphans(grace_hours=None, dry_run=False, quarantine=False, fastapi_database_url=None,
+                    without_fastapi=False):
+    """
+    Удаляет (или переносит в карантин) файлы без ссылок старше grace_hours.
+    Возвращает {'scanned', 'orphans', 'reclaimed', 'recent'}: просмотрено
+    файлов, удалено (найдено при dry_run), освобождено байт и пропущено
+    слишком новых файлов без ссылок.
+    Без БД FastAPI — MediaGCError, если не передан without_fastapi
+    """
+    if grace_hours is None:
+        grace_hours = MEDIA_BLOB_GRACE_HOURS
+    if fastapi_database_url is None:
+        fastapi_database_url = MEDIA_GC_FASTAPI_DATABASE_URL
+    if not fastapi_database_url and not without_fastapi:
+        raise MediaGCError(
+            'Не задана БД FastAPI (FASTAPI_DATABASE_URL или --fastapi-database): '
+            'его файлы сообщений были бы удалены. Если FastAPI не использует '
+            'этот MEDIA_ROOT, запустите с --without-fastapi'
+        )
+    if without_fastapi:
+        fastapi_database_url = None
+    threshold = time.time() - grace_hours * 3600
+    stats = Counter()
+
+    def counted(files):
+        for file in files:
+            stats['scanned'] += 1
+            yield file
+
+    files = counted(walk_files(settings.MEDIA_ROOT, skip=skipped_directories()))
+    for name, size, mtime in unreferenced(files, referenced_names(fastapi_database_url)):
+        if mtime >= threshold:
+            stats['recent'] += 1
+            continue
+        if not dry_run:
+            if quarantine:
+                quarantine_file(name)
+            else:
+                remove_quietly(os.path.join(settings.MEDIA_ROOT, name))
+        stats['orphans'] += 1
+        stats['reclaimed'] += size
+    for key in ('scanned', 'orphans', 'reclaimed', 'recent'):
+        stats.setdefault(key, 0)
+    return dict(stats)
@@ -0,0 +1,86 @@
+"""
+Пул процессов для обработки медиафайлов вне запроса: превью изображений
+(users.media_variants) и анализ голосовых сообщений (users.voice_analysis).
+
+В пуле MEDIA_WORKERS процессов, в очереди не больше MEDIA_WORKER_QUEUE
+заданий. Если очередь заполнена, submit_media_job() возвращает False —
+файл остается необработанным, и его подберет management-команда
+(build_media_variants, analyze_voice_messages) через map_media_jobs().
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+MEDIA_WORKERS = getattr(settings, 'MEDIA_WORKERS', 2)
+MEDIA_WORKER_QUEUE = getattr(settings, 'MEDIA_WORKER_QUEUE', 32)
+
+_executor = None
+_executor_lock = threading.Lock()
+_queue_slots = threading.BoundedSemaphore(MEDIA_WORKER_QUEUE)
+
+
+def get_executor():
+    """
+    Пул создается при первом задании. forkserver: рабочие процессы
+    порождаются из чистого процесса, а не форком многопоточного сервера
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+            _executor = ProcessPoolExecutor(max_workers=MEDIA_WORKERS, mp_context=context)
+        return _executor
+
+
+def _reset_executor(broken):
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+
+
+def submit_media_job(function, args, on_result):
+    """
+    Выполняет function(*args) в пуле и передает результат в on_result.
+    function должна быть функцией модуля без Django (ее импортирует
+    рабочий процесс). on_result вызывается в служебном потоке пула и может
+    обращаться к БД. Возвращает False, если очередь заполнена
+    """
+    if not _queue_slots.acquire(blocking=False):
+        return False
+    executor = get_executor()
+    try:
+        future = executor.submit(function, *args)
+    except (BrokenProcessPool, RuntimeError):
+        _queue_slots.release()
+        _reset_executor(executor)
+        return False
+
+    def done(future):
+        _queue_slots.release()
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            # Процесс пула убит (например, по памяти): файл останется для команды
+            _reset_executor(executor)
+            return
+        close_old_connections()
+        try:
+            on_result(result)
+        finally:
+            connection.close()
+
+    future.add_done_callback(done)
+    return True
+
+
+def map_media_jobs(function, arguments):
+    """Выполняет function для каждого кортежа аргументов в пуле, результаты по порядку"""
+    if not arguments:
+        return []
+    return get_executor().map(function, *zip(*arguments))
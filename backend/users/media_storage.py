@@ -0,0 +1,104 @@
+"""
+Хранилище файловых полей по содержимому (core.content_store).
+
+ContentAddressedStorage подключается к FileField/ImageField через
+storage=: файл сохраняется под именем из SHA-256, а повторный файл с тем
+же содержимым не пишется заново. BlobReferencesMixin ведет счетчики
+ссылок MediaBlob при сохранении и удалении модели.
+
+Файлы хранилища отдаются не напрямую из /media/, а через
+users.media_views (MEDIA_PROTECTED_URL): доступ к вложениям чатов
+проверяется, а байты передает nginx.
+
+Модуль импортируется из models.py, поэтому модели и users.media_store
+подключаются внутри методов.
+"""
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from django.utils.encoding import filepath_to_uri
+
+from core.content_store import BLOB_DIRECTORY
+
+MEDIA_PROTECTED_URL = getattr(settings, 'MEDIA_PROTECTED_URL', '/api/auth/media/')
+
+# Значение поля, не загруженного из БД (defer/only)
+_NOT_LOADED = object()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, в котором имя файла задает его содержимое, а не upload_to"""
+
+    def get_available_name(self, name, max_length=None):
+        # Имя все равно заменит хэш: проверка существования не нужна
+        return name
+
+    def _save(self, name, content):
+        from .media_store import store_chunks
+        blob = store_chunks(
+            content.chunks(),
+            filename=name,
+            content_type=getattr(content, 'content_type', None) or '',
+        )
+        return blob.name
+
+    def url(self, name):
+        # Старые файлы (chat_files/, avatars/) до переноса в хранилище — по MEDIA_URL
+        if name and name.startswith(f"{BLOB_DIRECTORY}/"):
+            return f"{MEDIA_PROTECTED_URL}{filepath_to_uri(name)}"
+        return super().url(name)
+
+
+class BlobReferencesMixin:
+    """
+    Учет ссылок на MediaBlob для файловых полей BLOB_FIELDS.
+    save() модели вызывает commit_blob_files() до записи строки и
+    apply_blob_changes() после, delete() — release_blob_files().
+    """
+    BLOB_FIELDS = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Имена файлов на момент загрузки из БД: с ними сравнивается save()
+        instance._loaded_blob_names = {
+            field: instance.__dict__.get(field, _NOT_LOADED) or None
+            for field in cls.BLOB_FIELDS
+        }
+        return instance
+
+    def commit_blob_files(self):
+        """
+        Сохраняет новые файлы в хранилище и возвращает изменения ссылок
+        [(поле, старое имя, новое имя)]
+        """
+        loaded = getattr(self, '_loaded_blob_names', {})
+        changes = []
+        for field in self.BLOB_FIELDS:
+            old_name = loaded.get(field)
+            if old_name is _NOT_LOADED:
+                continue
+            fieldfile = getattr(self, field)
+            if fieldfile and not fieldfile._committed:
+                fieldfile.save(fieldfile.name, fieldfile.file, save=False)
+            new_name = fieldfile.name or None
+            if new_name != old_name:
+                changes.append((field, old_name, new_name))
+        return changes
+
+    def apply_blob_changes(self, changes):
+        from .media_store import acquire_blob, release_blob
+        loaded = getattr(self, '_loaded_blob_names', None)
+        if loaded is None:
+            loaded = self._loaded_blob_names = {}
+        for field, old_name, new_name in changes:
+            acquire_blob(new_name)
+            release_blob(old_name)
+            loaded[field] = new_name
+
+    def release_blob_files(self):
+        from .media_store import release_blob
+        for field in self.BLOB_FIELDS:
+            fieldfile = getattr(self, field)
+            release_blob(fieldfile.name or None)
@@ -0,0 +1,228 @@
+"""
+Хранилище медиафайлов по содержимому с учетом ссылок.
+
+Каждый уникальный файл — одна строка MediaBlob: SHA-256, путь
+(core.content_store.blob_name), размер, MIME-тип, размеры изображения и
+длительность аудио. Вложения сообщений (ChatMessage.file), аватары
+(User.avatar) и готовые загрузки частями (ChunkedUpload) ссылаются на
+файл по имени, ref_count считает эти ссылки. Повторно загруженный файл
+только увеличивает счетчик, а сериализаторы берут размер и прочие
+метаданные из MediaBlob вместо обращения к файловой системе.
+
+Файл с нулевым счетчиком удаляется не сразу, а purge_unreferenced_blobs()
+после MEDIA_BLOB_GRACE_HOURS: за это время тот же файл может быть
+загружен снова, и удаление не гоняется с новой ссылкой. Каскадные удаления
+(например, чата вместе с сообщениями) не вызывают delete() моделей —
+recount_blob_references() пересчитывает счетчики по фактическим ссылкам
+(manage.py media_blobs).
+"""
+import mimetypes
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from core.content_store import BLOB_DIRECTORY, blob_name, commit_blob, probe_media, write_temp
+from core.chunked_storage import hash_file, remove_quietly
+from .media_variants import needs_variants, schedule_variants
+from .voice_analysis import needs_analysis, schedule_analysis
+from .models import ChatMessage, ChunkedUpload, MediaBlob, User
+from .user_cards import invalidate_cards_on_commit
+
+MEDIA_BLOB_GRACE_HOURS = getattr(settings, 'MEDIA_BLOB_GRACE_HOURS', 24)
+
+BLOB_PREFIX = f"{BLOB_DIRECTORY}/"
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(BLOB_PREFIX)
+
+
+def ingest_file(temp_path, digest, size, filename='', content_type=''):
+    """
+    Принимает записанный файл с известным хэшем: если такой уже хранится,
+    временный файл удаляется, иначе переносится на место и измеряется.
+    Возвращает MediaBlob (счетчик ссылок не меняется).
+    """
+    # Отметка времени защищает найденный файл от purge_unreferenced_blobs
+    if MediaBlob.objects.filter(sha256=digest).update(updated_at=timezone.now()):
+        remove_quietly(temp_path)
+        return MediaBlob.objects.get(sha256=digest)
+
+    name = blob_name(digest, filename)
+    commit_blob(temp_path, settings.MEDIA_ROOT, name)
+    meta = probe_media(os.path.join(settings.MEDIA_ROOT, name), content_type)
+    blob, created = MediaBlob.objects.get_or_create(
+        sha256=digest,
+        defaults={
+            'name': name,
+            'size': size,
+            'content_type': content_type[:100],
+            **meta,
+        },
+    )
+    # Превью и анализ аудио — в пуле процессов, когда строка уже видна другим соединениям
+    if created and needs_variants(blob.content_type):
+        transaction.on_commit(lambda: schedule_variants(blob.id, blob.name))
+    elif created and needs_analysis(blob.content_type):
+        transaction.on_commit(lambda: schedule_analysis(blob.id, blob.name))
+    return blob
+
+
+def store_chunks(chunks, filename='', content_type=''):
+    """Сохраняет файл из потока блоков (ContentAddressedStorage, FastAPI)"""
+    temp_path, digest, size = write_temp(chunks, settings.MEDIA_ROOT)
+    return ingest_file(temp_path, digest, size, filename, content_type)
+
+
+def find_blob(name):
+    if not is_blob_name(name):
+        return None
+    return MediaBlob.objects.filter(name=name).first()
+
+
+def acquire_blob(name, count=1):
+    if is_blob_name(name) and count:
+        MediaBlob.objects.filter(name=name).update(
+            ref_count=F('ref_count') + count,
+            updated_at=timezone.now(),
+        )
+
+
+def release_blob(name, count=1):
+    # С updated_at начинается отсчет срока до удаления неиспользуемого файла
+    if is_blob_name(name) and count:
+        MediaBlob.objects.filter(name=name).update(
+            ref_count=F('ref_count') - count,
+            updated_at=timezone.now(),
+        )
+
+
+def serialize_blob_meta(blob):
+    return {
+        'size': blob.size,
+        'content_type': blob.content_type,
+        'width': blob.width,
+        'height': blob.height,
+        'duration': blob.duration,
+        'waveform': blob.waveform,
+    }
+
+
+def count_blob_references():
+    """Фактическое число ссылок на каждый файл хранилища: {имя: число}"""
+    references = Counter()
+    rows = (
+        ChatMessage.objects.filter(blob__isnull=False)
+        .values('blob__name').annotate(total=Count('id'))
+    )
+    for row in rows:
+        references[row['blob__name']] += row['total']
+    rows = (
+        User.objects.filter(avatar__startswith=BLOB_PREFIX)
+        .values('avatar').annotate(total=Count('id'))
+    )
+    for row in rows:
+        references[row['avatar']] += row['total']
+    rows = (
+        ChunkedUpload.objects.filter(status='complete', stored_name__startswith=BLOB_PREFIX)
+        .values('stored_name').annotate(total=Count('id'))
+    )
+    for row in rows:
+        references[row['stored_name']] += row['total']
+    return references
+
+
+def recount_blob_references(dry_run=False):
+    """Исправляет ref_count по фактическим ссылкам. Возвращает число исправленных"""
+    references = count_blob_references()
+    fixed = 0
+    for blob in MediaBlob.objects.only('id', 'name', 'ref_count').iterator():
+        actual = references.get(blob.name, 0)
+        if blob.ref_count == actual:
+            continue
+        fixed += 1
+        if not dry_run:
+            MediaBlob.objects.filter(id=blob.id).update(ref_count=actual)
+    return fixed
+
+
+def purge_unreferenced_blobs(grace_hours=None, dry_run=False):
+    """
+    Удаляет файлы без ссылок, к которым не обращались дольше срока.
+    Возвращает (число файлов, освобождено байт).
+    """
+    if grace_hours is None:
+        grace_hours = MEDIA_BLOB_GRACE_HOURS
+    threshold = timezone.now() - timedelta(hours=grace_hours)
+    count = 0
+    reclaimed = 0
+    candidates = MediaBlob.objects.filter(ref_count__lte=0, updated_at__lt=threshold)
+    for blob in candidates.only('id', 'name', 'size', 'variants').iterator():
+        if dry_run:
+            count += 1
+            reclaimed += blob.size
+            continue
+        # Условие повторяется в DELETE: файл могли загрузить снова после выборки
+        deleted, _ = MediaBlob.objects.filter(
+            id=blob.id, ref_count__lte=0, updated_at__lt=threshold
+        ).delete()
+        if deleted:
+            for name in [blob.name, *(blob.variants or {}).values()]:
+                remove_quietly(os.path.join(settings.MEDIA_ROOT, name))
+            count += 1
+            reclaimed += blob.size
+    return count, reclaimed
+
+
+def import_legacy_files(dry_run=False):
+    """
+    Переводит файлы, сохраненные до хранилища по содержимому
+    (chat_files/<uuid>.pdf, avatars/...), на имена из SHA-256: копии
+    одинаковых файлов удаляются, строки ссылаются на общий файл.
+    Возвращает {'files': файлов, 'duplicates': лишних копий, 'reclaimed': байт}.
+    """
+    stats = Counter()
+    known = set()
+    sources = (
+        (ChatMessage.objects.all(), 'file'),
+        (User.objects.all(), 'avatar'),
+        (ChunkedUpload.objects.filter(status='complete'), 'stored_name'),
+    )
+    for queryset, field in sources:
+        names = (
+            queryset.exclude(**{f'{field}__startswith': BLOB_PREFIX})
+            .exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+            .values_list(field, flat=True).distinct()
+        )
+        for name in list(names):
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            if not os.path.exists(path):
+                continue
+            size = os.path.getsize(path)
+            digest = hash_file(path).hexdigest()
+            stats['files'] += 1
+            if digest in known or MediaBlob.objects.filter(sha256=digest).exists():
+                stats['duplicates'] += 1
+                stats['reclaimed'] += size
+            known.add(digest)
+            if dry_run:
+                continue
+
+            content_type = mimetypes.guess_type(name)[0] or ''
+            with transaction.atomic():
+                # Файл переносится (или удаляется как копия), а не копируется
+                blob = ingest_file(path, digest, size, name, content_type)
+                updates = {field: blob.name}
+                if queryset.model is ChatMessage:
+                    updates['blob'] = blob
+                rows = queryset.model.objects.filter(**{field: name})
+                if queryset.model is User:
+                    invalidate_cards_on_commit(rows.values_list('id', flat=True))
+                updated = rows.update(**updates)
+                acquire_blob(blob.name, updated)
+    return dict(stats)
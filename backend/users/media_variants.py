@@ -0,0 +1,67 @@
+"""
+Превью изображений хранилища (core.image_variants) в пуле процессов.
+
+Новое изображение MediaBlob после коммита ставится в очередь пула
+(users.media_pool). Если очередь заполнена (массовая загрузка, импорт
+старых файлов), файл остается с variants = NULL и его обработает
+manage.py build_media_variants. Готовые имена сохраняются в
+MediaBlob.variants и копируются в User.avatar_variants всех, у кого это
+изображение — аватар, чтобы списки пользователей не делали лишних запросов.
+
+Пока превью не готовы, сериализаторы отдают оригинал.
+"""
+from django.conf import settings
+
+from core.image_variants import VARIANT_SPECS, render_variants
+from .media_pool import map_media_jobs, submit_media_job
+from .models import MediaBlob, User
+from .user_cards import invalidate_cards
+
+MEDIA_VARIANT_FORMAT = getattr(settings, 'MEDIA_VARIANT_FORMAT', 'WEBP')
+MEDIA_VARIANT_QUALITY = getattr(settings, 'MEDIA_VARIANT_QUALITY', 80)
+
+
+def needs_variants(content_type):
+    # SVG и прочие векторные форматы Pillow не открывает
+    return content_type.startswith('image/') and content_type != 'image/svg+xml'
+
+
+def render_blob_variants(name):
+    """Аргументы render_variants для файла хранилища"""
+    return (settings.MEDIA_ROOT, name, VARIANT_SPECS, MEDIA_VARIANT_FORMAT, MEDIA_VARIANT_QUALITY)
+
+
+def save_variants(blob_id, name, variants):
+    MediaBlob.objects.filter(id=blob_id).update(variants=variants)
+    user_ids = list(User.objects.filter(avatar=name).values_list('id', flat=True))
+    if user_ids:
+        User.objects.filter(id__in=user_ids).update(avatar_variants=variants)
+        invalidate_cards(user_ids)
+
+
+def schedule_variants(blob_id, name):
+    """
+    Ставит построение превью в очередь пула. Возвращает False, если
+    очередь заполнена — тогда превью построит build_media_variants
+    """
+    return submit_media_job(
+        render_variants,
+        render_blob_variants(name),
+        lambda variants: save_variants(blob_id, name, variants),
+    )
+
+
+def pending_variant_blobs():
+    return MediaBlob.objects.filter(
+        variants__isnull=True,
+        content_type__startswith='image/',
+    ).exclude(content_type='image/svg+xml').order_by('id')
+
+
+def build_pending_variants(limit=None):
+    """Строит превью всех изображений без них (через тот же пул). Возвращает число файлов"""
+    blobs = list(pending_variant_blobs().values_list('id', 'name')[:limit])
+    results = map_media_jobs(render_variants, [render_blob_variants(name) for _, name in blobs])
+    for (blob_id, name), variants in zip(blobs, results):
+        save_variants(blob_id, name, variants)
+    return len(blobs)
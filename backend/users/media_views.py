@@ -0,0 +1,155 @@
+"""
+Выдача файлов хранилища (/api/auth/media/blobs/...).
+
+Django только проверяет доступ (users.media_access) и ставит заголовки
+кэширования, а байты передает nginx: ответ с X-Accel-Redirect на
+внутренний location MEDIA_ACCEL_REDIRECT, где nginx сам обрабатывает
+Range (перемотка голосовых и видео) и отдает файл через sendfile.
+
+Без MEDIA_ACCEL_REDIRECT (разработка) файл отдает FileResponse, диапазон
+Range вырезается здесь же. Под WSGI-сервером с wsgi.file_wrapper полный
+файл уходит через sendfile.
+"""
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.encoding import filepath_to_uri
+from django.views.decorators.http import require_http_methods
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .media_access import MediaAccessError, check_media_access, resolve_media
+
+MEDIA_ACCEL_REDIRECT = getattr(settings, 'MEDIA_ACCEL_REDIRECT', '')
+MEDIA_CACHE_SECONDS = getattr(settings, 'MEDIA_CACHE_SECONDS', 365 * 24 * 3600)
+
+# Эти типы браузер показывает сам; остальные (HTML, SVG) только скачиваются,
+# чтобы загруженный файл не выполнялся в origin сайта
+INLINE_CONTENT_TYPES = ('image/', 'audio/', 'video/', 'application/pdf')
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_byte_range(header, size):
+    """
+    (начало, конец) включительно для заголовка Range с одним диапазоном.
+    None — отдать файл целиком (заголовка нет, несколько диапазонов или
+    синтаксис не разобран); RangeNotSatisfiable — диапазон вне файла
+    """
+    match = _RANGE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # bytes=-N: последние N байт
+        length = int(end)
+        if not length or not size:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(start)
+    if start >= size:
+        raise RangeNotSatisfiable()
+    end = int(end) if end else size - 1
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class FileRange:
+    """Файл, из которого читается не больше length байт с текущей позиции"""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def file_response(request, name, content_type):
+    """Ответ без nginx (разработка): весь файл или диапазон Range"""
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    try:
+        size = os.path.getsize(path)
+        byte_range = parse_byte_range(request.headers.get('Range'), size)
+        file = open(path, 'rb')
+    except OSError:
+        return JsonResponse({'success': False, 'message': 'Файл не найден'}, status=404)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(FileRange(file, end - start + 1), content_type=content_type, status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def request_user(request):
+    """Пользователь из JWT, если запрос его несет; тег <img>/<audio> токен не передает"""
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        raise MediaAccessError('Недействительный токен', 401)
+    return authenticated[0] if authenticated else None
+
+
+@require_http_methods(['GET', 'HEAD'])
+def protected_media(request, name):
+    try:
+        blob, content_type = resolve_media(name)
+        public = check_media_access(
+            blob,
+            name,
+            chat_id=request.GET.get('c'),
+            timestamp=request.GET.get('t'),
+            signature=request.GET.get('s'),
+            user=request_user(request),
+        )
+    except MediaAccessError as error:
+        return JsonResponse({'success': False, 'message': error.message}, status=error.status)
+
+    # Содержимое по этому URL не меняется: кэш на год без повторных проверок
+    headers = {
+        'Cache-Control': f"{'public' if public else 'private'}, max-age={MEDIA_CACHE_SECONDS}, immutable",
+        'ETag': f'"{os.path.splitext(os.path.basename(name))[0]}"',
+        'X-Content-Type-Options': 'nosniff',
+    }
+    if headers['ETag'] in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    elif MEDIA_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = f"{MEDIA_ACCEL_REDIRECT}{filepath_to_uri(name)}"
+    else:
+        response = file_response(request, name, content_type)
+        if response.status_code >= 400:
+            return response
+
+    is_inline = content_type.startswith(INLINE_CONTENT_TYPES) and content_type != 'image/svg+xml'
+    if not is_inline:
+        headers['Content-Disposition'] = 'attachment'
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,102 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+MESSAGE_TYPE_LABELS = {
+    'image': 'Изображение',
+    'file': 'Файл',
+    'voice': 'Голосовое сообщение',
+}
+
+
+def fill_chat_inbox(apps, schema_editor):
+    """Заполняет последнее сообщение чатов и строки ChatMember для существующих чатов"""
+    Chat = apps.get_model('users', 'Chat')
+    ChatMember = apps.get_model('users', 'ChatMember')
+    ChatMessage = apps.get_model('users', 'ChatMessage')
+
+    for chat in Chat.objects.all().iterator():
+        last = ChatMessage.objects.filter(chat_id=chat.id).order_by('-id').first()
+        if last:
+            chat.last_message_id = last.id
+            chat.last_message_snippet = (last.content or MESSAGE_TYPE_LABELS.get(last.message_type, ''))[:255]
+            chat.last_message_type = last.message_type
+            chat.last_message_sender_id = last.sender_id
+            chat.last_message_at = last.created_at
+            chat.save(update_fields=[
+                'last_message', 'last_message_snippet', 'last_message_type',
+                'last_message_sender', 'last_message_at',
+            ])
+
+        user_ids = list(chat.participants.values_list('id', flat=True))
+        members = []
+        for user_id in user_ids:
+            others = [other_id for other_id in user_ids if other_id != user_id]
+            unread = ChatMessage.objects.filter(
+                chat_id=chat.id, is_read=False
+            ).exclude(sender_id=user_id).count()
+            members.append(ChatMember(
+                chat_id=chat.id,
+                user_id=user_id,
+                other_user_id=others[0] if others else None,
+                unread_count=unread,
+                last_activity_at=last.created_at if last else chat.updated_at,
+            ))
+        ChatMember.objects.bulk_create(members, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_add_performance_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='users.chatmessage', verbose_name='Последнее сообщение'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Время последнего сообщения'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='last_message_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Отправитель последнего сообщения'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='last_message_snippet',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Начало последнего сообщения'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='last_message_type',
+            field=models.CharField(blank=True, default='', max_length=10, verbose_name='Тип последнего сообщения'),
+        ),
+        migrations.CreateModel(
+            name='ChatMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0, verbose_name='Непрочитанные сообщения')),
+                ('last_activity_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Последняя активность')),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='users.chat')),
+                ('other_user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Собеседник')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Участник чата',
+                'verbose_name_plural': 'Участники чатов',
+                'indexes': [models.Index(fields=['user', 'last_activity_at', 'id'], name='users_chatm_user_id_4e7eb7_idx')],
+                'unique_together': {('chat', 'user')},
+            },
+        ),
+        migrations.RunPython(fill_chat_inbox, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:47
+
+from django.db import migrations, models
+
+
+def fill_reply_previews(apps, schema_editor):
+    """Заполняет снимки цитат для уже существующих ответов"""
+    ChatMessage = apps.get_model('users', 'ChatMessage')
+    replies = ChatMessage.objects.filter(
+        reply_to__isnull=False,
+        reply_preview__isnull=True
+    ).select_related('reply_to__sender')
+
+    batch = []
+    for message in replies.iterator(chunk_size=1000):
+        reply_to = message.reply_to
+        message.reply_preview = {
+            'id': reply_to.id,
+            'content': (reply_to.content or '')[:200],
+            'sender_name': reply_to.sender.first_name or reply_to.sender.username,
+            'message_type': reply_to.message_type
+        }
+        batch.append(message)
+        if len(batch) >= 1000:
+            ChatMessage.objects.bulk_update(batch, ['reply_preview'])
+            batch = []
+    if batch:
+        ChatMessage.objects.bulk_update(batch, ['reply_preview'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_chat_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='reply_preview',
+            field=models.JSONField(blank=True, null=True, verbose_name='Превью ответа'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['chat', 'id'], name='users_chatm_chat_id_eed0eb_idx'),
+        ),
+        migrations.RunPython(fill_reply_previews, migrations.RunPython.noop),
+    ]
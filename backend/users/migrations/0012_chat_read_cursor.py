@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:49
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def fill_read_cursors(apps, schema_editor):
+    """
+    Переносит флаги is_read в курсоры: курсор ставится перед первым
+    непрочитанным входящим сообщением, иначе — на последнее сообщение чата
+    """
+    ChatMember = apps.get_model('users', 'ChatMember')
+    ChatMessage = apps.get_model('users', 'ChatMessage')
+
+    for member in ChatMember.objects.all().iterator(chunk_size=1000):
+        messages = ChatMessage.objects.filter(chat_id=member.chat_id)
+        first_unread = messages.filter(is_read=False).exclude(
+            sender_id=member.user_id
+        ).aggregate(first=Min('id'))['first']
+        if first_unread:
+            cursor = first_unread - 1
+        else:
+            cursor = messages.aggregate(last=Max('id'))['last'] or 0
+        if cursor:
+            ChatMember.objects.filter(id=member.id).update(last_read_message_id=cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_chatmessage_reply_preview'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='chatmessage',
+            name='users_chatm_is_read_23143f_idx',
+        ),
+        migrations.AddField(
+            model_name='chatmember',
+            name='last_read_message_id',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Последнее прочитанное сообщение'),
+        ),
+        migrations.RunPython(fill_read_cursors, migrations.RunPython.noop),
+    ]
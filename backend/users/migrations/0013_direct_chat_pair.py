@@ -0,0 +1,105 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import defaultdict
+
+
+def merge_chat_into(apps, keep_id, duplicate_ids, user_ids):
+    """Переносит сообщения дублей в основной чат и пересчитывает inbox"""
+    Chat = apps.get_model('users', 'Chat')
+    ChatMember = apps.get_model('users', 'ChatMember')
+    ChatMessage = apps.get_model('users', 'ChatMessage')
+    chat_ids = [keep_id] + duplicate_ids
+
+    # Курсор прочтения участника — наибольший из всех его дублей
+    cursors = defaultdict(int)
+    for user_id, cursor in ChatMember.objects.filter(chat_id__in=chat_ids).values_list(
+        'user_id', 'last_read_message_id'
+    ):
+        cursors[user_id] = max(cursors[user_id], cursor)
+
+    ChatMessage.objects.filter(chat_id__in=duplicate_ids).update(chat_id=keep_id)
+    if Chat.objects.filter(id__in=duplicate_ids, is_active=True).exists():
+        Chat.objects.filter(id=keep_id).update(is_active=True)
+    Chat.objects.filter(id__in=duplicate_ids).delete()
+
+    messages = ChatMessage.objects.filter(chat_id=keep_id)
+    last = messages.order_by('-id').first()
+    chat = Chat.objects.get(id=keep_id)
+    if last:
+        Chat.objects.filter(id=keep_id).update(
+            last_message_id=last.id,
+            last_message_snippet=(last.content or '')[:255],
+            last_message_type=last.message_type,
+            last_message_sender_id=last.sender_id,
+            last_message_at=last.created_at,
+        )
+
+    for user_id in user_ids:
+        other_id = next((other for other in user_ids if other != user_id), None)
+        cursor = cursors[user_id]
+        ChatMember.objects.update_or_create(
+            chat_id=keep_id,
+            user_id=user_id,
+            defaults={
+                'other_user_id': other_id,
+                'last_read_message_id': cursor,
+                'unread_count': messages.filter(id__gt=cursor).exclude(sender_id=user_id).count(),
+                'last_activity_at': last.created_at if last else chat.created_at,
+            }
+        )
+
+
+def merge_duplicate_direct_chats(apps, schema_editor):
+    """
+    Заполняет каноническую пару участников для личных чатов и
+    сливает дубли (несколько чатов у одной пары) в самый старый
+    активный чат, иначе уникальный индекс не создать
+    """
+    Chat = apps.get_model('users', 'Chat')
+    Participants = Chat.participants.through
+
+    participants = defaultdict(set)
+    for chat_id, user_id in Participants.objects.values_list('chat_id', 'user_id').iterator():
+        participants[chat_id].add(user_id)
+
+    active = set(Chat.objects.filter(is_active=True).values_list('id', flat=True))
+
+    pairs = defaultdict(list)
+    for chat_id, user_ids in participants.items():
+        if len(user_ids) == 2:
+            pairs[tuple(sorted(user_ids))].append(chat_id)
+
+    for (min_user_id, max_user_id), chat_ids in pairs.items():
+        chat_ids.sort(key=lambda chat_id: (chat_id not in active, chat_id))
+        keep_id, duplicate_ids = chat_ids[0], chat_ids[1:]
+        if duplicate_ids:
+            merge_chat_into(apps, keep_id, duplicate_ids, [min_user_id, max_user_id])
+        Chat.objects.filter(id=keep_id).update(min_user_id=min_user_id, max_user_id=max_user_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_chat_read_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='max_user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Участник с большим id'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='min_user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Участник с меньшим id'),
+        ),
+        migrations.RunPython(merge_duplicate_direct_chats, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='chat',
+            constraint=models.UniqueConstraint(fields=('min_user', 'max_user'), name='unique_direct_chat_pair'),
+        ),
+    ]
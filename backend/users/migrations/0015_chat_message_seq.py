@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:20
+
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill_chat_message_seq(apps, schema_editor):
+    """
+    Нумерует существующие сообщения каждого чата по порядку id (1, 2, 3...)
+    и записывает последний номер в Chat.last_seq
+    """
+    Chat = apps.get_model('users', 'Chat')
+    ChatMessage = apps.get_model('users', 'ChatMessage')
+
+    for chat_id in Chat.objects.values_list('id', flat=True).iterator():
+        messages = []
+        for seq, message_id in enumerate(
+            ChatMessage.objects.filter(chat_id=chat_id).order_by('id').values_list('id', flat=True),
+            start=1
+        ):
+            messages.append(ChatMessage(id=message_id, seq=seq))
+        if not messages:
+            continue
+        ChatMessage.objects.bulk_update(messages, ['seq'], batch_size=BACKFILL_BATCH_SIZE)
+        Chat.objects.filter(id=chat_id).update(last_seq=len(messages))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_user_last_seen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Последний номер сообщения'),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='seq',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Номер в чате'),
+        ),
+        migrations.RunPython(backfill_chat_message_seq, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='chatmessage',
+            constraint=models.UniqueConstraint(fields=('chat', 'seq'), name='unique_chat_message_seq'),
+        ),
+    ]
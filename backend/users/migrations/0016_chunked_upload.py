@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_chat_message_seq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('purpose', models.CharField(choices=[('chat_file', 'Файл сообщения чата'), ('avatar', 'Аватар')], max_length=20, verbose_name='Назначение')),
+                ('filename', models.CharField(max_length=255, verbose_name='Исходное имя файла')),
+                ('content_type', models.CharField(blank=True, default='', max_length=100, verbose_name='MIME-тип')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер файла')),
+                ('offset', models.PositiveBigIntegerField(default=0, verbose_name='Загружено байт')),
+                ('status', models.CharField(choices=[('uploading', 'Загружается'), ('complete', 'Загружен')], default='uploading', max_length=10, verbose_name='Статус')),
+                ('sha256', models.CharField(blank=True, default='', max_length=64, verbose_name='SHA-256')),
+                ('stored_name', models.CharField(blank=True, default='', max_length=255, verbose_name='Файл')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunked_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Загрузка файла',
+                'verbose_name_plural': 'Загрузки файлов',
+                'indexes': [models.Index(fields=['updated_at'], name='users_chunk_updated_532e06_idx')],
+            },
+        ),
+    ]
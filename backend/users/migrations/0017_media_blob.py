@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import users.media_storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0016_chunked_upload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=users.media_storage.ContentAddressedStorage(), upload_to='chat_files/', verbose_name='Файл'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=users.media_storage.ContentAddressedStorage(), upload_to='avatars/', verbose_name='Аватар'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер файла')),
+                ('content_type', models.CharField(blank=True, default='', max_length=100, verbose_name='MIME-тип')),
+                ('width', models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота')),
+                ('duration', models.FloatField(blank=True, null=True, verbose_name='Длительность, с')),
+                ('ref_count', models.IntegerField(default=0, verbose_name='Число ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Файл хранилища',
+                'verbose_name_plural': 'Файлы хранилища',
+                'indexes': [models.Index(fields=['ref_count', 'updated_at'], name='users_media_ref_cou_8961e7_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='users.mediablob', verbose_name='Файл в хранилище'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0017_media_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediablob',
+            name='variants',
+            field=models.JSONField(blank=True, null=True, verbose_name='Превью'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_variants',
+            field=models.JSONField(blank=True, null=True, verbose_name='Превью аватара'),
+        ),
+    ]
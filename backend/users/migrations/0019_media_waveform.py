@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0018_media_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediablob',
+            name='waveform',
+            field=models.JSONField(blank=True, null=True, verbose_name='Огибающая'),
+        ),
+    ]
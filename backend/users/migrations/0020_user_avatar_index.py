@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:46
+
+from django.db import migrations, models
+import users.media_storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0019_media_waveform'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=users.media_storage.ContentAddressedStorage(), upload_to='avatars/', verbose_name='Аватар'),
+        ),
+    ]
@@ -1,9 +1,17 @@
+import uuid
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from .media_storage import BlobReferencesMixin, ContentAddressedStorage
+
+# Вложения и аватары хранятся по содержимому (users.media_store)
+blob_storage = ContentAddressedStorage()
+
 
-class User(AbstractUser):
+class User(BlobReferencesMixin, AbstractUser):
     STATUS_CHOICES = [
         ('mom', 'Мама'),
         ('pregnant', 'Беременная'),
@@ -30,16 +38,33 @@ class User(AbstractUser):
         null=True,
         verbose_name=_('Дата рождения')
     )
+    # Индекс: по имени файла проверяется, что он публичный (users.media_access)
     avatar = models.ImageField(
         upload_to='avatars/', 
+        storage=blob_storage,
         blank=True, 
         null=True,
+        db_index=True,
         verbose_name=_('Аватар')
     )
-    
+    # Превью аватара {размер: файл} (users.media_variants); None — пока не построены
+    avatar_variants = models.JSONField(
+        blank=True,
+        null=True,
+        verbose_name=_('Превью аватара')
+    )
+    # Пока пользователь онлайн, актуальное время хранится в кэше присутствия
+    # (users.presence); сюда оно записывается пачками
+    last_seen = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_('Был в сети')
+    )
+
     # Используем email вместо username для входа
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
+    BLOB_FIELDS = ('avatar',)
     
     class Meta:
         verbose_name = _('Пользователь')
@@ -58,6 +83,30 @@ class User(AbstractUser):
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}".strip()
+    
+    def save(self, *args, **kwargs):
+        # Карточка в кэше (users.user_cards) устаревает, только если менялись ее поля
+        from .user_cards import CARD_FIELDS, invalidate_cards_on_commit
+        update_fields = kwargs.get('update_fields')
+        if self.pk and (update_fields is None or CARD_FIELDS.intersection(update_fields)):
+            invalidate_cards_on_commit([self.pk])
+        changes = self.commit_blob_files()
+        if not changes:
+            return super().save(*args, **kwargs)
+        # Превью нового аватара копируются из хранилища (или появятся позже)
+        from .media_store import find_blob
+        blob = find_blob(self.avatar.name)
+        self.avatar_variants = blob.variants if blob else None
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'avatar_variants'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.apply_blob_changes(changes)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            self.release_blob_files()
+            return super().delete(*args, **kwargs)
 
 
 class Child(models.Model):
@@ -163,6 +212,19 @@ class Notification(models.Model):
     def __str__(self):
         return f"{self.sender.username} -> {self.recipient.username}: {self.get_notification_type_display()}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Инвалидируем закэшированный список уведомлений получателя
+        from .notification_cache import bump_notifications_version_on_commit
+        bump_notifications_version_on_commit(self.recipient_id)
+
+    def delete(self, *args, **kwargs):
+        recipient_id = self.recipient_id
+        result = super().delete(*args, **kwargs)
+        from .notification_cache import bump_notifications_version_on_commit
+        bump_notifications_version_on_commit(recipient_id)
+        return result
+
 
 class Message(models.Model):
     """Модель для сообщений между пользователями"""
@@ -250,32 +312,85 @@ class Chat(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True, verbose_name=_('Активный чат'))
     
+    # Денормализованное последнее сообщение (обновляется при записи сообщений)
+    last_message = models.ForeignKey(
+        'ChatMessage', on_delete=models.SET_NULL, blank=True, null=True,
+        related_name='+', verbose_name=_('Последнее сообщение')
+    )
+    last_message_snippet = models.CharField(max_length=255, blank=True, default='', verbose_name=_('Начало последнего сообщения'))
+    last_message_type = models.CharField(max_length=10, blank=True, default='', verbose_name=_('Тип последнего сообщения'))
+    last_message_sender = models.ForeignKey(
+        'User', on_delete=models.SET_NULL, blank=True, null=True,
+        related_name='+', verbose_name=_('Отправитель последнего сообщения')
+    )
+    last_message_at = models.DateTimeField(blank=True, null=True, verbose_name=_('Время последнего сообщения'))
+    # Последний выданный порядковый номер сообщения (ChatMessage.seq)
+    last_seq = models.PositiveBigIntegerField(default=0, verbose_name=_('Последний номер сообщения'))
+    
+    # Каноническая пара участников личного чата (min_user_id <= max_user_id)
+    min_user = models.ForeignKey(
+        'User', on_delete=models.SET_NULL, blank=True, null=True,
+        related_name='+', verbose_name=_('Участник с меньшим id')
+    )
+    max_user = models.ForeignKey(
+        'User', on_delete=models.SET_NULL, blank=True, null=True,
+        related_name='+', verbose_name=_('Участник с большим id')
+    )
+    
     class Meta:
         verbose_name = _('Чат')
         verbose_name_plural = _('Чаты')
         ordering = ['-updated_at']
+        constraints = [
+            models.UniqueConstraint(fields=['min_user', 'max_user'], name='unique_direct_chat_pair'),
+        ]
     
     def __str__(self):
         participant_names = [user.username for user in self.participants.all()]
         return f"Чат между {' и '.join(participant_names)}"
     
-    @property
-    def last_message(self):
-        """Последнее сообщение в чате"""
-        return self.messages.order_by('-created_at').first()
-    
     def unread_count(self, user):
         """Количество непрочитанных сообщений для пользователя"""
-        return self.messages.filter(
-            sender__in=self.participants.exclude(id=user.id),
-            is_read=False
-        ).count()
+        return ChatMember.objects.filter(chat=self, user=user).values_list(
+            'unread_count', flat=True
+        ).first() or 0
     
     def get_other_participant(self, user):
         """Получить собеседника для данного пользователя"""
+        member = ChatMember.objects.filter(chat=self, user=user).select_related('other_user').first()
+        if member:
+            return member.other_user
         return self.participants.exclude(id=user.id).first()
 
-class ChatMessage(models.Model):
+
+class ChatMember(models.Model):
+    """Строка списка чатов (inbox) конкретного участника"""
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='members')
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='chat_memberships')
+    other_user = models.ForeignKey(
+        'User', on_delete=models.CASCADE, blank=True, null=True,
+        related_name='+', verbose_name=_('Собеседник')
+    )
+    unread_count = models.PositiveIntegerField(default=0, verbose_name=_('Непрочитанные сообщения'))
+    # Курсор прочтения: все сообщения с id <= last_read_message_id прочитаны участником
+    last_read_message_id = models.PositiveBigIntegerField(default=0, verbose_name=_('Последнее прочитанное сообщение'))
+    last_activity_at = models.DateTimeField(default=timezone.now, verbose_name=_('Последняя активность'))
+    
+    class Meta:
+        verbose_name = _('Участник чата')
+        verbose_name_plural = _('Участники чатов')
+        unique_together = ('chat', 'user')
+        indexes = [
+            models.Index(fields=['user', 'last_activity_at', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} в чате {self.chat_id}"
+
+REPLY_PREVIEW_LENGTH = 200
+
+
+class ChatMessage(BlobReferencesMixin, models.Model):
     """Модель сообщения в чате"""
     MESSAGE_TYPES = [
         ('text', 'Текстовое сообщение'),
@@ -285,11 +400,18 @@ class ChatMessage(models.Model):
     ]
     
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
+    # Порядковый номер в чате без пропусков (1, 2, 3...): по нему клиент догружает пропущенное
+    seq = models.PositiveBigIntegerField(default=0, verbose_name=_('Номер в чате'))
     sender = models.ForeignKey('User', on_delete=models.CASCADE, related_name='sent_chat_messages')
     content = models.TextField(verbose_name=_('Текст сообщения'), blank=True, null=True)
     message_type = models.CharField(max_length=10, choices=MESSAGE_TYPES, default='text', verbose_name=_('Тип сообщения'))
-    file = models.FileField(upload_to='chat_files/', blank=True, null=True, verbose_name=_('Файл'))
+    file = models.FileField(upload_to='chat_files/', storage=blob_storage, blank=True, null=True, verbose_name=_('Файл'))
+    # Метаданные вложения (размер, MIME-тип, размеры): сериализатор не обращается к диску
+    blob = models.ForeignKey('MediaBlob', on_delete=models.SET_NULL, blank=True, null=True, related_name='+', verbose_name=_('Файл в хранилище'))
     reply_to = models.ForeignKey('self', on_delete=models.SET_NULL, blank=True, null=True, related_name='replies', verbose_name=_('Ответ на сообщение'))
+    # Снимок цитируемого сообщения на момент ответа, чтобы история не делала self-join
+    reply_preview = models.JSONField(blank=True, null=True, verbose_name=_('Превью ответа'))
+    # Устаревший флаг: состояние прочтения хранится курсором ChatMember.last_read_message_id
     is_read = models.BooleanField(default=False, verbose_name=_('Прочитано'))
     is_edited = models.BooleanField(default=False, verbose_name=_('Отредактировано'))
     created_at = models.DateTimeField(auto_now_add=True)
@@ -301,33 +423,86 @@ class ChatMessage(models.Model):
         ordering = ['created_at']
         indexes = [
             models.Index(fields=['chat', 'created_at']),
+            models.Index(fields=['chat', 'id']),
             models.Index(fields=['sender', 'created_at']),
-            models.Index(fields=['is_read']),
             models.Index(fields=['created_at']),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['chat', 'seq'], name='unique_chat_message_seq'),
+        ]
+    
+    BLOB_FIELDS = ('file',)
     
     def __str__(self):
         return f"Сообщение от {self.sender.username} в {self.chat}"
     
+    def build_reply_preview(self):
+        """Снимок сообщения для цитирования в ответах"""
+        return {
+            'id': self.id,
+            'content': (self.content or '')[:REPLY_PREVIEW_LENGTH],
+            'sender_name': self.sender.first_name or self.sender.username,
+            'message_type': self.message_type
+        }
+    
     def save(self, *args, **kwargs):
         # Создаем уведомление при отправке нового сообщения
         is_new = self.pk is None
-        super().save(*args, **kwargs)
         
-        if is_new:
-            # Получаем получателя сообщения (собеседника)
-            recipient = self.chat.participants.exclude(id=self.sender.id).first()
-            if recipient:
-                # Создаем уведомление о новом сообщении в чате
-                notification = Notification.objects.create(
-                    recipient=recipient,
-                    sender=self.sender,
-                    notification_type='message',
-                    message=f'{self.sender.first_name or self.sender.username} отправил вам сообщение в чате'
-                )
-                
-                # Отправляем WebSocket уведомление
-                self.send_notification_websocket(notification)
+        if is_new and self.reply_to_id and self.reply_preview is None:
+            reply_to = ChatMessage.objects.select_related('sender').filter(id=self.reply_to_id).first()
+            if reply_to:
+                self.reply_preview = reply_to.build_reply_preview()
+        
+        from .chat_inbox import record_new_message, record_edited_message
+        from .chat_replay import (
+            allocate_chat_seq,
+            refresh_chat_message_on_commit,
+            remember_chat_message_on_commit,
+        )
+        from .media_store import find_blob
+        changes = self.commit_blob_files()
+        if changes:
+            self.blob = find_blob(self.file.name)
+        if not is_new:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                self.apply_blob_changes(changes)
+            record_edited_message(self)
+            refresh_chat_message_on_commit(self)
+            return
+        
+        with transaction.atomic():
+            # Номер в чате выдается под блокировкой строки чата до коммита вставки
+            self.seq = allocate_chat_seq(self.chat_id)
+            super().save(*args, **kwargs)
+            self.apply_blob_changes(changes)
+        remember_chat_message_on_commit(self)
+        
+        # Обновляем денормализованное последнее сообщение и счетчики участников
+        recipient_ids = record_new_message(self)
+        for recipient_id in recipient_ids:
+            # Создаем уведомление о новом сообщении в чате
+            notification = Notification.objects.create(
+                recipient_id=recipient_id,
+                sender=self.sender,
+                notification_type='message',
+                message=f'{self.sender.first_name or self.sender.username} отправил вам сообщение в чате'
+            )
+            
+            # Отправляем WebSocket уведомление
+            self.send_notification_websocket(notification)
+    
+    def delete(self, *args, **kwargs):
+        from .chat_inbox import record_deleted_message
+        from .chat_replay import forget_chat_message_on_commit
+        message_id = self.id
+        with transaction.atomic():
+            self.release_blob_files()
+            result = super().delete(*args, **kwargs)
+        record_deleted_message(self, message_id)
+        forget_chat_message_on_commit(self.chat_id, self.seq)
+        return result
     
     def send_notification_websocket(self, notification):
         """Отправить уведомление через WebSocket"""
@@ -344,7 +519,7 @@ class ChatMessage(models.Model):
                 
                 # Отправляем уведомление получателю
                 async_to_sync(channel_layer.group_send)(
-                    f"notifications_{notification.recipient.id}",
+                    f"notifications_{notification.recipient_id}",
                     {
                         'type': 'notification_created',
                         'notification': notification_data
@@ -359,10 +534,80 @@ class ChatMessage(models.Model):
         if not self.file:
             return None
         
-        size = self.file.size
+        # Размер берется из хранилища; к диску обращаются только файлы, не перенесенные в него
+        size = self.blob.size if self.blob_id else self.file.size
         if size < 1024:
             return f"{size} B"
         elif size < 1024 * 1024:
             return f"{size / 1024:.1f} KB"
         else:
             return f"{size / (1024 * 1024):.1f} MB"
+
+
+class ChunkedUpload(models.Model):
+    """Загрузка файла частями с догрузкой после обрыва (users.chunked_uploads)"""
+    PURPOSES = [
+        ('chat_file', 'Файл сообщения чата'),
+        ('avatar', 'Аватар'),
+    ]
+    STATUSES = [
+        ('uploading', 'Загружается'),
+        ('complete', 'Загружен'),
+    ]
+    
+    # Идентификатор — он же ключ доступа к загрузке, поэтому не последовательный
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chunked_uploads')
+    purpose = models.CharField(max_length=20, choices=PURPOSES, verbose_name=_('Назначение'))
+    filename = models.CharField(max_length=255, verbose_name=_('Исходное имя файла'))
+    content_type = models.CharField(max_length=100, blank=True, default='', verbose_name=_('MIME-тип'))
+    size = models.PositiveBigIntegerField(verbose_name=_('Размер файла'))
+    # Сколько байт уже записано на диск: с этого места продолжается загрузка
+    offset = models.PositiveBigIntegerField(default=0, verbose_name=_('Загружено байт'))
+    status = models.CharField(max_length=10, choices=STATUSES, default='uploading', verbose_name=_('Статус'))
+    sha256 = models.CharField(max_length=64, blank=True, default='', verbose_name=_('SHA-256'))
+    # Путь готового файла относительно MEDIA_ROOT
+    stored_name = models.CharField(max_length=255, blank=True, default='', verbose_name=_('Файл'))
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = _('Загрузка файла')
+        verbose_name_plural = _('Загрузки файлов')
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+
+class MediaBlob(models.Model):
+    """Файл хранилища по содержимому с метаданными и счетчиком ссылок (users.media_store)"""
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name=_('SHA-256'))
+    # Путь относительно MEDIA_ROOT: blobs/ab/<sha256>.<ext>
+    name = models.CharField(max_length=255, unique=True, verbose_name=_('Файл'))
+    size = models.PositiveBigIntegerField(verbose_name=_('Размер файла'))
+    content_type = models.CharField(max_length=100, blank=True, default='', verbose_name=_('MIME-тип'))
+    width = models.PositiveIntegerField(blank=True, null=True, verbose_name=_('Ширина'))
+    height = models.PositiveIntegerField(blank=True, null=True, verbose_name=_('Высота'))
+    duration = models.FloatField(blank=True, null=True, verbose_name=_('Длительность, с'))
+    # Превью изображения {размер: файл} (users.media_variants); None — еще не построены
+    variants = models.JSONField(blank=True, null=True, verbose_name=_('Превью'))
+    # Огибающая голосового сообщения 0..100 (users.voice_analysis); None — еще не посчитана
+    waveform = models.JSONField(blank=True, null=True, verbose_name=_('Огибающая'))
+    # Сообщения, аватары и готовые загрузки, ссылающиеся на файл
+    ref_count = models.IntegerField(default=0, verbose_name=_('Число ссылок'))
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Последнее получение или освобождение ссылки: от него отсчитывается срок удаления
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = _('Файл хранилища')
+        verbose_name_plural = _('Файлы хранилища')
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
@@ -0,0 +1,77 @@
+"""
+Версионированный кэш списка уведомлений
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Время жизни закэшированной страницы уведомлений (секунды)
+NOTIFICATIONS_CACHE_TIMEOUT = getattr(settings, 'NOTIFICATIONS_CACHE_TIMEOUT', 300)
+
+# Размер первой страницы и максимальный размер страницы
+NOTIFICATIONS_PAGE_SIZE = 50
+NOTIFICATIONS_MAX_PAGE_SIZE = 100
+
+
+def _version_key(user_id):
+    return f"notifications_version_{user_id}"
+
+
+def get_notifications_version(user_id):
+    """
+    Текущая версия списка уведомлений пользователя.
+
+    Если ключ версии отсутствует (первое обращение или вытеснение из кэша),
+    он инициализируется текущим временем в миллисекундах, чтобы новая версия
+    никогда не совпала со старой и не подняла устаревшие страницы.
+    """
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_notifications_version(user_id):
+    """
+    Инвалидирует все закэшированные страницы уведомлений пользователя.
+
+    Старые страницы не удаляются явно: они становятся недостижимыми
+    и истекают по таймауту.
+    """
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def bump_notifications_version_on_commit(user_id):
+    """
+    Инвалидация после фиксации транзакции, чтобы конкурентный запрос
+    не закэшировал под новой версией еще не зафиксированные данные
+    """
+    transaction.on_commit(lambda: bump_notifications_version(user_id))
+
+
+def notifications_page_key(user_id, version, cursor=None, page_size=NOTIFICATIONS_PAGE_SIZE):
+    """Ключ кэша для одной страницы уведомлений"""
+    return f"notifications_page_{user_id}_{version}_{cursor or 'first'}_{page_size}"
+
+
+def get_cached_notifications_page(user_id, cursor=None, page_size=NOTIFICATIONS_PAGE_SIZE):
+    """
+    Возвращает (ключ, страница) для текущей версии.
+    Страница равна None, если ее нет в кэше.
+    """
+    version = get_notifications_version(user_id)
+    key = notifications_page_key(user_id, version, cursor, page_size)
+    return key, cache.get(key)
+
+
+def set_cached_notifications_page(key, page):
+    """Сохраняет сериализованную страницу уведомлений"""
+    cache.set(key, page, NOTIFICATIONS_CACHE_TIMEOUT)
@@ -0,0 +1,285 @@
+"""
+Хранение уведомлений: сроки жизни по типам, порционная очистка
+и опциональное помесячное партиционирование таблицы в MySQL
+"""
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from .models import Notification
+from .notification_cache import bump_notifications_version
+
+logger = logging.getLogger(__name__)
+
+# Сроки хранения по умолчанию (дни), переопределяются NOTIFICATION_RETENTION_DAYS
+DEFAULT_RETENTION_DAYS = {
+    'follow': 180,
+    'message': 30,
+    'like': 90,
+    'comment': 180,
+}
+
+STATS_CACHE_KEY = 'notification_retention_stats'
+
+
+def get_retention_days() -> Dict[str, int]:
+    """Сроки хранения уведомлений по типам с учетом настроек"""
+    retention = dict(DEFAULT_RETENTION_DAYS)
+    retention.update(getattr(settings, 'NOTIFICATION_RETENTION_DAYS', {}))
+    return retention
+
+
+def purge_expired_notifications(
+    batch_size: int = None,
+    pause: float = None,
+    max_batches: int = None,
+    dry_run: bool = False,
+    now: datetime = None
+) -> Dict[str, int]:
+    """
+    Удаляет просроченные уведомления небольшими порциями.
+
+    Каждая порция удаляется одним DELETE по диапазону первичного ключа,
+    поэтому блокировки короткие и не мешают вставке новых уведомлений.
+    Между порциями делается пауза, чтобы не забивать репликацию и I/O.
+
+    Returns:
+        Количество удаленных (или найденных при dry_run) строк по типам
+    """
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_PURGE_BATCH_SIZE', 1000)
+    if pause is None:
+        pause = getattr(settings, 'NOTIFICATION_PURGE_PAUSE', 0.1)
+    now = now or timezone.now()
+
+    start_time = time.time()
+    purged: Dict[str, int] = {}
+    batches = 0
+
+    for notification_type, days in get_retention_days().items():
+        cutoff = now - timedelta(days=days)
+        expired = Notification.objects.filter(
+            notification_type=notification_type,
+            created_at__lt=cutoff
+        )
+        purged[notification_type] = 0
+        last_id = 0
+
+        while max_batches is None or batches < max_batches:
+            rows = list(
+                expired.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'recipient_id')[:batch_size]
+            )
+            if not rows:
+                break
+
+            first_id, last_id = rows[0][0], rows[-1][0]
+            batches += 1
+
+            if dry_run:
+                purged[notification_type] += len(rows)
+                continue
+
+            # У Notification нет зависимых моделей и обработчиков сигналов,
+            # поэтому Django выполняет быстрое удаление одним запросом
+            deleted, _ = expired.filter(id__gte=first_id, id__lte=last_id).delete()
+            purged[notification_type] += deleted
+
+            for recipient_id in {recipient_id for _, recipient_id in rows}:
+                bump_notifications_version(recipient_id)
+
+            if pause:
+                time.sleep(pause)
+
+    duration = time.time() - start_time
+    if not dry_run:
+        _record_stats(purged, duration, batches)
+
+    logger.info(
+        f"Очистка уведомлений: {sum(purged.values())} строк за {duration:.2f}s "
+        f"({batches} порций{', dry-run' if dry_run else ''})"
+    )
+    return purged
+
+
+def _record_stats(purged: Dict[str, int], duration: float, batches: int):
+    """Сохраняет метрики очистки для мониторинга производительности"""
+    stats = cache.get(STATS_CACHE_KEY) or {'total_purged': 0, 'runs': 0}
+    stats['runs'] += 1
+    stats['total_purged'] += sum(purged.values())
+    stats['last_run'] = timezone.now().isoformat()
+    stats['last_purged'] = purged
+    stats['last_duration'] = round(duration, 3)
+    stats['last_batches'] = batches
+    cache.set(STATS_CACHE_KEY, stats, None)
+
+
+def get_retention_stats() -> Dict[str, Any]:
+    """Метрики последних запусков очистки"""
+    return cache.get(STATS_CACHE_KEY) or {'total_purged': 0, 'runs': 0}
+
+
+# Партиционирование (только MySQL)
+
+def _table_name():
+    return Notification._meta.db_table
+
+
+def _month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    month = value.month - 1 + months
+    return datetime(value.year + month // 12, month % 12 + 1, 1)
+
+
+def _partition_name(month_start: datetime) -> str:
+    return f"p{month_start:%Y%m}"
+
+
+def _partition_definition(month_start: datetime) -> str:
+    upper = _add_months(month_start, 1)
+    return (
+        f"PARTITION {_partition_name(month_start)} "
+        f"VALUES LESS THAN (TO_DAYS('{upper:%Y-%m-%d}'))"
+    )
+
+
+def partitioning_supported() -> bool:
+    return connection.vendor == 'mysql'
+
+
+def get_partitions() -> List[str]:
+    """Имена существующих партиций таблицы уведомлений"""
+    if not partitioning_supported():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+            "AND PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION",
+            [_table_name()]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def is_partitioned() -> bool:
+    return bool(get_partitions())
+
+
+def build_partitioning_sql(months_ahead: int = 3, now: datetime = None) -> List[str]:
+    """
+    SQL для перевода таблицы на помесячные партиции по created_at.
+
+    MySQL не поддерживает внешние ключи в партиционированных таблицах
+    и требует, чтобы ключ партиционирования входил в первичный ключ.
+    Поэтому FK-ограничения снимаются (каскадное удаление Django выполняет
+    сам), а первичный ключ становится составным (id, created_at).
+    """
+    table = _table_name()
+    now = now or timezone.now()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+            "AND REFERENCED_TABLE_NAME IS NOT NULL",
+            [table]
+        )
+        foreign_keys = sorted({row[0] for row in cursor.fetchall()})
+        cursor.execute(f"SELECT MIN(created_at) FROM {table}")
+        oldest = cursor.fetchone()[0] or now
+
+    statements = [
+        f"ALTER TABLE {table} DROP FOREIGN KEY {name}" for name in foreign_keys
+    ]
+    statements.append(
+        f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)"
+    )
+
+    month = _month_start(oldest)
+    last_month = _add_months(_month_start(now), months_ahead)
+    definitions = []
+    while month <= last_month:
+        definitions.append(_partition_definition(month))
+        month = _add_months(month, 1)
+    definitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+
+    statements.append(
+        f"ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS(created_at)) (\n    "
+        + ",\n    ".join(definitions)
+        + "\n)"
+    )
+    return statements
+
+
+def ensure_future_partitions(months_ahead: int = 3, now: datetime = None) -> List[str]:
+    """Выделяет из pmax партиции на months_ahead месяцев вперед"""
+    partitions = get_partitions()
+    if not partitions:
+        return []
+
+    now = now or timezone.now()
+    missing = []
+    month = _month_start(now)
+    for _ in range(months_ahead + 1):
+        if _partition_name(month) not in partitions:
+            missing.append(month)
+        month = _add_months(month, 1)
+
+    # Новые партиции можно выделить только из pmax, т.е. после последней месячной
+    monthly = [name for name in partitions if name != 'pmax']
+    if monthly:
+        missing = [m for m in missing if _partition_name(m) > monthly[-1]]
+    if not missing:
+        return []
+
+    definitions = [_partition_definition(m) for m in missing]
+    definitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"ALTER TABLE {_table_name()} REORGANIZE PARTITION pmax INTO ("
+            + ", ".join(definitions) + ")"
+        )
+    return [_partition_name(m) for m in missing]
+
+
+def drop_expired_partitions(now: datetime = None) -> Dict[str, int]:
+    """
+    Удаляет целиком партиции, все строки которых старше максимального срока
+    хранения. DROP PARTITION освобождает место мгновенно, без построчного DELETE.
+    """
+    partitions = [name for name in get_partitions() if name != 'pmax']
+    if not partitions:
+        return {}
+
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=max(get_retention_days().values()))
+    table = _table_name()
+    dropped = {}
+
+    for name in partitions:
+        month_start = datetime.strptime(name[1:], '%Y%m')
+        if _add_months(month_start, 1) > cutoff.replace(tzinfo=None):
+            break
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT recipient_id, COUNT(*) FROM {table} PARTITION ({name}) "
+                f"GROUP BY recipient_id"
+            )
+            counts = cursor.fetchall()
+            cursor.execute(f"ALTER TABLE {table} DROP PARTITION {name}")
+
+        for recipient_id, _ in counts:
+            bump_notifications_version(recipient_id)
+        dropped[name] = sum(count for _, count in counts)
+
+    return dropped
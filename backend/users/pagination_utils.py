@@ -1,9 +1,10 @@
 """
 Утилиты для оптимизированной пагинации
 """
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.core.paginator import Paginator
-from django.db.models import QuerySet
-from typing import Dict, Any, List
+from django.db.models import QuerySet, Q
+from typing import Dict, Any, List, Optional, Tuple
 
 
 def get_optimized_paginated_data(
@@ -52,7 +53,8 @@ def get_cursor_paginated_data(
     queryset: QuerySet,
     cursor: str = None,
     page_size: int = 20,
-    ordering_field: str = 'id'
+    ordering_field: str = 'id',
+    descending: bool = False
 ) -> Dict[str, Any]:
     """
     Курсорная пагинация для больших наборов данных
@@ -62,6 +64,7 @@ def get_cursor_paginated_data(
         cursor: Курсор для следующей страницы
         page_size: Размер страницы
         ordering_field: Поле для сортировки
+        descending: Сортировка от новых к старым (курсор двигается вниз)
     
     Returns:
         Словарь с данными курсорной пагинации
@@ -73,12 +76,14 @@ def get_cursor_paginated_data(
     if cursor:
         try:
             cursor_value = int(cursor)
-            queryset = queryset.filter(**{f'{ordering_field}__gt': cursor_value})
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(**{f'{ordering_field}__{lookup}': cursor_value})
         except (ValueError, TypeError):
             pass
     
     # Получаем данные
-    results = list(queryset.order_by(ordering_field)[:page_size + 1])
+    ordering = f'-{ordering_field}' if descending else ordering_field
+    results = list(queryset.order_by(ordering)[:page_size + 1])
     
     # Определяем есть ли следующая страница
     has_next = len(results) > page_size
@@ -97,3 +102,83 @@ def get_cursor_paginated_data(
         'next_cursor': next_cursor,
         'count': len(results),
     }
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_keyset_cursor(value: datetime, pk: int) -> str:
+    """Курсор вида '<микросекунды с эпохи>_<id>' без потери точности"""
+    delta = value - _EPOCH
+    microseconds = (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+    return f"{microseconds}_{pk}"
+
+
+def decode_keyset_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    try:
+        microseconds, pk = cursor.split('_', 1)
+        return _EPOCH + timedelta(microseconds=int(microseconds)), int(pk)
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def _keyset_slice(
+    queryset: QuerySet,
+    cursor: Optional[str],
+    page_size: int,
+    time_field: str
+) -> QuerySet:
+    """Запрос страницы keyset-пагинации (page_size + 1 строка для has_next)"""
+    decoded = decode_keyset_cursor(cursor) if cursor else None
+    if decoded:
+        value, pk = decoded
+        queryset = queryset.filter(
+            Q(**{f'{time_field}__lt': value}) |
+            Q(**{time_field: value, 'id__lt': pk})
+        )
+    return queryset.order_by(f'-{time_field}', '-id')[:page_size + 1]
+
+
+def _keyset_page(results: List[Any], page_size: int, time_field: str) -> Dict[str, Any]:
+    has_next = len(results) > page_size
+    if has_next:
+        results = results[:page_size]
+    
+    next_cursor = None
+    if has_next and results:
+        last_item = results[-1]
+        next_cursor = encode_keyset_cursor(getattr(last_item, time_field), last_item.id)
+    
+    return {
+        'results': results,
+        'has_next': has_next,
+        'next_cursor': next_cursor,
+        'count': len(results),
+    }
+
+
+def get_keyset_paginated_data(
+    queryset: QuerySet,
+    cursor: str = None,
+    page_size: int = 20,
+    time_field: str = 'created_at'
+) -> Dict[str, Any]:
+    """
+    Курсорная пагинация от новых к старым по паре (time_field, id).
+    Нужен составной индекс (..., time_field, id).
+    """
+    page_size = min(page_size, 100)
+    results = list(_keyset_slice(queryset, cursor, page_size, time_field))
+    return _keyset_page(results, page_size, time_field)
+
+
+async def aget_keyset_paginated_data(
+    queryset: QuerySet,
+    cursor: str = None,
+    page_size: int = 20,
+    time_field: str = 'created_at'
+) -> Dict[str, Any]:
+    """Асинхронный вариант get_keyset_paginated_data (async ORM)"""
+    page_size = min(page_size, 100)
+    results = [item async for item in _keyset_slice(queryset, cursor, page_size, time_field)]
+    return _keyset_page(results, page_size, time_field)
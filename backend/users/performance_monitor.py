@@ -72,6 +72,12 @@ class PerformanceMonitor:
         if duration > threshold:
             logger.warning(f"Медленный запрос ({duration:.3f}s): {query[:200]}...")
     
+    @staticmethod
+    def get_notification_retention_stats() -> Dict[str, Any]:
+        """Получить метрики очистки уведомлений"""
+        from .notification_retention import get_retention_stats
+        return get_retention_stats()
+    
     @staticmethod
     def get_performance_summary() -> Dict[str, Any]:
         """Получить сводку по производительности"""
@@ -79,6 +85,7 @@ class PerformanceMonitor:
             'system': PerformanceMonitor.get_system_stats(),
             'database': PerformanceMonitor.get_database_stats(),
             'cache': PerformanceMonitor.get_cache_stats(),
+            'notification_retention': PerformanceMonitor.get_notification_retention_stats(),
             'timestamp': time.time(),
         }
 
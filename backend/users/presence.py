@@ -0,0 +1,257 @@
+"""
+Присутствие пользователей (онлайн и «был в сети»).
+
+Онлайн-статус — ключ presence_<id> в кэше со сроком жизни PRESENCE_TTL.
+В продакшене кэш — Redis (django-redis, settings_production), общий для всех
+воркеров daphne. С LocMemCache (разработка, core/settings.py) у каждого
+процесса свой набор онлайн-пользователей: так работает только один процесс. Каждый процесс раз в
+PRESENCE_HEARTBEAT_INTERVAL продлевает ключи всех своих подключенных
+пользователей одним set_many. Время «был в сети» копится в памяти и
+записывается в User.last_seen пачкой раз в PRESENCE_LAST_SEEN_FLUSH_INTERVAL.
+
+Смена статуса рассылается только в группу presence_<id>: в ней состоят
+соединения, которые подписались на этого пользователя (он у них на экране).
+Офлайн объявляется через PRESENCE_OFFLINE_GRACE после закрытия последнего
+соединения, поэтому перезагрузка страницы не дает мигания статуса.
+"""
+import asyncio
+import datetime
+import time
+import weakref
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import serializers
+
+from .models import User
+
+PRESENCE_TTL = getattr(settings, 'PRESENCE_TTL', 60)
+PRESENCE_HEARTBEAT_INTERVAL = getattr(settings, 'PRESENCE_HEARTBEAT_INTERVAL', 20)
+PRESENCE_OFFLINE_GRACE = getattr(settings, 'PRESENCE_OFFLINE_GRACE', 10)
+PRESENCE_LAST_SEEN_FLUSH_INTERVAL = getattr(settings, 'PRESENCE_LAST_SEEN_FLUSH_INTERVAL', 60)
+
+# Сколько пользователей одно соединение может отслеживать одновременно
+PRESENCE_MAX_SUBSCRIPTIONS = 200
+
+datetime_field = serializers.DateTimeField()
+
+
+def presence_key(user_id):
+    return f"presence_{user_id}"
+
+
+def presence_group_name(user_id):
+    """Группа channel layer подписчиков на статус пользователя"""
+    return f"presence_{user_id}"
+
+
+def timestamp_to_datetime(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+
+
+def format_last_seen(value):
+    return datetime_field.to_representation(value) if value else None
+
+
+def _online_from_values(user_ids, values):
+    return {
+        user_id: values[presence_key(user_id)]
+        for user_id in user_ids
+        if presence_key(user_id) in values
+    }
+
+
+def get_online_timestamps(user_ids):
+    """Одно обращение к кэшу: {user_id: время последнего сигнала} для онлайн-пользователей"""
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return {}
+    values = cache.get_many([presence_key(user_id) for user_id in user_ids])
+    return _online_from_values(user_ids, values)
+
+
+async def aget_online_timestamps(user_ids):
+    """Асинхронный вариант get_online_timestamps"""
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return {}
+    values = await cache.aget_many([presence_key(user_id) for user_id in user_ids])
+    return _online_from_values(user_ids, values)
+
+
+def get_online_user_ids(user_ids):
+    """Кто из переданных пользователей сейчас онлайн"""
+    return set(get_online_timestamps(user_ids))
+
+
+def build_presence(user_id, online, last_seen=None):
+    """Статус в формате API: is_online и last_seen (ISO)"""
+    if user_id in online:
+        last_seen = timestamp_to_datetime(online[user_id])
+    return {
+        'is_online': user_id in online,
+        'last_seen': format_last_seen(last_seen),
+    }
+
+
+def get_presence_map(users):
+    """Статусы для уже загруженных пользователей: {user_id: presence}"""
+    users = [user for user in users if user is not None]
+    online = get_online_timestamps(user.id for user in users)
+    return {user.id: build_presence(user.id, online, user.last_seen) for user in users}
+
+
+async def aget_presence_map(users):
+    """Асинхронный вариант get_presence_map"""
+    users = [user for user in users if user is not None]
+    online = await aget_online_timestamps(user.id for user in users)
+    return {user.id: build_presence(user.id, online, user.last_seen) for user in users}
+
+
+def get_presence_snapshot(user_ids):
+    """Статусы по id: онлайн из кэша, last_seen остальных — одним запросом"""
+    online = get_online_timestamps(user_ids)
+    offline_ids = set(user_ids) - set(online)
+    last_seen = dict(
+        User.objects.filter(id__in=offline_ids).values_list('id', 'last_seen')
+    ) if offline_ids else {}
+    return {
+        user_id: build_presence(user_id, online, last_seen.get(user_id))
+        for user_id in user_ids
+    }
+
+
+def mark_online(user_ids):
+    """
+    Продлевает ключи присутствия одним set_many.
+    Возвращает тех, кто до этого был офлайн (им нужна рассылка «онлайн»).
+    """
+    if not user_ids:
+        return []
+    was_online = get_online_user_ids(user_ids)
+    now = time.time()
+    cache.set_many({presence_key(user_id): now for user_id in user_ids}, PRESENCE_TTL)
+    return [user_id for user_id in user_ids if user_id not in was_online]
+
+
+def mark_leaving(user_id):
+    """Последнее соединение процесса закрыто: ключ живет еще PRESENCE_OFFLINE_GRACE"""
+    now = time.time()
+    cache.set(presence_key(user_id), now, PRESENCE_OFFLINE_GRACE)
+    return now
+
+
+def confirm_offline(user_id, leaving_timestamp):
+    """
+    Пользователь офлайн, если за время ожидания ключ никто не продлил
+    (ни переподключение, ни соединения в других воркерах).
+    """
+    key = presence_key(user_id)
+    value = cache.get(key)
+    if value is not None and value != leaving_timestamp:
+        return False
+    cache.delete(key)
+    return True
+
+
+def flush_last_seen(last_seen):
+    """Записывает {user_id: datetime} в User.last_seen одним пакетным UPDATE"""
+    if not last_seen:
+        return
+    User.objects.bulk_update(
+        [User(id=user_id, last_seen=value) for user_id, value in last_seen.items()],
+        ['last_seen'],
+        batch_size=500
+    )
+
+
+def build_presence_event(user_id, is_online, last_seen=None):
+    """Событие для channel layer (ChatConsumer.presence_changed)"""
+    return {
+        'type': 'presence_changed',
+        'user_id': user_id,
+        'is_online': is_online,
+        'last_seen': format_last_seen(last_seen),
+    }
+
+
+class PresenceTracker:
+    """Соединения процесса по пользователям, пакетный heartbeat и запись last_seen"""
+
+    def __init__(self, channel_layer):
+        self.channel_layer = channel_layer
+        self.connections = {}
+        self.last_seen = {}
+        self.heartbeat_task = None
+        self.flushed_at = time.monotonic()
+
+    async def connect(self, user_id):
+        self.connections[user_id] = self.connections.get(user_id, 0) + 1
+        if self.connections[user_id] == 1:
+            came_online = await sync_to_async(mark_online)([user_id])
+            await self.publish_online(came_online)
+        if self.heartbeat_task is None or self.heartbeat_task.done():
+            self.heartbeat_task = asyncio.ensure_future(self.heartbeat_loop())
+
+    async def disconnect(self, user_id):
+        count = self.connections.get(user_id, 0) - 1
+        if count > 0:
+            self.connections[user_id] = count
+            return
+        self.connections.pop(user_id, None)
+        self.last_seen[user_id] = timestamp_to_datetime(time.time())
+        leaving_timestamp = await sync_to_async(mark_leaving)(user_id)
+        asyncio.ensure_future(self.announce_offline(user_id, leaving_timestamp))
+
+    def touch(self, user_id):
+        """Активность клиента (ping): время попадет в ближайшую пачку last_seen"""
+        self.last_seen[user_id] = timestamp_to_datetime(time.time())
+
+    async def announce_offline(self, user_id, leaving_timestamp):
+        await asyncio.sleep(PRESENCE_OFFLINE_GRACE)
+        if user_id in self.connections:
+            return
+        if await sync_to_async(confirm_offline)(user_id, leaving_timestamp):
+            await self.channel_layer.group_send(
+                presence_group_name(user_id),
+                build_presence_event(user_id, False, timestamp_to_datetime(leaving_timestamp))
+            )
+
+    async def publish_online(self, user_ids):
+        for user_id in user_ids:
+            await self.channel_layer.group_send(
+                presence_group_name(user_id),
+                build_presence_event(user_id, True)
+            )
+
+    async def heartbeat_loop(self):
+        """Один set_many на всех пользователей процесса вместо записи на каждый ping"""
+        while self.connections or self.last_seen:
+            await asyncio.sleep(PRESENCE_HEARTBEAT_INTERVAL)
+            try:
+                # Ключ мог истечь (например, другой воркер объявил офлайн) — снова онлайн
+                came_online = await sync_to_async(mark_online)(list(self.connections))
+                await self.publish_online(came_online)
+                if time.monotonic() - self.flushed_at >= PRESENCE_LAST_SEEN_FLUSH_INTERVAL:
+                    await self.flush()
+            except Exception as e:
+                print(f"Ошибка обновления присутствия: {e}")
+
+    async def flush(self):
+        batch, self.last_seen = self.last_seen, {}
+        self.flushed_at = time.monotonic()
+        await database_sync_to_async(flush_last_seen)(batch)
+
+
+_trackers = weakref.WeakKeyDictionary()
+
+
+def get_presence_tracker(channel_layer):
+    """Общий трекер для всех соединений текущего event loop"""
+    loop = asyncio.get_running_loop()
+    tracker = _trackers.get(loop)
+    if tracker is None:
+        tracker = _trackers[loop] = PresenceTracker(channel_layer)
+    return tracker
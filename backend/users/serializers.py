@@ -1,8 +1,13 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
-from django.utils import timezone
 from .models import User, Child, Follow, Notification, ChatMessage, Chat
+from .user_cards import CardListSerializer, context_card
+from .chat_inbox import is_read_by_others
+from .media_store import serialize_blob_meta
+from .media_access import chat_media_url
+from .direct_chats import get_or_create_direct_chat
+from .presence import get_presence_map
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -107,25 +112,35 @@ class FollowSerializer(serializers.ModelSerializer):
 
 
 class NotificationSerializer(serializers.ModelSerializer):
-    sender = UserDetailSerializer(read_only=True)
-    recipient = UserDetailSerializer(read_only=True)
+    """
+    Компактное уведомление: карточка отправителя без эха получателя.
+    Ожидает queryset с select_related('post__category'); карточки
+    отправителей списка загружаются пачкой из кэша (users.user_cards).
+    """
+    sender = serializers.SerializerMethodField()
     post_info = serializers.SerializerMethodField()
     
     class Meta:
         model = Notification
-        fields = ('id', 'sender', 'recipient', 'notification_type', 'message', 'post', 'post_info', 'is_read', 'created_at')
+        fields = ('id', 'sender', 'notification_type', 'message', 'post', 'post_info', 'is_read', 'created_at')
         read_only_fields = ('id', 'created_at')
+        list_serializer_class = CardListSerializer
+        card_user_fields = ('sender_id',)
+    
+    def get_sender(self, obj):
+        return context_card(self.context, obj.sender_id)
     
     def get_post_info(self, obj):
         """Возвращает информацию о посте для уведомлений о комментариях и лайках"""
-        if obj.post:
-            return {
-                'id': obj.post.id,
-                'title': obj.post.title,
-                'slug': obj.post.slug,
-                'category': obj.post.category.name if obj.post.category else None
-            }
-        return None
+        if obj.post_id is None:
+            return None
+        post = obj.post
+        return {
+            'id': post.id,
+            'title': post.title,
+            'slug': post.slug,
+            'category': post.category.name if post.category_id else None
+        }
 
 
 class UserSearchSerializer(serializers.ModelSerializer):
@@ -162,12 +177,15 @@ class UserProfileWithPostsSerializer(serializers.ModelSerializer):
     following_count = serializers.SerializerMethodField()
     children = ChildSerializer(many=True, read_only=True)
     posts = serializers.SerializerMethodField()
+    is_online = serializers.SerializerMethodField()
+    last_seen = serializers.SerializerMethodField()
     
     class Meta:
         model = User
         fields = ('id', 'email', 'username', 'first_name', 'last_name', 'full_name', 
                  'status', 'city', 'birth_date', 'avatar', 'date_joined', 
-                 'posts_count', 'published_posts_count', 'followers_count', 'following_count', 'children', 'posts')
+                 'posts_count', 'published_posts_count', 'followers_count', 'following_count', 'children', 'posts',
+                 'is_online', 'last_seen')
         read_only_fields = ('id', 'email', 'date_joined')
     
     def get_posts_count(self, obj):
@@ -188,6 +206,19 @@ class UserProfileWithPostsSerializer(serializers.ModelSerializer):
         print(f"Подписки {obj.username}: {count}")
         return count
     
+    def get_presence(self, obj):
+        """Статус присутствия (одно обращение к кэшу на профиль)"""
+        presence = getattr(self, '_presence', None)
+        if presence is None or obj.id not in presence:
+            presence = self._presence = get_presence_map([obj])
+        return presence[obj.id]
+    
+    def get_is_online(self, obj):
+        return self.get_presence(obj)['is_online']
+    
+    def get_last_seen(self, obj):
+        return self.get_presence(obj)['last_seen']
+    
     def get_posts(self, obj):
         """Получаем все посты пользователя (включая черновики)"""
         from posts.serializers import PostListSerializer
@@ -211,70 +242,72 @@ class ChatMessageSerializer(serializers.ModelSerializer):
     sender_info = serializers.SerializerMethodField()
     file_url = serializers.SerializerMethodField()
     file_size = serializers.SerializerMethodField()
+    file_meta = serializers.SerializerMethodField()
+    preview_url = serializers.SerializerMethodField()
     reply_to_message = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
     
     class Meta:
         model = ChatMessage
         fields = [
-            'id', 'content', 'message_type', 'file_url', 'file_size', 
+            'id', 'seq', 'content', 'message_type', 'file_url', 'file_size', 'file_meta', 'preview_url', 
             'reply_to', 'reply_to_message', 'is_read', 'is_edited', 
             'created_at', 'updated_at', 'sender', 'sender_name', 'sender_avatar', 'sender_info'
         ]
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['seq', 'created_at', 'updated_at']
+        list_serializer_class = CardListSerializer
+        card_user_fields = ('sender_id',)
     
     def get_sender_name(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             # Если отправитель - текущий пользователь, возвращаем "Вы"
-            if obj.sender.id == request.user.id:
+            if obj.sender_id == request.user.id:
                 return "Вы"
-        return obj.sender.first_name or obj.sender.username
+        card = context_card(self.context, obj.sender_id)
+        return card and (card['first_name'] or card['username'])
     
     def get_sender_avatar(self, obj):
-        if obj.sender.avatar:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.sender.avatar.url)
-            return obj.sender.avatar.url
-        return None
+        card = context_card(self.context, obj.sender_id)
+        return card and card['avatar']
     
     def get_sender_info(self, obj):
-        """Полная информация об отправителе"""
-        request = self.context.get('request')
-        avatar_url = None
-        if obj.sender.avatar:
-            if request:
-                avatar_url = request.build_absolute_uri(obj.sender.avatar.url)
-            else:
-                avatar_url = obj.sender.avatar.url
-        
-        return {
-            'id': obj.sender.id,
-            'username': obj.sender.username,
-            'first_name': obj.sender.first_name,
-            'last_name': obj.sender.last_name,
-            'avatar': avatar_url
-        }
+        """Карточка отправителя из кэша (users.user_cards), без join с User"""
+        return context_card(self.context, obj.sender_id)
     
     def get_file_url(self, obj):
-        if obj.file:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.file.url)
-            return obj.file.url
-        return None
+        # Ссылка с подписью чата: файл открывается только из этого чата
+        return chat_media_url(obj.file, obj.chat_id, self.context.get('request'))
     
     def get_file_size(self, obj):
         return obj.get_file_size()
     
+    def get_file_meta(self, obj):
+        # Ожидает select_related('blob'); для файлов вне хранилища — None
+        if not obj.blob_id:
+            return None
+        return serialize_blob_meta(obj.blob)
+    
+    def get_preview_url(self, obj):
+        # Картинка в ленте сообщений показывается превью, оригинал — по file_url
+        if obj.message_type != 'image' or not obj.file:
+            return None
+        variants = (obj.blob.variants if obj.blob_id else None) or {}
+        return chat_media_url(obj.file, obj.chat_id, self.context.get('request'), variants.get('w480'))
+    
+    def get_is_read(self, obj):
+        # Прочитанность вычисляется по курсорам участников (context['read_cursors'])
+        read_cursors = self.context.get('read_cursors')
+        if read_cursors is None:
+            return obj.is_read
+        return is_read_by_others(obj, read_cursors)
+    
     def get_reply_to_message(self, obj):
-        if obj.reply_to:
-            return {
-                'id': obj.reply_to.id,
-                'content': obj.reply_to.content,
-                'sender_name': obj.reply_to.sender.first_name or obj.reply_to.sender.username,
-                'message_type': obj.reply_to.message_type
-            }
+        # Снимок сохраняется при отправке; join нужен только для старых строк
+        if obj.reply_preview:
+            return obj.reply_preview
+        if obj.reply_to_id and obj.reply_to:
+            return obj.reply_to.build_reply_preview()
         return None
 
 class ChatSerializer(serializers.ModelSerializer):
@@ -302,13 +335,12 @@ class ChatSerializer(serializers.ModelSerializer):
         if request and request.user.is_authenticated:
             other_user = obj.get_other_participant(request.user)
             if other_user:
+                presence = self.context.get('presence') or {}
+                if other_user.id not in presence:
+                    presence = get_presence_map([other_user])
                 return {
-                    'id': other_user.id,
-                    'username': other_user.username,
-                    'first_name': other_user.first_name,
-                    'last_name': other_user.last_name,
-                    'avatar': request.build_absolute_uri(other_user.avatar.url) if other_user.avatar else None,
-                    'city': other_user.city
+                    **context_card(self.context, other_user.id),
+                    **presence[other_user.id]
                 }
         return None
 
@@ -323,26 +355,11 @@ class ChatCreateSerializer(serializers.ModelSerializer):
         participant_id = validated_data.pop('participant_id')
         current_user = self.context['request'].user
         
-        # Проверяем, существует ли уже чат между этими пользователями
-        existing_chat = Chat.objects.filter(
-            participants=current_user
-        ).filter(
-            participants__id=participant_id
-        ).first()
-        
-        if existing_chat:
-            return existing_chat
-        
-        # Создаем новый чат
-        chat = Chat.objects.create()
-        
-        # Получаем объект пользователя по ID
-        try:
-            participant_user = User.objects.get(id=participant_id)
-            chat.participants.add(current_user, participant_user)
-        except User.DoesNotExist:
+        if not User.objects.filter(id=participant_id).exists():
             raise serializers.ValidationError("Пользователь не найден")
         
+        # Существующий чат находится по канонической паре участников
+        chat, created = get_or_create_direct_chat(current_user.id, participant_id)
         return chat
 
 class ChatMessageCreateSerializer(serializers.ModelSerializer):
@@ -364,8 +381,5 @@ class ChatMessageCreateSerializer(serializers.ModelSerializer):
         
         print(f"Сообщение создано с ID: {message.id}")
         
-        # Обновляем время последнего обновления чата
-        chat.updated_at = timezone.now()
-        chat.save()
-        
+        # Время обновления и последнее сообщение чата обновляются в ChatMessage.save
         return message
\ No newline at end of file
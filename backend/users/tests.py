@@ -1,3 +1,550 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.ws_fanout import encode_message
+
+from .chat_inbox import CHAT_INBOX_MAX_PAGE_SIZE, clamp_inbox_page_size
+from .chat_replay import get_replay_messages, remember_chat_events, replay_key
+from .chat_write_batcher import ChatWriteBatcher, PendingMessage, chat_group_name, persist_message_batch
+from .consumers import ChatConsumer
+from .direct_chats import get_or_create_direct_chat
+from .media_access import CHAT_MEDIA_URL_MAX_AGE, chat_media_url
+from .media_gc import MediaGCError, collect_orphans
+from .media_store import acquire_blob, purge_unreferenced_blobs, release_blob
+from .media_views import RangeNotSatisfiable, parse_byte_range
+from .models import ChatMessage, ChunkedUpload, MediaBlob, User
+from .typing_indicators import TypingCoordinator
+from .user_cards import get_card_data
+from .websocket_pool import OptimizedChatConsumer, connection_pool
+
+
+class NetworkChannelLayer(InMemoryChannelLayer):
+    """Слой, который, как Redis или брокер, переключает задачи на group_send"""
+
+    async def group_send(self, group, message):
+        await asyncio.sleep(0.01)
+        await super().group_send(group, message)
+
+
+class SendMessageOrderTests(SimpleTestCase):
+    """Сообщения соединения встают в очередь батчера в порядке кадров"""
+
+    async def test_typing_stop_does_not_reorder_messages(self):
+        channel_layer = NetworkChannelLayer()
+        batcher = ChatWriteBatcher(channel_layer, delay=60)
+        consumer = ChatConsumer()
+        consumer.user = User(id=1, username='sender')
+        consumer.channel_layer = channel_layer
+        consumer.send_event = mock.AsyncMock()
+        consumer.typing_indicators = TypingCoordinator(channel_layer)
+        # Отправитель печатает: первое сообщение завершит индикатор (group_send)
+        await consumer.typing_indicators.typing(chat_group_name(1, 2), 1, 'sender')
+
+        with mock.patch('users.consumers.get_chat_write_batcher', return_value=batcher):
+            tasks = [
+                asyncio.ensure_future(consumer.send_message({'user_id': 2, 'content': str(number)}))
+                for number in (1, 2, 3)
+            ]
+            await asyncio.sleep(0.05)
+            self.assertEqual([item.content for item in batcher.pending], ['1', '2', '3'])
+            for task in tasks:
+                task.cancel()
+            batcher.flush_task.cancel()
+
+
+class FailingChannelLayer(InMemoryChannelLayer):
+    """Слой, у которого рассылка в группы не проходит (сбой брокера)"""
+
+    async def group_send(self, group, message):
+        raise ConnectionError('broker is down')
+
+
+class SendMessageErrorTests(SimpleTestCase):
+    """Ошибки отдельной задачи send_message доходят до клиента событием error"""
+
+    def make_consumer(self, channel_layer):
+        consumer = ChatConsumer()
+        consumer.user = User(id=1, username='sender')
+        consumer.channel_layer = channel_layer
+        consumer.send_event = mock.AsyncMock()
+        consumer.typing_indicators = TypingCoordinator(channel_layer)
+        return consumer
+
+    async def test_bad_recipient_id(self):
+        consumer = self.make_consumer(InMemoryChannelLayer())
+        await consumer.send_message({'user_id': 'abc', 'content': 'text'})
+        consumer.send_event.assert_awaited_once_with({'type': 'error', 'message': 'Неверный ID получателя'})
+
+    async def test_failure_before_write(self):
+        consumer = self.make_consumer(InMemoryChannelLayer())
+        with mock.patch('users.consumers.get_chat_write_batcher', side_effect=RuntimeError('no batcher')):
+            await consumer.send_message({'user_id': 2, 'content': 'text'})
+        consumer.send_event.assert_awaited_once_with({'type': 'error', 'message': 'no batcher'})
+
+
+class BatchBroadcastFailureTests(SimpleTestCase):
+    """Сбой рассылки после записи не оставляет отправителей без подтверждения"""
+
+    async def test_futures_resolved_when_group_send_fails(self):
+        batcher = ChatWriteBatcher(FailingChannelLayer(), delay=0)
+
+        def persist(items):
+            for number, item in enumerate(items, start=1):
+                item.message = mock.Mock(id=number, chat_id=10)
+                item.message_data = {'id': number}
+            return [(2, {'id': 1})]
+
+        with mock.patch('users.chat_write_batcher.persist_message_batch', persist), \
+                self.assertLogs('users.chat_write_batcher', 'ERROR') as logs:
+            futures = [batcher.enqueue(User(id=1), 2, str(number)) for number in range(3)]
+            results = await asyncio.wait_for(asyncio.gather(*futures), 1)
+
+        self.assertEqual(results, [{'id': 1}, {'id': 2}, {'id': 3}])
+        # Три сообщения и одно уведомление
+        self.assertEqual(len(logs.records), 4)
+
+
+class MediaGCFastAPITests(TestCase):
+    """gc_media не удаляет файлы сообщений FastAPI, который пишет в тот же MEDIA_ROOT"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.root, CHUNKED_UPLOAD_DIR=os.path.join(self.root, 'uploads_tmp')
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        old = time.time() - 7 * 24 * 3600
+        for name in ('messages/fastapi1.jpg', 'messages/deleted.jpg', 'chat_files/orphan.txt'):
+            path = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(b'data')
+            os.utime(path, (old, old))
+
+    def fastapi_database(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'fastapi.db')
+        connection = sqlite3.connect(path)
+        connection.executescript(
+            "CREATE TABLE messages (id INTEGER PRIMARY KEY);"
+            "CREATE TABLE message_files (id INTEGER PRIMARY KEY, message_id INTEGER, file_path TEXT);"
+            "INSERT INTO messages (id) VALUES (1);"
+            "INSERT INTO message_files (message_id, file_path) VALUES (1, 'media/messages/fastapi1.jpg');"
+            # Строка файла удаленного сообщения остается, но ссылкой не считается
+            "INSERT INTO message_files (message_id, file_path) VALUES (2, 'media/messages/deleted.jpg');"
+        )
+        connection.commit()
+        connection.close()
+        return f'sqlite:///{path}'
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.root, name))
+
+    def test_refuses_without_fastapi_database(self):
+        with self.assertRaises(MediaGCError):
+            collect_orphans(fastapi_database_url='')
+        with self.assertRaises(CommandError):
+            call_command('gc_media', fastapi_database='', stdout=io.StringIO())
+        self.assertTrue(self.exists('messages/fastapi1.jpg'))
+
+    def test_keeps_fastapi_message_files(self):
+        stats = collect_orphans(fastapi_database_url=self.fastapi_database())
+        self.assertTrue(self.exists('messages/fastapi1.jpg'))
+        self.assertFalse(self.exists('messages/deleted.jpg'))
+        self.assertFalse(self.exists('chat_files/orphan.txt'))
+        self.assertEqual(stats['orphans'], 2)
+
+
+class ChatListParticipantsTests(TestCase):
+    """Элемент списка чатов содержит participants (ChatModal.js ищет по ним чат)"""
+
+    def test_chat_list_entry_has_participants(self):
+        first = User.objects.create_user(email='first@example.com', username='first', password='x')
+        second = User.objects.create_user(email='second@example.com', username='second', password='x')
+        get_or_create_direct_chat(first.id, second.id)
+        token = AccessToken.for_user(first)
+
+        response = self.client.get('/api/users/async/chats/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        chat = response.json()['chats'][0]
+        self.assertEqual({participant['id'] for participant in chat['participants']}, {first.id, second.id})
+        self.assertEqual(chat['other_participant']['id'], second.id)
+
+    def test_chat_list_page_size_is_clamped(self):
+        user = User.objects.create_user(email='first@example.com', username='first', password='x')
+        for number in range(3):
+            other = User.objects.create_user(email=f'u{number}@example.com', username=f'u{number}', password='x')
+            get_or_create_direct_chat(user.id, other.id)
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+
+        for page_size, expected in (('abc', 3), ('100000', 3), ('0', 1), ('2', 2)):
+            response = self.client.get('/api/users/async/chats/', {'page_size': page_size}, **headers)
+            self.assertEqual(response.status_code, 200, page_size)
+            self.assertEqual(len(response.json()['chats']), expected, page_size)
+        self.assertEqual(clamp_inbox_page_size('100000'), CHAT_INBOX_MAX_PAGE_SIZE)
+
+
+class ChatReplayBufferTests(SimpleTestCase):
+    """Буфер догрузки занимает один ключ кэша на чат"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_ring_is_one_key_per_chat(self):
+        with mock.patch('users.chat_replay.CHAT_REPLAY_BUFFER_SIZE', 3):
+            remember_chat_events([(7, seq, {'seq': seq}) for seq in range(1, 5)])
+            remember_chat_events([(7, 5, {'seq': 5}), (8, 1, {'seq': 1})])
+
+            self.assertEqual(sorted(cache.get(replay_key(7))), [3, 4, 5])
+            self.assertEqual(get_replay_messages(7, 2, 5), [{'seq': 3}, {'seq': 4}, {'seq': 5}])
+            # Номер 2 вытеснен
+            self.assertIsNone(get_replay_messages(7, 1, 5))
+            # Номер 2 чата 8 записан в БД, но еще не разослан
+            self.assertEqual(get_replay_messages(8, 0, 2), [{'seq': 1}])
+
+
+class BatchInsertWithoutReturningTests(TestCase):
+    """Без id из bulk INSERT (MySQL) сообщения пачки вставляются одним запросом"""
+
+    def test_ids_read_back_by_chat_and_seq(self):
+        sender = User.objects.create_user(email='sender@example.com', username='sender', password='x')
+        first = User.objects.create_user(email='first@example.com', username='first', password='x')
+        second = User.objects.create_user(email='second@example.com', username='second', password='x')
+        items = [
+            PendingMessage(sender, recipient.id, f'm{number}', 'text', None, None)
+            for number, recipient in enumerate((first, second, first, second))
+        ]
+
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False), \
+                CaptureQueriesContext(connection) as queries:
+            persist_message_batch(items)
+
+        message_table = ChatMessage._meta.db_table
+        inserts = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(f'INSERT INTO "{message_table}"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        for item in items:
+            stored = ChatMessage.objects.get(chat_id=item.message.chat_id, seq=item.message.seq)
+            self.assertEqual(item.message.pk, stored.pk)
+            self.assertEqual(item.message_data['id'], stored.pk)
+            self.assertEqual(stored.content, item.content)
+
+
+class MediaTestCase(TestCase):
+    """Временный MEDIA_ROOT для тестов хранилища файлов"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.root, CHUNKED_UPLOAD_DIR=os.path.join(self.root, 'uploads_tmp')
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.first = User.objects.create_user(email='first@example.com', username='first', password='x')
+        self.second = User.objects.create_user(email='second@example.com', username='second', password='x')
+        self.chat, _ = get_or_create_direct_chat(self.first.id, self.second.id)
+
+    def send_file(self, content=b'hello', name='note.txt'):
+        return ChatMessage.objects.create(
+            chat=self.chat, sender=self.first, message_type='file', file=ContentFile(content, name=name)
+        )
+
+
+class SignedMediaTestCase(MediaTestCase):
+    """Вложение сообщения и подписанная ссылка на него"""
+
+    def setUp(self):
+        super().setUp()
+        self.message = self.send_file()
+        self.url = chat_media_url(self.message.file, self.chat.id)
+        self.path = self.url.split('?')[0]
+
+    def get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+
+class MediaAccessTests(SignedMediaTestCase):
+    """Вложение чата отдается только по действующей подписанной ссылке"""
+
+    def test_signed_link(self):
+        response = self.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Cache-Control'].startswith('private'))
+        # В течение часа ссылка не меняется и берется из кэша браузера
+        self.assertEqual(chat_media_url(self.message.file, self.chat.id), self.url)
+
+    def test_unsigned_or_wrongly_signed_link(self):
+        self.assertEqual(self.get(self.path).status_code, 404)
+        self.assertEqual(self.get(f'{self.path}?c={self.chat.id}').status_code, 403)
+        self.assertEqual(self.get(self.url[:-1] + ('A' if self.url[-1] != 'A' else 'B')).status_code, 403)
+        outsider = User.objects.create_user(email='outsider@example.com', username='outsider', password='x')
+        other_chat, _ = get_or_create_direct_chat(self.first.id, outsider.id)
+        self.assertEqual(self.get(self.url.replace(f'c={self.chat.id}', f'c={other_chat.id}')).status_code, 403)
+
+    def test_expired_link(self):
+        later = time.time() + CHAT_MEDIA_URL_MAX_AGE + 3600
+        with mock.patch('django.core.signing.time.time', return_value=later):
+            response = self.get(self.url)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['message'], 'Срок действия ссылки истек')
+
+    def test_jwt_of_non_member(self):
+        outsider = User.objects.create_user(email='outsider@example.com', username='outsider', password='x')
+        response = self.get(self.url, HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(outsider)}')
+        self.assertEqual(response.status_code, 403)
+        response = self.get(self.url, HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.second)}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleted_message_closes_link(self):
+        self.message.delete()
+        self.assertEqual(self.get(self.url).status_code, 404)
+
+
+class ChunkedUploadTests(MediaTestCase):
+    """Загрузка частями: догрузка с верного смещения и проверка SHA-256"""
+
+    def setUp(self):
+        super().setUp()
+        upload_dir = os.path.join(self.root, 'uploads_tmp')
+        patcher = mock.patch('users.chunked_uploads.CHUNKED_UPLOAD_DIR', upload_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.first)}'}
+        self.content = b'hello world'
+        response = self.client.post(
+            '/api/auth/uploads/',
+            {'filename': 'note.txt', 'size': len(self.content), 'content_type': 'text/plain'},
+            content_type='application/json', **self.headers
+        )
+        self.assertEqual(response.status_code, 201)
+        self.upload_id = response.json()['upload']['id']
+        self.part = os.path.join(upload_dir, f'{self.upload_id}.part')
+
+    def put_chunk(self, offset, data):
+        return self.client.put(
+            f'/api/auth/uploads/{self.upload_id}/chunk/', data, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), **self.headers
+        )
+
+    def complete(self, sha256):
+        return self.client.post(
+            f'/api/auth/uploads/{self.upload_id}/complete/', {'sha256': sha256},
+            content_type='application/json', **self.headers
+        )
+
+    def test_offset_mismatch_returns_current_offset(self):
+        self.assertEqual(self.put_chunk(0, self.content[:5]).json()['upload']['offset'], 5)
+
+        # Клиент не знает, дошла ли часть, и повторяет ее
+        response = self.put_chunk(0, self.content[:5])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['upload']['offset'], 5)
+
+        self.assertEqual(self.put_chunk(5, self.content[5:]).status_code, 200)
+        response = self.complete(hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(response.status_code, 200)
+        upload = ChunkedUpload.objects.get(id=self.upload_id)
+        self.assertEqual(upload.status, 'complete')
+        blob = MediaBlob.objects.get(name=upload.stored_name)
+        self.assertEqual(blob.ref_count, 1)
+        with open(os.path.join(self.root, blob.name), 'rb') as file:
+            self.assertEqual(file.read(), self.content)
+
+    def test_wrong_sha256_deletes_upload(self):
+        self.put_chunk(0, self.content)
+        self.assertTrue(os.path.exists(self.part))
+
+        response = self.complete(hashlib.sha256(b'other').hexdigest())
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(ChunkedUpload.objects.filter(id=self.upload_id).exists())
+        self.assertFalse(os.path.exists(self.part))
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertEqual(self.put_chunk(0, self.content).status_code, 404)
+
+
+class MediaStoreTests(MediaTestCase):
+    """Файл с одинаковым содержимым хранится один раз и удаляется после срока без ссылок"""
+
+    def blob_path(self, blob):
+        return os.path.join(self.root, blob.name)
+
+    def test_duplicate_increments_ref_count(self):
+        first = self.send_file(name='a.txt')
+        second = self.send_file(name='b.txt')
+        self.assertEqual(first.file.name, second.file.name)
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(os.listdir(os.path.dirname(self.blob_path(blob))), [os.path.basename(blob.name)])
+
+        first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+
+    def test_release_and_purge_after_grace(self):
+        self.send_file().delete()
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.ref_count, 0)
+
+        # В течение срока файл без ссылок не удаляется
+        self.assertEqual(purge_unreferenced_blobs(grace_hours=24)[0], 0)
+        self.assertTrue(os.path.exists(self.blob_path(blob)))
+
+        MediaBlob.objects.filter(id=blob.id).update(updated_at=timezone.now() - timedelta(hours=25))
+        # Новая ссылка отодвигает удаление, ее освобождение снова начинает отсчет
+        acquire_blob(blob.name)
+        release_blob(blob.name)
+        self.assertEqual(purge_unreferenced_blobs(grace_hours=24)[0], 0)
+
+        MediaBlob.objects.filter(id=blob.id).update(updated_at=timezone.now() - timedelta(hours=25))
+        self.assertEqual(purge_unreferenced_blobs(grace_hours=24), (1, blob.size))
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertFalse(os.path.exists(self.blob_path(blob)))
+
+    def test_referenced_blob_is_kept(self):
+        self.send_file()
+        MediaBlob.objects.update(updated_at=timezone.now() - timedelta(hours=25))
+        self.assertEqual(purge_unreferenced_blobs(grace_hours=24)[0], 0)
+        self.assertTrue(MediaBlob.objects.exists())
+
+
+class ByteRangeTests(SimpleTestCase):
+    """Разбор заголовка Range при выдаче файла без nginx"""
+
+    def test_ranges(self):
+        self.assertEqual(parse_byte_range('bytes=2-5', 10), (2, 5))
+        self.assertEqual(parse_byte_range('bytes=2-', 10), (2, 9))
+        self.assertEqual(parse_byte_range('bytes=2-100', 10), (2, 9))
+        self.assertEqual(parse_byte_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(parse_byte_range('bytes=-30', 10), (0, 9))
+
+    def test_full_file(self):
+        for header in (None, '', 'bytes=0-1,4-5', 'bytes=-', 'items=0-1', 'bytes=5-2'):
+            self.assertIsNone(parse_byte_range(header, 10), header)
+
+    def test_not_satisfiable(self):
+        for header in ('bytes=10-', 'bytes=12-20', 'bytes=-0'):
+            with self.assertRaises(RangeNotSatisfiable, msg=header):
+                parse_byte_range(header, 10)
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_byte_range('bytes=-5', 0)
+
+
+class MediaRangeResponseTests(SignedMediaTestCase):
+    """Ответы 206 и 416 на запросы вложения с Range"""
+
+    def test_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/5')
+        self.assertEqual(b''.join(response.streaming_content), b'llo')
+
+    def test_range_past_end(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */5')
+
+    def test_multiple_ranges_return_full_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1,3-4')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'hello')
+
+
+class UserCardInvalidationTests(TestCase):
+    """Карточка в кэше меняется при сохранении ее полей и только тогда"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(email='card@example.com', username='card', password='x', first_name='Анна')
+
+    def card(self):
+        return get_card_data([self.user.id])[self.user.id]
+
+    def test_card_field_update_invalidates(self):
+        self.assertEqual(self.card()['first_name'], 'Анна')
+        with self.assertNumQueries(0):
+            self.card()
+
+        self.user.first_name = 'Мария'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['first_name'])
+        self.assertEqual(self.card()['first_name'], 'Мария')
+
+    def test_other_field_update_keeps_card(self):
+        self.card()
+        # Имя изменено в обход save(): карточку обновила бы только инвалидация
+        User.objects.filter(id=self.user.id).update(first_name='Мария')
+        self.user.last_seen = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['last_seen'])
+        self.assertEqual(self.card()['first_name'], 'Анна')
+
+        # save() без update_fields пишет все поля, в том числе карточки
+        self.user.first_name = 'Ольга'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.card()['first_name'], 'Ольга')
+
+
+class RoomFanoutTests(SimpleTestCase):
+    """События комнаты OptimizedChatConsumer доставляются через FanoutHub"""
+
+    async def connect(self, user_id):
+        communicator = WebsocketCommunicator(OptimizedChatConsumer.as_asgi(), '/ws/room/r1/')
+        communicator.scope['user'] = User(id=user_id, username=f'user{user_id}')
+        communicator.scope['url_route'] = {'kwargs': {'room_name': 'r1'}}
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'connection_established')
+        return communicator
+
+    async def test_room_message_serialized_once_per_process(self):
+        channel_layer = get_channel_layer()
+        with mock.patch('users.websocket_pool.get_presence_tracker', return_value=mock.AsyncMock()), \
+                mock.patch('core.ws_fanout.encode_message', wraps=encode_message) as encode:
+            first = await self.connect(1)
+            second = await self.connect(2)
+            # В группе комнаты один канал процесса, а не канал каждого соединения
+            self.assertEqual(len(channel_layer.groups['chat_r1']), 1)
+
+            await first.send_json_to({'type': 'chat_message', 'message': 'Привет', 'timestamp': 't'})
+            for communicator in (first, second):
+                frame = await communicator.receive_json_from()
+                self.assertEqual(frame, {
+                    'type': 'chat_message', 'message': 'Привет', 'user_id': 1, 'username': 'user1', 'timestamp': 't'
+                })
+            self.assertEqual(encode.call_count, 1)
+
+            await first.disconnect()
+            await second.disconnect()
+        self.assertNotIn('chat_r1', channel_layer.groups)
+        self.assertNotIn('chat_r1', connection_pool.relays)
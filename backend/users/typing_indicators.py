@@ -0,0 +1,127 @@
+"""
+Индикатор «печатает» с прореживанием на сервере.
+
+Клиенты присылают typing почти на каждое нажатие клавиши. Состояние хранится
+по паре (группа чата, пользователь): первое событие уходит в группу сразу,
+дальше — не чаще раза в TYPING_FORWARD_INTERVAL одним событием на всю группу
+со списком всех печатающих. Если от пользователя нет событий дольше
+TYPING_IDLE_TIMEOUT, сервер сам отправляет user_stop_typing.
+
+Клиент скрывает индикатор через 3 секунды без событий, поэтому интервал
+пересылки меньше этого срока и индикатор не мигает.
+Состояние локально для процесса: печатающие в одной группе, но подключенные
+к разным воркерам, приходят отдельными событиями.
+"""
+import asyncio
+import weakref
+
+from django.conf import settings
+
+TYPING_FORWARD_INTERVAL = getattr(settings, 'TYPING_FORWARD_INTERVAL', 2.0)
+TYPING_IDLE_TIMEOUT = getattr(settings, 'TYPING_IDLE_TIMEOUT', 3.0)
+
+
+class TypingRoom:
+    """Печатающие в одной группе: {user_id: (user_name, истекает)}"""
+
+    def __init__(self, group):
+        self.group = group
+        self.typists = {}
+        self.forwarded_at = 0
+        self.ticker = None
+
+
+class TypingCoordinator:
+    """Прореживание и объединение событий печати в группах текущего event loop"""
+
+    def __init__(self, channel_layer, forward_interval=TYPING_FORWARD_INTERVAL, idle_timeout=TYPING_IDLE_TIMEOUT):
+        self.channel_layer = channel_layer
+        self.forward_interval = forward_interval
+        self.idle_timeout = idle_timeout
+        self.rooms = {}
+
+    def build_typing_event(self, room):
+        """Событие «печатают» для ChatConsumer.user_typing"""
+        typists = [
+            {'user_id': user_id, 'user_name': user_name}
+            for user_id, (user_name, expires_at) in room.typists.items()
+        ]
+        return {
+            'type': 'user_typing',
+            'user_id': typists[0]['user_id'],
+            'user_name': typists[0]['user_name'],
+            'typists': typists,
+        }
+
+    def build_stop_event(self, user_id, user_name):
+        return {
+            'type': 'user_stop_typing',
+            'user_id': user_id,
+        }
+
+    async def typing(self, group, user_id, user_name):
+        """Клиент печатает: новый печатающий — событие сразу, иначе только продление"""
+        loop = asyncio.get_running_loop()
+        room = self.rooms.get(group)
+        if room is None:
+            room = self.rooms[group] = TypingRoom(group)
+
+        is_new = user_id not in room.typists
+        room.typists[user_id] = (user_name, loop.time() + self.idle_timeout)
+        if is_new:
+            await self.forward(room)
+        if room.ticker is None or room.ticker.done():
+            room.ticker = asyncio.ensure_future(self.tick(room))
+
+    async def stop(self, group, user_id):
+        """Клиент перестал печатать (или отправил сообщение, или отключился)"""
+        room = self.rooms.get(group)
+        if room is None or user_id not in room.typists:
+            return
+        user_name, expires_at = room.typists.pop(user_id)
+        await self.channel_layer.group_send(group, self.build_stop_event(user_id, user_name))
+        if not room.typists:
+            self.close_room(room)
+
+    async def forward(self, room):
+        room.forwarded_at = asyncio.get_running_loop().time()
+        await self.channel_layer.group_send(room.group, self.build_typing_event(room))
+
+    async def tick(self, room):
+        """Продление индикатора раз в интервал и автоматическая остановка по таймауту"""
+        loop = asyncio.get_running_loop()
+        while room.typists:
+            next_expiry = min(expires_at for user_name, expires_at in room.typists.values())
+            next_forward = room.forwarded_at + self.forward_interval
+            await asyncio.sleep(max(0, min(next_expiry, next_forward) - loop.time()))
+
+            now = loop.time()
+            expired = [
+                user_id for user_id, (user_name, expires_at) in room.typists.items()
+                if expires_at <= now
+            ]
+            for user_id in expired:
+                user_name, expires_at = room.typists.pop(user_id)
+                await self.channel_layer.group_send(room.group, self.build_stop_event(user_id, user_name))
+            if room.typists and now >= room.forwarded_at + self.forward_interval:
+                await self.forward(room)
+        self.close_room(room)
+
+    def close_room(self, room):
+        if self.rooms.get(room.group) is room:
+            del self.rooms[room.group]
+        if room.ticker is not None and room.ticker is not asyncio.current_task():
+            room.ticker.cancel()
+
+
+_coordinators = weakref.WeakKeyDictionary()
+
+
+def get_typing_coordinator(channel_layer, coordinator_class=TypingCoordinator):
+    """Общий координатор данного класса для всех соединений текущего event loop"""
+    loop = asyncio.get_running_loop()
+    coordinators = _coordinators.setdefault(loop, {})
+    coordinator = coordinators.get(coordinator_class)
+    if coordinator is None:
+        coordinator = coordinators[coordinator_class] = coordinator_class(channel_layer)
+    return coordinator
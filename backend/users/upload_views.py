@@ -0,0 +1,111 @@
+"""
+REST-представления загрузки файлов частями (/api/auth/uploads/...).
+Логика и формат протокола — в users.chunked_uploads.
+"""
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .chunked_uploads import (
+    UploadError,
+    abort_upload,
+    append_to_upload,
+    complete_upload,
+    create_upload,
+    get_upload,
+    serialize_upload,
+)
+
+
+def upload_error_response(error):
+    data = {
+        'success': False,
+        'message': error.message
+    }
+    if error.upload is not None:
+        # Клиент продолжает загрузку с актуального смещения
+        data['upload'] = serialize_upload(error.upload)
+    return Response(data, status=error.status)
+
+
+class UploadCreateView(APIView):
+    """Начало загрузки: имя, размер, MIME-тип и назначение файла"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            upload = create_upload(
+                request.user,
+                request.data.get('filename'),
+                request.data.get('size'),
+                request.data.get('content_type', ''),
+                request.data.get('purpose', 'chat_file'),
+            )
+        except UploadError as e:
+            return upload_error_response(e)
+        return Response({
+            'success': True,
+            'upload': serialize_upload(upload)
+        }, status=201)
+
+
+class UploadDetailView(APIView):
+    """Состояние загрузки (сколько байт уже на сервере) и отмена"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, upload_id):
+        try:
+            upload = get_upload(request.user, upload_id)
+        except UploadError as e:
+            return upload_error_response(e)
+        return Response({
+            'success': True,
+            'upload': serialize_upload(upload)
+        })
+
+    def delete(self, request, upload_id):
+        try:
+            abort_upload(request.user, upload_id)
+        except UploadError as e:
+            return upload_error_response(e)
+        return Response({'success': True})
+
+
+class UploadChunkView(APIView):
+    """
+    Очередная часть файла: сырое тело запроса (application/octet-stream),
+    заголовок Upload-Offset — номер первого байта части в файле.
+    Тело читается потоком, request.data не используется
+    """
+    permission_classes = [IsAuthenticated]
+
+    def put(self, request, upload_id):
+        try:
+            upload = append_to_upload(
+                request.user,
+                upload_id,
+                request.META.get('HTTP_UPLOAD_OFFSET'),
+                request.stream,
+                request.META.get('CONTENT_LENGTH'),
+            )
+        except UploadError as e:
+            return upload_error_response(e)
+        return Response({
+            'success': True,
+            'upload': serialize_upload(upload)
+        })
+
+
+class UploadCompleteView(APIView):
+    """Завершение загрузки; sha256 от клиента необязателен, но проверяется"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, upload_id):
+        try:
+            upload = complete_upload(request.user, upload_id, request.data.get('sha256'))
+        except UploadError as e:
+            return upload_error_response(e)
+        return Response({
+            'success': True,
+            'upload': serialize_upload(upload)
+        })
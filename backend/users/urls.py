@@ -29,20 +29,30 @@ from .views import (
     ArchivedPostsView,
     ReceivedPostsView,
     ChatListView,
+    ChatInboxView,
     ChatCreateView,
     ChatDetailView,
     MessageCreateView,
     MessageUpdateView,
     MessageDeleteView,
+    DeleteAdminMessagesView,
+    performance_stats
+)
+from .async_chat_views import (
     AsyncChatListView,
     AsyncChatCreateView,
     AsyncChatMessagesView,
     AsyncChatMessageCreateView,
     AsyncChatMessageUpdateView,
     AsyncChatMessageDeleteView,
-    DeleteAdminMessagesView,
-    performance_stats
 )
+from .upload_views import (
+    UploadCreateView,
+    UploadDetailView,
+    UploadChunkView,
+    UploadCompleteView,
+)
+from .media_views import protected_media
 
 app_name = 'users'
 
@@ -85,6 +95,7 @@ urlpatterns = [
 
     # Chat URLs
     path('chats/', ChatListView.as_view(), name='chat-list'),
+    path('chats/inbox/', ChatInboxView.as_view(), name='chat-inbox'),
     path('chats/create/', ChatCreateView.as_view(), name='chat-create'),
     path('chats/<int:chat_id>/', ChatDetailView.as_view(), name='chat-detail'),
     path('chats/<int:chat_id>/messages/', MessageCreateView.as_view(), name='message-create'),
@@ -99,6 +110,15 @@ urlpatterns = [
     path('async/messages/<int:message_id>/update/', AsyncChatMessageUpdateView.as_view(), name='async-message-update'),
     path('async/messages/<int:message_id>/delete/', AsyncChatMessageDeleteView.as_view(), name='async-message-delete'),
     
+    # Загрузка файлов частями
+    path('uploads/', UploadCreateView.as_view(), name='upload-create'),
+    path('uploads/<uuid:upload_id>/', UploadDetailView.as_view(), name='upload-detail'),
+    path('uploads/<uuid:upload_id>/chunk/', UploadChunkView.as_view(), name='upload-chunk'),
+    path('uploads/<uuid:upload_id>/complete/', UploadCompleteView.as_view(), name='upload-complete'),
+    
+    # Файлы хранилища с проверкой доступа (байты отдает nginx)
+    path('media/<path:name>', protected_media, name='protected-media'),
+    
     # Delete admin messages
     path('delete-admin-messages/', DeleteAdminMessagesView.as_view(), name='delete-admin-messages'),
     
@@ -0,0 +1,213 @@
+"""
+Компактные карточки пользователей для вложения в ответы API и WebSocket.
+
+Карточка (id, имена, город, статус и URL аватара во всех размерах) кэшируется
+отдельно для каждого пользователя под версией, как списки уведомлений
+(users.notification_cache): сохранение профиля меняет версию, и старая
+карточка становится недостижимой. get_cards(ids) собирает карточки пачкой:
+два get_many к кэшу и один запрос к БД за недостающими. Поэтому
+сериализаторам постов, сообщений и уведомлений не нужен join с User —
+хватает id автора, а карточки всего списка загружаются заранее
+(CardListSerializer, prefetch_cards).
+
+В кэше лежат пути без хоста; абсолютный URL строится для конкретного запроса.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import User
+
+# Размер аватара по умолчанию для карточек в списках, чатах и уведомлениях
+CARD_AVATAR_SIZE = 's96'
+CARD_AVATAR_SIZES = ('s96', 's192')
+
+USER_CARD_CACHE_TIMEOUT = getattr(settings, 'USER_CARD_CACHE_TIMEOUT', 3600)
+
+# Поля User, от которых зависит карточка: сохранение других полей
+# (last_login, last_seen) ее не инвалидирует
+CARD_FIELDS = frozenset(('username', 'first_name', 'last_name', 'city', 'status', 'avatar', 'avatar_variants'))
+CARD_ONLY_FIELDS = ('id', 'username', 'first_name', 'last_name', 'city', 'status', 'avatar', 'avatar_variants')
+
+
+def absolute_url(url, request=None):
+    if request:
+        return request.build_absolute_uri(url)
+    return f"{settings.SITE_URL}{url}"
+
+
+def absolute_media_url(file, request=None):
+    """Абсолютный URL медиафайла (или None, если файла нет)"""
+    if not file:
+        return None
+    return absolute_url(file.url, request)
+
+
+def variant_url(file, variants, size, request=None):
+    """
+    URL превью размера size (core.image_variants.VARIANT_SPECS), а пока
+    превью не построены или картинка меньше размера — URL оригинала
+    """
+    if not file:
+        return None
+    name = (variants or {}).get(size)
+    if name:
+        return absolute_url(file.storage.url(name), request)
+    return absolute_media_url(file, request)
+
+
+def avatar_url(user, size=CARD_AVATAR_SIZE, request=None):
+    """Аватар пользователя в размере для контекста (s96 в списках, s192 в ленте)"""
+    return variant_url(user.avatar, user.avatar_variants, size, request)
+
+
+def user_card_data(user):
+    """Кэшируемая карточка: поля профиля и пути аватара {размер: путь}"""
+    avatars = {}
+    if user.avatar:
+        storage = user.avatar.storage
+        variants = user.avatar_variants or {}
+        avatars['original'] = user.avatar.url
+        for size in CARD_AVATAR_SIZES:
+            avatars[size] = storage.url(variants[size]) if size in variants else avatars['original']
+    return {
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'city': user.city,
+        'status': user.status,
+        'avatars': avatars,
+    }
+
+
+def render_card(data, size=CARD_AVATAR_SIZE, request=None):
+    """Карточка для ответа: аватар нужного размера абсолютным URL"""
+    path = data['avatars'].get(size) or data['avatars'].get('original')
+    return {
+        'id': data['id'],
+        'username': data['username'],
+        'first_name': data['first_name'],
+        'last_name': data['last_name'],
+        'avatar': absolute_url(path, request) if path else None,
+        'city': data['city'],
+        'status': data['status'],
+    }
+
+
+def build_user_card(user, request=None, size=CARD_AVATAR_SIZE):
+    """
+    Минимальный набор полей пользователя, которого достаточно
+    для аватарки и подписи в списках, чатах и уведомлениях
+    """
+    if user is None:
+        return None
+    return render_card(user_card_data(user), size, request)
+
+
+def _version_key(user_id):
+    return f"user_card_version_{user_id}"
+
+
+def _card_key(user_id, version):
+    return f"user_card_{user_id}_{version}"
+
+
+def _card_versions(user_ids):
+    """
+    Версии карточек {id: версия}. Отсутствующая версия (первое обращение или
+    вытеснение) инициализируется текущим временем в миллисекундах, чтобы не
+    совпасть со старой и не поднять устаревшую карточку
+    """
+    keys = {_version_key(user_id): user_id for user_id in user_ids}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, now, None)
+        for key, version in cache.get_many(missing).items():
+            versions[keys[key]] = version
+    return versions
+
+
+def get_card_data(user_ids):
+    """Кэшируемые карточки {id: данные} пачкой; несуществующие id пропускаются"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+    versions = _card_versions(user_ids)
+    keys = {_card_key(user_id, versions.get(user_id)): user_id for user_id in user_ids}
+    cards = {keys[key]: data for key, data in cache.get_many(keys).items()}
+    missing = user_ids - cards.keys()
+    if missing:
+        fresh = {}
+        for user in User.objects.filter(id__in=missing).only(*CARD_ONLY_FIELDS):
+            cards[user.id] = fresh[_card_key(user.id, versions.get(user.id))] = user_card_data(user)
+        cache.set_many(fresh, USER_CARD_CACHE_TIMEOUT)
+    return cards
+
+
+def get_cards(user_ids, request=None, size=CARD_AVATAR_SIZE):
+    """Карточки пользователей {id: карточка} для ответа"""
+    return {
+        user_id: render_card(data, size, request)
+        for user_id, data in get_card_data(user_ids).items()
+    }
+
+
+def invalidate_cards(user_ids):
+    """Меняет версии карточек: закэшированные становятся недостижимыми и истекают"""
+    for user_id in user_ids:
+        key = _version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), None)
+
+
+def invalidate_cards_on_commit(user_ids):
+    """
+    Инвалидация после фиксации транзакции, чтобы конкурентный запрос
+    не закэшировал под новой версией еще не зафиксированный профиль
+    """
+    user_ids = list(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: invalidate_cards(user_ids))
+
+
+def prefetch_cards(context, user_ids):
+    """Догружает карточки в context['user_cards'] одной пачкой"""
+    loaded = context.setdefault('user_cards', {})
+    missing = {user_id for user_id in user_ids if user_id is not None} - loaded.keys()
+    if missing:
+        loaded.update(get_card_data(missing))
+    return loaded
+
+
+def context_card(context, user_id, size=CARD_AVATAR_SIZE):
+    """Карточка для сериализатора: из context['user_cards'], иначе из кэша"""
+    if user_id is None:
+        return None
+    data = prefetch_cards(context, [user_id]).get(user_id)
+    if data is None:
+        return None
+    return render_card(data, size, context.get('request'))
+
+
+class CardListSerializer(serializers.ListSerializer):
+    """
+    Список, который перед сериализацией загружает карточки всех
+    пользователей из полей Meta.card_user_fields дочернего сериализатора
+    (например, ('author_id',)) одной пачкой
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        fields = self.child.Meta.card_user_fields
+        prefetch_cards(self.context, {getattr(item, field) for item in items for field in fields})
+        return super().to_representation(items)
@@ -1,5 +1,3 @@
-import asyncio
-
 import time
 import hashlib
 from asgiref.sync import sync_to_async
@@ -24,18 +22,43 @@ from datetime import timedelta
 from concurrent.futures import ThreadPoolExecutor
 from django.db import transaction, models
 from .cache_utils import cache_user_data, get_cached_user, clear_user_cache, update_user_cache, get_cache_stats
+from .notification_cache import (
+    NOTIFICATIONS_PAGE_SIZE,
+    NOTIFICATIONS_MAX_PAGE_SIZE,
+    get_cached_notifications_page,
+    set_cached_notifications_page,
+    bump_notifications_version_on_commit
+)
+from .pagination_utils import get_cursor_paginated_data
+from .chat_history import (
+    CHAT_HISTORY_PAGE_SIZE,
+    clamp_history_page_size,
+    get_chat_history,
+    get_history_pagination,
+    parse_message_id,
+)
+from .chat_inbox import (
+    clamp_inbox_page_size,
+    get_inbox_page,
+    serialize_inbox_entry,
+    refresh_last_message,
+    get_read_cursors
+)
+from .chat_receipts import mark_chat_read_and_notify
+from .chunked_uploads import UploadError, message_type_for, take_completed_upload
+from .presence import get_presence_map
+from .user_cards import get_cards
 from .models import Follow, Notification, PostArchive, SharedPost
 from .serializers import ChildSerializer
 from .models import Child
 from posts.models import Post
 from .serializers import ChatSerializer, ChatCreateSerializer, ChatMessageSerializer, ChatMessageCreateSerializer
-from .models import Chat, ChatMessage, User
+from .models import Chat, ChatMessage
 from .performance_monitor import PerformanceMonitor, profile_function
 from rest_framework.views import APIView
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.utils import timezone
 import json
 import logging
 
@@ -452,15 +475,22 @@ class UserDetailView(generics.RetrieveUpdateAPIView):
             data = request.data.copy()
             if request.FILES:
                 data.update(request.FILES)
+            # Аватар, загруженный частями (uploads/), приходит как avatar_upload_id
+            avatar_upload_id = data.pop('avatar_upload_id', None)
+            if isinstance(avatar_upload_id, list):
+                avatar_upload_id = avatar_upload_id[0]
             
             serializer = self.get_serializer(user, data=data, partial=True, context={'request': request})
             serializer.is_valid(raise_exception=True)
             
             
             # Обновляем пользователя
-            for attr, value in serializer.validated_data.items():
-                setattr(user, attr, value)
-            user.save()
+            with transaction.atomic():
+                for attr, value in serializer.validated_data.items():
+                    setattr(user, attr, value)
+                if avatar_upload_id:
+                    user.avatar, content_type = take_completed_upload(user, avatar_upload_id, 'avatar')
+                user.save()
             
             # Обновляем все кэши
             cache_keys = [
@@ -712,39 +742,45 @@ class NotificationsListView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        # Кэшируем уведомления пользователя
-        cache_key = f"notifications_{self.request.user.id}"
-        cached_notifications = cache.get(cache_key)
-        
-        if cached_notifications is not None:
-            return cached_notifications
-        
-        # Оптимизированный запрос с select_related
-        notifications = Notification.objects.filter(recipient=self.request.user).select_related(
-            'sender', 'post'
-        ).order_by('-created_at')[:50]  # Ограничиваем количество для производительности
-        
-        # Кэшируем на 2 минуты
-        cache.set(cache_key, notifications, 120)
-        
-        return notifications
+        # Карточки отправителей — из кэша (NotificationSerializer), join только с постом
+        return Notification.objects.filter(recipient=self.request.user).select_related(
+            'post__category'
+        )
     
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True, context={'request': request})
+        cursor = request.query_params.get('cursor')
+        try:
+            page_size = int(request.query_params.get('page_size', NOTIFICATIONS_PAGE_SIZE))
+        except (TypeError, ValueError):
+            page_size = NOTIFICATIONS_PAGE_SIZE
+        page_size = max(1, min(page_size, NOTIFICATIONS_MAX_PAGE_SIZE))
         
-        # Кэшируем количество непрочитанных уведомлений
-        unread_cache_key = f"unread_count_{request.user.id}"
-        unread_count = cache.get(unread_cache_key)
+        # Страницы кэшируются в сериализованном виде под версией пользователя,
+        # версия повышается при каждом создании или изменении уведомления
+        cache_key, page = get_cached_notifications_page(request.user.id, cursor, page_size)
         
-        if unread_count is None:
+        if page is None:
+            paginated = get_cursor_paginated_data(
+                self.get_queryset(),
+                cursor=cursor,
+                page_size=page_size,
+                ordering_field='id',
+                descending=True
+            )
+            serializer = self.get_serializer(paginated['results'], many=True, context={'request': request})
             unread_count = Notification.objects.filter(recipient=request.user, is_read=False).count()
-            cache.set(unread_cache_key, unread_count, 60)  # Кэшируем на 1 минуту
+            
+            page = {
+                'notifications': serializer.data,
+                'unread_count': unread_count,
+                'has_next': paginated['has_next'],
+                'next_cursor': paginated['next_cursor'],
+            }
+            set_cached_notifications_page(cache_key, page)
         
         return Response({
             'success': True,
-            'notifications': serializer.data,
-            'unread_count': unread_count
+            **page
         })
 
 
@@ -760,7 +796,7 @@ class MarkNotificationAsReadView(generics.CreateAPIView):
             
             notification = Notification.objects.get(id=notification_id, recipient=request.user)
             notification.is_read = True
-            notification.save()
+            notification.save(update_fields=['is_read'])
             
             return Response({'success': True, 'message': 'Уведомление отмечено как прочитанное'})
         except Notification.DoesNotExist:
@@ -776,6 +812,7 @@ class MarkAllNotificationsAsReadView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         try:
             Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+            bump_notifications_version_on_commit(request.user.id)
             return Response({'success': True, 'message': 'Все уведомления отмечены как прочитанные'})
         except Exception as e:
             return Response({'success': False, 'message': str(e)}, status=400)
@@ -973,21 +1010,13 @@ class FriendsListView(generics.ListAPIView):
         try:
             current_user = request.user
             
-            # Получаем всех пользователей, на которых подписан текущий пользователь
-            following = Follow.objects.filter(follower=current_user).select_related('following')
-            
-            friends_data = []
-            for follow in following:
-                friend = follow.following
-                friends_data.append({
-                    'id': friend.id,
-                    'first_name': friend.first_name,
-                    'last_name': friend.last_name,
-                    'username': friend.username,
-                    'avatar': request.build_absolute_uri(friend.avatar.url) if friend.avatar else None,
-                    'city': friend.city,
-                    'status': friend.status
-                })
+            # Пользователи, на которых подписан текущий: id из Follow, карточки из кэша
+            friend_ids = list(
+                Follow.objects.filter(follower=current_user)
+                .order_by('id').values_list('following_id', flat=True)
+            )
+            cards = get_cards(friend_ids, request)
+            friends_data = [cards[friend_id] for friend_id in friend_ids if friend_id in cards]
             
             return Response({
                 'success': True,
@@ -1160,10 +1189,10 @@ class ArchivedPostsView(generics.ListAPIView):
         try:
             
             # Получаем все посты в архиве пользователя
-            archived_posts = PostArchive.objects.filter(
+            archived_posts = list(PostArchive.objects.filter(
                 user=request.user
-            ).select_related('post', 'post__author', 'post__category').order_by('-created_at')
-            
+            ).select_related('post', 'post__category').order_by('-created_at'))
+            cards = get_cards((entry.post.author_id for entry in archived_posts), request)
             
             posts_data = []
             for archive_entry in archived_posts:
@@ -1177,14 +1206,7 @@ class ArchivedPostsView(generics.ListAPIView):
                     'status': post.status,
                     'created_at': post.created_at,
                     'published_at': post.published_at,
-                    'author': {
-                        'id': post.author.id,
-                        'first_name': post.author.first_name,
-                        'last_name': post.author.last_name,
-                        'username': post.author.username,
-                        'avatar': request.build_absolute_uri(post.author.avatar.url) if post.author.avatar else None,
-                        'city': post.author.city
-                    },
+                    'author': cards.get(post.author_id),
                     'category': {
                         'id': post.category.id,
                         'name': post.category.name,
@@ -1215,9 +1237,14 @@ class ReceivedPostsView(generics.ListAPIView):
     def list(self, request, *args, **kwargs):
         try:
             # Получаем все посты, отправленные пользователю
-            received_posts = SharedPost.objects.filter(
+            received_posts = list(SharedPost.objects.filter(
                 recipient=request.user
-            ).select_related('sender', 'post', 'post__author', 'post__category').order_by('-created_at')
+            ).select_related('post', 'post__category').order_by('-created_at'))
+            cards = get_cards((
+                user_id
+                for shared_post in received_posts
+                for user_id in (shared_post.sender_id, shared_post.post.author_id)
+            ), request)
             
             posts_data = []
             for shared_post in received_posts:
@@ -1231,22 +1258,8 @@ class ReceivedPostsView(generics.ListAPIView):
                     'status': post.status,
                     'created_at': post.created_at,
                     'published_at': post.published_at,
-                    'sender': {
-                        'id': shared_post.sender.id,
-                        'first_name': shared_post.sender.first_name,
-                        'last_name': shared_post.sender.last_name,
-                        'username': shared_post.sender.username,
-                        'avatar': request.build_absolute_uri(shared_post.sender.avatar.url) if shared_post.sender.avatar else None,
-                        'city': shared_post.sender.city
-                    },
-                    'author': {
-                        'id': post.author.id,
-                        'first_name': post.author.first_name,
-                        'last_name': post.author.last_name,
-                        'username': post.author.username,
-                        'avatar': request.build_absolute_uri(post.author.avatar.url) if post.author.avatar else None,
-                        'city': post.author.city
-                    },
+                    'sender': cards.get(shared_post.sender_id),
+                    'author': cards.get(post.author_id),
                     'category': {
                         'id': post.category.id,
                         'name': post.category.name,
@@ -1295,6 +1308,31 @@ class ChatListView(APIView):
                 'message': str(e)
             }, status=400)
 
+class ChatInboxView(APIView):
+    """Список чатов из денормализованного inbox: один запрос на страницу"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            cursor = request.GET.get('cursor')
+            page_size = clamp_inbox_page_size(request.GET.get('page_size'))
+            
+            page = get_inbox_page(request.user, cursor, page_size)
+            # Статусы всех собеседников страницы одним обращением к кэшу
+            presence = get_presence_map(member.other_user for member in page['results'])
+            
+            return Response({
+                'success': True,
+                'chats': [serialize_inbox_entry(member, request, presence) for member in page['results']],
+                'has_next': page['has_next'],
+                'next_cursor': page['next_cursor']
+            })
+        except Exception as e:
+            return Response({
+                'success': False,
+                'message': str(e)
+            }, status=400)
+
 class ChatCreateView(APIView):
     """Создание нового чата или получение существующего"""
     permission_classes = [IsAuthenticated]
@@ -1332,43 +1370,31 @@ class ChatDetailView(APIView):
                 'message': 'Чат не найден'
             }, status=404)
         
-        # Получаем сообщения с пагинацией
-        page = int(request.GET.get('page', 1))
-        page_size = int(request.GET.get('page_size', 50))
-        
-        # Оптимизированный запрос с select_related для уменьшения количества запросов к БД
-        messages = chat.messages.select_related('sender', 'reply_to', 'reply_to__sender').order_by('created_at')
-        total_messages = messages.count()
-        print(f"Загружаем сообщения для чата {chat_id}: найдено {total_messages} сообщений")
+        # Keyset-пагинация: последние сообщения, before_id — более старые, after_id — новые
+        page_size = clamp_history_page_size(request.GET.get('page_size'), CHAT_HISTORY_PAGE_SIZE)
+        history = get_chat_history(
+            chat,
+            before_id=parse_message_id(request.GET.get('before_id')),
+            after_id=parse_message_id(request.GET.get('after_id')),
+            limit=page_size
+        )
         
-        # Получаем последние сообщения (для отображения снизу)
-        skip_count = max(0, total_messages - page_size)
-        messages_page = messages[skip_count:]
+        # Прочтение — сдвиг одного курсора, собеседник получает отчет по WebSocket
+        mark_chat_read_and_notify(chat, request.user.id)
         
         message_serializer = ChatMessageSerializer(
-            messages_page, 
+            history['messages'], 
             many=True, 
-            context={'request': request}
+            context={'request': request, 'read_cursors': get_read_cursors(chat.id)}
         )
         
-        # Помечаем сообщения как прочитанные
-        chat.messages.filter(
-            sender__in=chat.participants.exclude(id=request.user.id),
-            is_read=False
-        ).update(is_read=True)
-        
         chat_serializer = ChatSerializer(chat, context={'request': request})
         
         return Response({
             'success': True,
             'chat': chat_serializer.data,
             'messages': message_serializer.data,
-            'pagination': {
-                'page': page,
-                'page_size': page_size,
-                'total': messages.count(),
-                'has_next': end < messages.count()
-            }
+            'pagination': get_history_pagination(history, page_size)
         })
 
 class MessageCreateView(APIView):
@@ -1388,18 +1414,16 @@ class MessageCreateView(APIView):
         message_type = 'text'
         if request.FILES.get('file'):
             file = request.FILES['file']
-            if file.content_type.startswith('image/'):
-                message_type = 'image'
-            elif file.content_type.startswith('audio/'):
-                message_type = 'voice'
-            else:
-                message_type = 'file'
+            message_type = message_type_for(file.content_type)
+        
+        # Файл, загруженный частями (uploads/), приходит как upload_id
+        upload_id = request.data.get('upload_id')
         
         # Создаем сообщение
         message_data = {
             'content': request.data.get('content', ''),
             'message_type': message_type,
-            'file': request.FILES.get('file'),
+            'file': None if upload_id else request.FILES.get('file'),
             'reply_to': request.data.get('reply_to')
         }
         
@@ -1409,7 +1433,18 @@ class MessageCreateView(APIView):
         )
         
         if serializer.is_valid():
-            message = serializer.save()
+            try:
+                with transaction.atomic():
+                    if upload_id:
+                        stored_name, content_type = take_completed_upload(request.user, upload_id, 'chat_file')
+                        message = serializer.save(file=stored_name, message_type=message_type_for(content_type))
+                    else:
+                        message = serializer.save()
+            except UploadError as e:
+                return Response({
+                    'success': False,
+                    'message': e.message
+                }, status=e.status)
             print(f"Сообщение сохранено в БД: ID={message.id}, Content='{message.content}', Chat={message.chat.id}, Sender={message.sender.id}")
             message_serializer = ChatMessageSerializer(message, context={'request': request})
             
@@ -1477,321 +1512,6 @@ class MessageDeleteView(APIView):
         })
 
 
-# Асинхронные представления для чата
-@sync_to_async
-def async_get_or_create_chat(user1, user2):
-    """Получить или создать чат между двумя пользователями"""
-    # Ищем существующий чат между этими пользователями
-    existing_chat = Chat.objects.filter(
-        participants=user1,
-        is_active=True
-    ).filter(
-        participants=user2
-    ).first()
-    
-    if existing_chat:
-        return existing_chat, False
-    
-    # Создаем новый чат
-    chat = Chat.objects.create(is_active=True, created_at=timezone.now(), updated_at=timezone.now())
-    chat.participants.add(user1, user2)
-    return chat, True
-
-@sync_to_async
-def async_get_chat_messages(chat, page=1, page_size=20):
-    """Получить сообщения чата с пагинацией"""
-    # Оптимизированный запрос с select_related
-    messages = ChatMessage.objects.filter(chat=chat).select_related(
-        'sender', 'reply_to', 'reply_to__sender'
-    ).order_by('created_at')
-    
-    # Получаем общее количество сообщений
-    total_messages = messages.count()
-    
-    # Вычисляем, сколько сообщений пропустить с начала
-    skip_count = max(0, total_messages - page_size)
-    
-    # Получаем последние сообщения, отсортированные по времени
-    messages_page = messages[skip_count:]
-    return list(messages_page)
-
-@sync_to_async
-def async_create_chat_message(chat, sender, content, message_type='text', file=None, reply_to=None):
-    """Создать сообщение в чате"""
-    message = ChatMessage.objects.create(
-        chat=chat,
-        sender=sender,
-        content=content,
-        message_type=message_type,
-        file=file,
-        reply_to=reply_to
-    )
-    # Обновляем время последнего обновления чата
-    chat.updated_at = timezone.now()
-    chat.save()
-    return message
-
-@sync_to_async
-def async_update_chat_message(message_id, user, content):
-    """Обновить сообщение в чате"""
-    try:
-        message = ChatMessage.objects.get(id=message_id, sender=user)
-        message.content = content
-        message.is_edited = True
-        message.updated_at = timezone.now()
-        message.save()
-        return message
-    except ChatMessage.DoesNotExist:
-        return None
-
-@sync_to_async
-def async_delete_chat_message(message_id, user):
-    """Удалить сообщение в чате"""
-    try:
-        message = ChatMessage.objects.get(id=message_id, sender=user)
-        message.delete()
-        return True
-    except ChatMessage.DoesNotExist:
-        return False
-
-@sync_to_async
-def async_mark_messages_as_read(chat, user):
-    """Отметить сообщения как прочитанные"""
-    ChatMessage.objects.filter(
-        chat=chat,
-        sender__in=chat.participants.exclude(id=user.id),
-        is_read=False
-    ).update(is_read=True)
-
-@sync_to_async
-def async_get_user_chats(user):
-    """Получить все чаты пользователя"""
-    chats = Chat.objects.filter(
-        participants=user,
-        is_active=True
-    ).prefetch_related(
-        'participants', 
-        'messages__sender'
-    ).order_by('-updated_at')
-    return list(chats)
-
-@sync_to_async
-def async_serialize_chats(chats, request):
-    """Сериализовать чаты"""
-    serializer = ChatSerializer(chats, many=True, context={'request': request})
-    return serializer.data
-
-@sync_to_async
-def async_serialize_messages(messages, request):
-    """Сериализовать сообщения"""
-    serializer = ChatMessageSerializer(messages, many=True, context={'request': request})
-    return serializer.data
-
-
-class AsyncChatListView(APIView):
-    """Асинхронное представление для получения списка чатов"""
-    permission_classes = [IsAuthenticated]
-    
-    def get(self, request):
-        try:
-            # Используем asyncio.run для запуска асинхронных операций
-            chats = asyncio.run(async_get_user_chats(request.user))
-            serializer_data = asyncio.run(async_serialize_chats(chats, request))
-            
-            return Response({
-                'success': True,
-                'chats': serializer_data
-            })
-        except Exception as e:
-            return Response({
-                'success': False,
-                'message': str(e)
-            }, status=500)
-
-class AsyncChatCreateView(APIView):
-    """Асинхронное представление для создания чата"""
-    permission_classes = [IsAuthenticated]
-    
-    def post(self, request, user_id):
-        try:
-            # Используем asyncio.run для запуска асинхронных операций
-            other_user = asyncio.run(sync_to_async(User.objects.get)(id=user_id))
-            chat, created = asyncio.run(async_get_or_create_chat(request.user, other_user))
-            
-            serializer_data = asyncio.run(async_serialize_chats([chat], request))
-            
-            return Response({
-                'success': True,
-                'chat': serializer_data[0] if serializer_data else None,
-                'created': created
-            })
-        except User.DoesNotExist:
-            return Response({
-                'success': False,
-                'message': 'Пользователь не найден'
-            }, status=404)
-        except Exception as e:
-            return Response({
-                'success': False,
-                'message': str(e)
-            }, status=500)
-
-
-class AsyncChatMessagesView(APIView):
-    """Асинхронное представление для получения сообщений чата"""
-    permission_classes = [IsAuthenticated]
-    
-    def get(self, request, user_id):
-        try:
-            # Используем asyncio.run для запуска асинхронных операций
-            other_user = asyncio.run(sync_to_async(User.objects.get)(id=user_id))
-            chat, created = asyncio.run(async_get_or_create_chat(request.user, other_user))
-            
-            # Получаем сообщения
-            page = int(request.GET.get('page', 1))
-            page_size = int(request.GET.get('page_size', 20))
-            messages = asyncio.run(async_get_chat_messages(chat, page, page_size))
-            
-            # Отмечаем сообщения как прочитанные
-            asyncio.run(async_mark_messages_as_read(chat, request.user))
-            
-            serializer_data = asyncio.run(async_serialize_messages(messages, request))
-            
-            return Response({
-                'success': True,
-                'messages': serializer_data,
-                'chat_id': chat.id,
-                'created': created
-            })
-        except User.DoesNotExist:
-            return Response({
-                'success': False,
-                'message': 'Пользователь не найден'
-            }, status=404)
-        except Exception as e:
-            return Response({
-                'success': False,
-                'message': str(e)
-            }, status=500)
-
-
-class AsyncChatMessageCreateView(APIView):
-    """Асинхронное представление для создания сообщения"""
-    permission_classes = [IsAuthenticated]
-    
-    def post(self, request, user_id):
-        try:
-            # Используем asyncio.run для запуска асинхронных операций
-            other_user = asyncio.run(sync_to_async(User.objects.get)(id=user_id))
-            chat, created = asyncio.run(async_get_or_create_chat(request.user, other_user))
-            
-            # Создаем сообщение
-            content = request.data.get('content', '')
-            message_type = request.data.get('message_type', 'text')
-            reply_to_id = request.data.get('reply_to')
-            
-            reply_to = None
-            if reply_to_id:
-                reply_to = asyncio.run(sync_to_async(ChatMessage.objects.get)(id=reply_to_id, chat=chat))
-            
-            # Обработка файла
-            file = request.FILES.get('file')
-            if file and message_type in ['image', 'file']:
-                message = asyncio.run(async_create_chat_message(
-                    chat=chat,
-                    sender=request.user,
-                    content=content,
-                    message_type=message_type,
-                    file=file,
-                    reply_to=reply_to
-                ))
-            else:
-                message = asyncio.run(async_create_chat_message(
-                    chat=chat,
-                    sender=request.user,
-                    content=content,
-                    message_type=message_type,
-                    reply_to=reply_to
-                ))
-            
-            serializer_data = asyncio.run(async_serialize_messages([message], request))
-            
-            return Response({
-                'success': True,
-                'message': serializer_data[0] if serializer_data else None,
-                'chat_id': chat.id
-            })
-        except User.DoesNotExist:
-            return Response({
-                'success': False,
-                'message': 'Пользователь не найден'
-            }, status=404)
-        except Exception as e:
-            return Response({
-                'success': False,
-                'message': str(e)
-            }, status=500)
-
-
-class AsyncChatMessageUpdateView(APIView):
-    """Асинхронное представление для редактирования сообщения"""
-    permission_classes = [IsAuthenticated]
-    
-    def put(self, request, message_id):
-        try:
-            content = request.data.get('content', '')
-            if not content:
-                return Response({
-                    'success': False,
-                    'message': 'Содержимое сообщения не может быть пустым'
-                }, status=400)
-            
-            message = asyncio.run(async_update_chat_message(message_id, request.user, content))
-            
-            if not message:
-                return Response({
-                    'success': False,
-                    'message': 'Сообщение не найдено или у вас нет прав на его редактирование'
-                }, status=404)
-            
-            serializer_data = asyncio.run(async_serialize_messages([message], request))
-            
-            return Response({
-                'success': True,
-                'message': serializer_data[0] if serializer_data else None
-            })
-        except Exception as e:
-            return Response({
-                'success': False,
-                'message': str(e)
-            }, status=500)
-
-
-class AsyncChatMessageDeleteView(APIView):
-    """Асинхронное представление для удаления сообщения"""
-    permission_classes = [IsAuthenticated]
-    
-    def delete(self, request, message_id):
-        try:
-            success = asyncio.run(async_delete_chat_message(message_id, request.user))
-            
-            if not success:
-                return Response({
-                    'success': False,
-                    'message': 'Сообщение не найдено или у вас нет прав на его удаление'
-                }, status=404)
-            
-            return Response({
-                'success': True,
-                'message': 'Сообщение удалено'
-            })
-        except Exception as e:
-            return Response({
-                'success': False,
-                'message': str(e)
-            }, status=500)
-
-
 class DeleteAdminMessagesView(APIView):
     """Удаление всех сообщений с пользователем admin"""
     permission_classes = [IsAuthenticated]
@@ -1830,6 +1550,9 @@ class DeleteAdminMessagesView(APIView):
                 if chat.participants.count() == 2:
                     chat.delete()
                     deleted_chats_count += 1
+                else:
+                    refresh_last_message(chat.id)
+                    chat.members.update(unread_count=0)
             
             return Response({
                 'success': True,
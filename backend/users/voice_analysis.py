@@ -0,0 +1,57 @@
+"""
+Анализ голосовых сообщений (core.audio_peaks) в пуле процессов.
+
+Новый аудиофайл хранилища после коммита ставится в очередь пула
+(users.media_pool): длительность и огибающая из PEAK_COUNT столбцов
+сохраняются в MediaBlob (duration, waveform) и попадают в file_meta
+сообщения — клиент рисует голосовое сообщение, не скачивая файл.
+Файлы, не попавшие в очередь, обрабатывает manage.py analyze_voice_messages.
+waveform = [] — файл не декодировался, повторно он не анализируется.
+"""
+import os
+
+from django.conf import settings
+
+from core.audio_peaks import analyze_audio
+from .media_pool import map_media_jobs, submit_media_job
+from .models import MediaBlob
+
+
+def needs_analysis(content_type):
+    return content_type.startswith('audio/')
+
+
+def _analysis_args(name):
+    return (os.path.join(settings.MEDIA_ROOT, name),)
+
+
+def save_analysis(blob_id, result):
+    if result is None:
+        MediaBlob.objects.filter(id=blob_id).update(waveform=[])
+        return
+    MediaBlob.objects.filter(id=blob_id).update(
+        duration=result['duration'],
+        waveform=result['peaks'],
+    )
+
+
+def schedule_analysis(blob_id, name):
+    """Ставит анализ в очередь пула. False — очередь заполнена, файл подберет команда"""
+    return submit_media_job(
+        analyze_audio,
+        _analysis_args(name),
+        lambda result: save_analysis(blob_id, result),
+    )
+
+
+def pending_audio_blobs():
+    return MediaBlob.objects.filter(waveform__isnull=True, content_type__startswith='audio/').order_by('id')
+
+
+def analyze_pending_audio(limit=None):
+    """Анализирует аудиофайлы без огибающей через тот же пул. Возвращает число файлов"""
+    blobs = list(pending_audio_blobs().values_list('id', 'name')[:limit])
+    results = map_media_jobs(analyze_audio, [_analysis_args(name) for _, name in blobs])
+    for (blob_id, _), result in zip(blobs, results):
+        save_analysis(blob_id, result)
+    return len(blobs)
@@ -1,112 +1,185 @@
 """
-Пул WebSocket соединений для оптимизации производительности
+Пул WebSocket соединений для оптимизации производительности.
+
+Комнатные события (сообщения, печать) идут в группу channel layer комнаты,
+но в группе состоит не канал каждого соединения, а один канал процесса
+(RoomRelay). Событие приходит в процесс один раз, сериализуется один раз
+и раскладывается по очередям соединений FanoutHub, где медленные клиенты
+не задерживают остальных. Канал layer несет только связь между процессами.
 """
 import asyncio
 import json
-from typing import Dict, Set, Any
+from typing import Dict, Any
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.core.cache import cache
+from django.conf import settings
+
+from core.ws_fanout import FanoutHub, OutboundConnection
+from .channel_groups import refresh_groups_forever
+from .presence import get_presence_tracker
+from .typing_indicators import TypingCoordinator, get_typing_coordinator
+
+# Очередь исходящих кадров соединения, предельное время отправки кадра (сек),
+# политика для медленных клиентов и лимит соединений пользователя
+WS_SEND_QUEUE_SIZE = getattr(settings, 'WS_SEND_QUEUE_SIZE', 256)
+WS_SEND_TIMEOUT = getattr(settings, 'WS_SEND_TIMEOUT', 5.0)
+WS_SLOW_CONSUMER_POLICY = getattr(settings, 'WS_SLOW_CONSUMER_POLICY', 'disconnect')
+WS_MAX_CONNECTIONS_PER_USER = getattr(settings, 'WS_MAX_CONNECTIONS_PER_USER', 5)
+
+
+class RoomRelay:
+    """
+    Подписка процесса на группу комнаты: события группы читаются одним
+    каналом и рассылаются локальным соединениям комнаты через FanoutHub
+    """
+
+    def __init__(self, hub, channel_layer, room_name):
+        self.hub = hub
+        self.channel_layer = channel_layer
+        self.room_name = room_name
+        self.channel_name = None
+        self.tasks = []
+        self.stopped = False
+
+    async def start(self):
+        self.channel_name = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(self.room_name, self.channel_name)
+        if self.stopped:
+            # Комната опустела, пока канал подписывался
+            await self.channel_layer.group_discard(self.room_name, self.channel_name)
+            return
+        self.tasks = [
+            asyncio.ensure_future(self.relay()),
+            asyncio.ensure_future(
+                refresh_groups_forever(self.channel_layer, self.channel_name, lambda: [self.room_name])
+            ),
+        ]
+
+    async def relay(self):
+        """Событие группы — готовый кадр для клиентов комнаты"""
+        while True:
+            event = await self.channel_layer.receive(self.channel_name)
+            self.hub.broadcast(self.room_name, event)
+
+    async def stop(self):
+        self.stopped = True
+        for task in self.tasks:
+            task.cancel()
+        if self.tasks:
+            await self.channel_layer.group_discard(self.room_name, self.channel_name)
 
 
 class WebSocketConnectionPool:
-    """Пул для управления WebSocket соединениями"""
+    """
+    Пул для управления WebSocket соединениями.
+    Рассылка идет через core.ws_fanout: одна сериализация на сообщение,
+    очередь и задача-писатель на соединение, медленные клиенты отключаются
+    """
     
     def __init__(self):
-        self.connections: Dict[str, Set[AsyncWebsocketConsumer]] = {}
-        self.user_connections: Dict[int, Set[AsyncWebsocketConsumer]] = {}
-        self.lock = asyncio.Lock()
+        self.hub = FanoutHub(
+            max_queue=WS_SEND_QUEUE_SIZE,
+            send_timeout=WS_SEND_TIMEOUT,
+            slow_consumer_policy=WS_SLOW_CONSUMER_POLICY,
+            max_connections_per_user=WS_MAX_CONNECTIONS_PER_USER
+        )
+        self.outbound: Dict[AsyncWebsocketConsumer, OutboundConnection] = {}
+        self.relays: Dict[str, RoomRelay] = {}
     
     async def add_connection(self, consumer: AsyncWebsocketConsumer, user_id: int, room_name: str = None):
-        """Добавить соединение в пул"""
-        async with self.lock:
-            # Добавляем в общий пул
-            if room_name not in self.connections:
-                self.connections[room_name] = set()
-            self.connections[room_name].add(consumer)
-            
-            # Добавляем в пул пользователя
-            if user_id not in self.user_connections:
-                self.user_connections[user_id] = set()
-            self.user_connections[user_id].add(consumer)
+        """Добавить соединение в пул (и в комнату: события ее группы придут через RoomRelay)"""
+        connection = self.hub.register(
+            user_id,
+            send=lambda text: consumer.send(text_data=text),
+            close=lambda code: consumer.close(code=code)
+        )
+        self.outbound[consumer] = connection
+        if room_name:
+            self.hub.join(room_name, connection)
+            if room_name not in self.relays:
+                relay = self.relays[room_name] = RoomRelay(self.hub, consumer.channel_layer, room_name)
+                await relay.start()
     
     async def remove_connection(self, consumer: AsyncWebsocketConsumer, user_id: int, room_name: str = None):
-        """Удалить соединение из пула"""
-        async with self.lock:
-            # Удаляем из общего пула
-            if room_name and room_name in self.connections:
-                self.connections[room_name].discard(consumer)
-                if not self.connections[room_name]:
-                    del self.connections[room_name]
-            
-            # Удаляем из пула пользователя
-            if user_id in self.user_connections:
-                self.user_connections[user_id].discard(consumer)
-                if not self.user_connections[user_id]:
-                    del self.user_connections[user_id]
+        """Удалить соединение из пула; последнее соединение комнаты снимает ее подписку"""
+        connection = self.outbound.pop(consumer, None)
+        if connection is None:
+            return
+        rooms = list(connection.rooms)
+        self.hub.unregister(connection)
+        for room in rooms:
+            if not self.hub.connection_count(room) and room in self.relays:
+                await self.relays.pop(room).stop()
     
     async def send_to_room(self, room_name: str, message: Dict[str, Any]):
-        """Отправить сообщение всем в комнате"""
-        if room_name in self.connections:
-            disconnected = set()
-            for consumer in self.connections[room_name]:
-                try:
-                    await consumer.send(text_data=json.dumps(message))
-                except Exception:
-                    disconnected.add(consumer)
-            
-            # Удаляем отключенные соединения
-            for consumer in disconnected:
-                self.connections[room_name].discard(consumer)
+        """Отправить сообщение соединениям комнаты в этом процессе (не ждет доставки)"""
+        return self.hub.broadcast(room_name, message)
     
     async def send_to_user(self, user_id: int, message: Dict[str, Any]):
         """Отправить сообщение конкретному пользователю"""
-        if user_id in self.user_connections:
-            disconnected = set()
-            for consumer in self.user_connections[user_id]:
-                try:
-                    await consumer.send(text_data=json.dumps(message))
-                except Exception:
-                    disconnected.add(consumer)
-            
-            # Удаляем отключенные соединения
-            for consumer in disconnected:
-                self.user_connections[user_id].discard(consumer)
+        return self.hub.send_to_user(user_id, message)
     
     async def get_connection_count(self, room_name: str = None) -> int:
         """Получить количество активных соединений"""
-        if room_name:
-            return len(self.connections.get(room_name, set()))
-        return sum(len(connections) for connections in self.connections.values())
+        return self.hub.connection_count(room_name)
     
     async def get_user_connection_count(self, user_id: int) -> int:
         """Получить количество соединений пользователя"""
-        return len(self.user_connections.get(user_id, set()))
+        return self.hub.user_connection_count(user_id)
 
 
 # Глобальный пул соединений
 connection_pool = WebSocketConnectionPool()
 
 
+class RoomTypingCoordinator(TypingCoordinator):
+    """Прореживание печати в формате событий OptimizedChatConsumer"""
+
+    def build_typing_event(self, room):
+        typists = [
+            {'user_id': user_id, 'username': user_name}
+            for user_id, (user_name, expires_at) in room.typists.items()
+        ]
+        return {
+            'type': 'typing',
+            'user_id': typists[0]['user_id'],
+            'username': typists[0]['username'],
+            'is_typing': True,
+            'typists': typists,
+        }
+
+    def build_stop_event(self, user_id, user_name):
+        return {
+            'type': 'typing',
+            'user_id': user_id,
+            'username': user_name,
+            'is_typing': False,
+            'typists': [],
+        }
+
+
 class OptimizedChatConsumer(AsyncWebsocketConsumer):
-    """Оптимизированный потребитель WebSocket для чата"""
+    """
+    Оптимизированный потребитель WebSocket для чата. События комнаты
+    отправляются в ее группу уже в виде кадров клиента и доставляются
+    через connection_pool, поэтому обработчиков событий группы у
+    потребителя нет
+    """
     
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.room_group_name = f'chat_{self.room_name}'
         self.user = self.scope['user']
         
-        # Добавляем соединение в пул
+        # Добавляем соединение в пул и комнату
         await connection_pool.add_connection(
             self, 
             self.user.id, 
             self.room_group_name
         )
         
-        # Присоединяемся к группе
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        self.presence = get_presence_tracker(self.channel_layer)
+        await self.presence.connect(self.user.id)
+        self.typing_indicators = get_typing_coordinator(self.channel_layer, RoomTypingCoordinator)
         
         await self.accept()
         
@@ -126,11 +199,8 @@ class OptimizedChatConsumer(AsyncWebsocketConsumer):
             self.room_group_name
         )
         
-        # Покидаем группу
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        await self.presence.disconnect(self.user.id)
+        await self.typing_indicators.stop(self.room_group_name, self.user.id)
     
     async def receive(self, text_data):
         try:
@@ -142,6 +212,7 @@ class OptimizedChatConsumer(AsyncWebsocketConsumer):
             elif message_type == 'typing':
                 await self.handle_typing(data)
             elif message_type == 'ping':
+                self.presence.touch(self.user.id)
                 await self.send(text_data=json.dumps({'type': 'pong'}))
                 
         except json.JSONDecodeError:
@@ -160,7 +231,7 @@ class OptimizedChatConsumer(AsyncWebsocketConsumer):
         message = data.get('message', '')
         
         if message.strip():
-            # Отправляем сообщение в группу
+            # Кадр клиента уходит в группу: каждый процесс получит его один раз
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
@@ -173,34 +244,8 @@ class OptimizedChatConsumer(AsyncWebsocketConsumer):
             )
     
     async def handle_typing(self, data):
-        """Обработка индикатора печати"""
-        is_typing = data.get('is_typing', False)
-        
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'typing',
-                'user_id': self.user.id,
-                'username': self.user.username,
-                'is_typing': is_typing
-            }
-        )
-    
-    async def chat_message(self, event):
-        """Получить сообщение чата"""
-        await self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'message': event['message'],
-            'user_id': event['user_id'],
-            'username': event['username'],
-            'timestamp': event.get('timestamp')
-        }))
-    
-    async def typing(self, event):
-        """Получить индикатор печати"""
-        await self.send(text_data=json.dumps({
-            'type': 'typing',
-            'user_id': event['user_id'],
-            'username': event['username'],
-            'is_typing': event['is_typing']
-        }))
+        """Обработка индикатора печати (прореживается RoomTypingCoordinator)"""
+        if data.get('is_typing', False):
+            await self.typing_indicators.typing(self.room_group_name, self.user.id, self.user.username)
+        else:
+            await self.typing_indicators.stop(self.room_group_name, self.user.id)
@@ -1,53 +1,91 @@
 from fastapi import WebSocket
-from typing import Dict, List, Set
-import json
+from typing import Dict, Set
+import os
+
+from core.ws_fanout import FanoutHub, OutboundConnection
+
+# Очередь исходящих сообщений соединения, время на отправку кадра (сек),
+# политика для медленных клиентов и лимит соединений пользователя
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "disconnect")
+WS_MAX_CONNECTIONS_PER_USER = int(os.getenv("WS_MAX_CONNECTIONS_PER_USER", "5"))
+
 
 class ConnectionManager:
     def __init__(self):
-        # Активные соединения: {user_id: websocket}
-        self.active_connections: Dict[int, WebSocket] = {}
+        # Рассылка: одна сериализация на сообщение, у каждого соединения своя очередь
+        self.hub = FanoutHub(
+            max_queue=WS_SEND_QUEUE_SIZE,
+            send_timeout=WS_SEND_TIMEOUT,
+            slow_consumer_policy=WS_SLOW_CONSUMER_POLICY,
+            max_connections_per_user=WS_MAX_CONNECTIONS_PER_USER
+        )
+        # Активные соединения: {websocket: очередь соединения}
+        self.active_connections: Dict[WebSocket, OutboundConnection] = {}
+        # Соединения пользователя (вкладки, устройства): {user_id: {websocket, ...}}
+        self.user_sockets: Dict[int, Set[WebSocket]] = {}
         # Пользователи в чатах: {chat_id: {user_id1, user_id2}}
         self.chat_users: Dict[int, Set[int]] = {}
+        # Обратный индекс: {user_id: {chat_id, ...}}, чтобы отключение
+        # затрагивало только чаты этого пользователя, а не все чаты
+        self.user_chats: Dict[int, Set[int]] = {}
 
     async def connect(self, websocket: WebSocket, user_id: int):
         """Подключение пользователя"""
         await websocket.accept()
-        self.active_connections[user_id] = websocket
+        self.active_connections[websocket] = self.hub.register(
+            user_id,
+            send=websocket.send_text,
+            close=lambda code: websocket.close(code=code)
+        )
+        self.user_sockets.setdefault(user_id, set()).add(websocket)
+
+    def disconnect(self, user_id: int, websocket: WebSocket = None):
+        """Отключение соединения (или всех соединений пользователя)"""
+        sockets = self.user_sockets.get(user_id, set())
+        for socket in (list(sockets) if websocket is None else [websocket]):
+            sockets.discard(socket)
+            connection = self.active_connections.pop(socket, None)
+            if connection is not None:
+                self.hub.unregister(connection)
+        if not sockets:
+            self.user_sockets.pop(user_id, None)
 
-    def disconnect(self, user_id: int):
-        """Отключение пользователя"""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-        
-        # Удаляем пользователя из всех чатов
-        for chat_id in self.chat_users:
-            self.chat_users[chat_id].discard(user_id)
+        # Удаляем пользователя из его чатов, когда у него не осталось соединений
+        if not self.hub.user_connection_count(user_id):
+            for chat_id in self.user_chats.pop(user_id, ()):
+                self._discard_member(chat_id, user_id)
+
+    def _discard_member(self, chat_id: int, user_id: int):
+        members = self.chat_users.get(chat_id)
+        if members is not None:
+            members.discard(user_id)
+            if not members:
+                del self.chat_users[chat_id]
 
     async def join_chat(self, user_id: int, chat_id: int):
         """Присоединение пользователя к чату"""
-        if chat_id not in self.chat_users:
-            self.chat_users[chat_id] = set()
-        self.chat_users[chat_id].add(user_id)
+        self.chat_users.setdefault(chat_id, set()).add(user_id)
+        self.user_chats.setdefault(user_id, set()).add(chat_id)
 
     async def leave_chat(self, user_id: int, chat_id: int):
         """Покидание пользователем чата"""
-        if chat_id in self.chat_users:
-            self.chat_users[chat_id].discard(user_id)
+        self._discard_member(chat_id, user_id)
+        chats = self.user_chats.get(user_id)
+        if chats is not None:
+            chats.discard(chat_id)
+            if not chats:
+                del self.user_chats[user_id]
 
     async def send_message_to_user(self, user_id: int, message: dict):
-        """Отправка сообщения конкретному пользователю"""
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_text(json.dumps(message))
-            except:
-                # Если соединение разорвано, удаляем его
-                self.disconnect(user_id)
+        """Отправка сообщения конкретному пользователю (без ожидания доставки)"""
+        self.hub.send_to_user(user_id, message)
 
     async def send_message_to_chat(self, chat_id: int, message: dict):
-        """Отправка сообщения всем пользователям в чате"""
+        """Отправка сообщения всем пользователям в чате одной сериализацией"""
         if chat_id in self.chat_users:
-            for user_id in self.chat_users[chat_id]:
-                await self.send_message_to_user(user_id, message)
+            self.hub.send_to_users(self.chat_users[chat_id], message)
 
     async def send_typing_indicator(self, chat_id: int, user_id: int, is_typing: bool):
         """Отправка индикатора набора текста"""
@@ -57,10 +95,3 @@ class ConnectionManager:
             "is_typing": is_typing
         }
         await self.send_message_to_chat(chat_id, message)
-
-
-
-
-
-
-